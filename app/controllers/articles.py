@@ -1,99 +1,567 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
 from typing import Type
 
 from fastapi import HTTPException, UploadFile
 from fastapi import status
-from sqlalchemy.orm import Session, Query
+from sqlalchemy import or_, select, delete, inspect, text, literal_column, Select, Text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session, Query, selectinload, with_expression
+from sqlalchemy.orm.attributes import set_committed_value
+from starlette.concurrency import run_in_threadpool
 
-from app.core.storage import LocalStorage
-from app.models.articles import Article
+from app.controllers.changes import (
+    record_article_changes,
+    publish_article_changes,
+    get_compaction_horizon,
+    change_event,
+)
+from app.controllers.stats import update_article_stats
+from app.controllers.uploads import take_completed_upload
+from app.core import settings
+from app.core.enums import Role, ChangeOperation
+from app.core.events import Event
+from app.core.group_commit import GroupCommitter
+from app.core.jobs import enqueue
+from app.core.sharding import (
+    ShardSessions,
+    shard_sessions,
+    merge_ordered,
+    next_article_ids,
+)
+from app.core.storage import get_storage
+from app.models.articles import Article, ArticleBody, ArticleChange
 from app.models.users import User, Student, teacher_student, Teacher
 from app.schemas.articles import ArticleCreateSchema
 
 
+def attach_authors(articles: list[Article], db_session: Session) -> list[Article]:
+    """
+    Loads the authors of the articles from the main database, which is where users
+    live when articles are sharded.
+    """
+    author_ids = {article.author_id for article in articles}
+    if author_ids:
+        query = db_session.query(User).filter(User.id.in_(author_ids))
+        authors = {
+            author.id: author
+            for author in query.options(
+                selectinload(User.admin),
+                selectinload(User.teacher),
+                selectinload(User.student).selectinload(Student.teachers),
+            )
+        }
+        for article in articles:
+            set_committed_value(article, "author", authors.get(article.author_id))
+    return articles
+
+
+# Set on startup while articles of an existing database still lack their bodies
+legacy_content = False
+
+
+def prepare_legacy_content(connection: Connection) -> None:
+    """
+    Lets a database whose contents are still in the legacy ``articles.content``
+    column serve requests until ``migrate_article_bodies`` moved them. New articles
+    leave the column empty, and articles without a body are read from it.
+    """
+    global legacy_content
+    columns = inspect(connection).get_columns(Article.__tablename__)
+    column = next((column for column in columns if column["name"] == "content"), None)
+    if column is None:
+        legacy_content = False
+        return
+    if not column["nullable"]:
+        connection.execute(
+            text("ALTER TABLE articles ALTER COLUMN content DROP NOT NULL")
+        )
+    unmigrated = connection.execute(
+        select(Article.id).where(~Article.body.has()).limit(1)
+    ).first()
+    legacy_content = unmigrated is not None
+
+
+def with_bodies(query: Query, include_content: bool = True) -> Query:
+    if not include_content:
+        return query
+    query = query.options(selectinload(Article.body))
+    if legacy_content:
+        query = query.options(
+            with_expression(
+                Article.legacy_content, literal_column("articles.content", Text)
+            )
+        )
+    return query
+
+
+def student_user_ids(teacher_id: int) -> Select:
+    return (
+        select(Student.user_id)
+        .join(teacher_student, Student.id == teacher_student.c.student_id)
+        .join(Teacher, teacher_student.c.teacher_id == Teacher.id)
+        .where(Teacher.user_id == teacher_id)
+    )
+
+
+def visible_to(query: Query, user: User, author_id=Article.author_id) -> Query:
+    if user.role == Role.student:
+        return query.filter(author_id == user.id)
+    if user.role == Role.teacher:
+        return query.filter(
+            or_(author_id == user.id, author_id.in_(student_user_ids(user.id)))
+        )
+    return query
+
+
+def visible_author_ids(user: User, db_session: Session) -> list[int] | None:
+    """
+    Returns the authors whose articles the user may see, or None for all authors.
+    """
+    if user.role == Role.student:
+        return [user.id]
+    if user.role == Role.teacher:
+        return [user.id, *db_session.scalars(student_user_ids(user.id))]
+    return None
+
+
+def author_queries(
+    shards: ShardSessions, author_ids: list[int] | None = None
+) -> list[Query]:
+    """
+    Returns an articles query for every shard holding articles of the given
+    authors, or for every shard if the authors are not restricted.
+    """
+    if author_ids is None:
+        return [session.query(Article) for session in shards.covering()]
+    return [
+        session.query(Article).filter(Article.author_id.in_(ids))
+        for session, ids in shards.group_by_shard(author_ids)
+    ]
+
+
+def gather_articles(
+    queries: list[Query], limit: int | None = None, offset: int = 0
+) -> list[Article]:
+    """
+    Runs the per-shard queries and merges their results in creation order. Each
+    shard returns at most ``offset + limit`` articles, as any of them may make it
+    into the requested page.
+    """
+    window = offset + limit if limit is not None else None
+    results = [
+        query.order_by(Article.created_at, Article.id).limit(window).all()
+        for query in queries
+    ]
+    return merge_ordered(
+        results, lambda article: (article.created_at, article.id), offset, limit
+    )
+
+
+def first_article(queries: list[Query]) -> Article | None:
+    for query in queries:
+        article = query.first()
+        if article is not None:
+            return article
+    return None
+
+
+def created_within(
+    query: Query,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+) -> Query:
+    # A constant range on the partition key lets Postgres skip whole partitions
+    if created_after is not None:
+        query = query.filter(Article.created_at >= created_after)
+    if created_before is not None:
+        query = query.filter(Article.created_at < created_before)
+    return query
+
+
 def get_article_by_id(article_id: int, db_session: Session) -> "Article":
-    return db_session.query(Article).filter(Article.id == article_id).first()
+    queries = author_queries(shard_sessions(db_session))
+    return first_article(
+        [with_bodies(query.filter(Article.id == article_id)) for query in queries]
+    )
+
+
+def delete_articles(
+    criteria: list, db_session: Session, author_ids: list[int] | None = None
+) -> list[int]:
+    """
+    Deletes the articles matching the criteria from the shards of the given
+    authors, or from all shards if the authors are not known.
+    """
+    shards = shard_sessions(db_session)
+    deleted = []
+    for shard_session in shards.covering(author_ids):
+        rows = shard_session.execute(
+            delete(Article)
+            .where(*criteria)
+            .returning(
+                Article.id, Article.cover_image, Article.author_id, Article.created_at
+            )
+        ).all()
+        if rows:
+            shard_session.execute(
+                delete(ArticleBody).where(
+                    ArticleBody.article_id.in_([row.id for row in rows])
+                )
+            )
+        deleted.extend(rows)
+    cover_images = [row.cover_image for row in deleted if row.cover_image]
+    if cover_images:
+        enqueue(db_session, "sweep_cover_images", paths=cover_images)
+    update_article_stats(
+        db_session, [(row.author_id, row.created_at) for row in deleted], -1
+    )
+    events = record_article_changes(
+        db_session,
+        ChangeOperation.delete,
+        [(row.id, row.author_id) for row in deleted],
+    )
+    shards.commit()
+    publish_article_changes(db_session, events)
+    return [row.id for row in deleted]
 
 
 def delete_article_by_id(article_id: int, db_session: Session) -> int:
-    article = get_article_by_id(article_id, db_session)
-    if article is None:
+    if not delete_articles([Article.id == article_id], db_session):
         raise HTTPException(status_code=404, detail="Article not found")
-    db_session.delete(article)
-    db_session.commit()
     return article_id
 
 
+def bulk_delete_articles(
+    db_session: Session,
+    article_ids: list[int] | None = None,
+    author_id: int | None = None,
+) -> list[int]:
+    criteria = []
+    if article_ids is not None:
+        criteria.append(Article.id.in_(article_ids))
+    if author_id is not None:
+        criteria.append(Article.author_id == author_id)
+    if not criteria:
+        raise ValueError("Either article_ids or author_id must be provided")
+    author_ids = [author_id] if author_id is not None else None
+    return delete_articles(criteria, db_session, author_ids)
+
+
+@dataclass
+class NewArticle:
+    article: Article
+    author: User
+    upload_id: str | None = None
+
+
+def insert_articles(
+    new_articles: list[NewArticle], db_session: Session
+) -> list[Article]:
+    """
+    Writes new articles with their side effects and commits them. Articles of a
+    shard are flushed together, which Postgres runs as one multi-row
+    ``INSERT ... RETURNING``.
+
+    :return: The committed articles with their bodies and authors loaded
+    """
+    shards = shard_sessions(db_session)
+    articles = [new_article.article for new_article in new_articles]
+    if shards.router.sharded:
+        # Autoincrement ids of different shards would collide
+        new_ids = next_article_ids(db_session, len(articles))
+    else:
+        # A failed group commit leaves the ids of its flush behind, they may
+        # belong to other articles by the time the article is written again
+        new_ids = [None] * len(articles)
+    for new_article, new_id in zip(new_articles, new_ids):
+        if new_article.upload_id is not None:
+            new_article.article.cover_image = take_completed_upload(
+                new_article.upload_id, new_article.author, db_session
+            )
+        new_article.article.id = new_id
+    groups = shards.group_by_shard(article.author_id for article in articles)
+    for article_session, author_ids in groups:
+        author_ids = set(author_ids)
+        article_session.add_all(
+            [article for article in articles if article.author_id in author_ids]
+        )
+        article_session.flush()
+    update_article_stats(
+        db_session, [(article.author_id, article.created_at) for article in articles], 1
+    )
+    article_ids = [article.id for article in articles]
+    events = record_article_changes(
+        db_session,
+        ChangeOperation.create,
+        [(article.id, article.author_id) for article in articles],
+    )
+    shards.commit()
+    for article_session, _ in groups:
+        # Loads the articles expired by the commit again, bodies included
+        article_session.scalars(
+            with_bodies(select(Article)).where(Article.id.in_(article_ids))
+        ).all()
+    attach_authors(articles, db_session)
+    publish_article_changes(db_session, events)
+    return articles
+
+
+# Writes the articles of concurrent requests together when ARTICLE_GROUP_COMMIT is set
+article_writer = GroupCommitter(insert_articles)
+
+
 async def create_article(
     data: ArticleCreateSchema,
     user: User,
     cover_image: UploadFile | None,
     db_session: Session,
+    upload_id: str | None = None,
 ) -> Article:
-    article = Article(**data.dict(), author_id=user.id)
+    article = Article(**data.dict(), author_id=user.id, created_at=datetime.now())
+
+    if upload_id is not None and cover_image and cover_image.size > 0:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Provide either a cover image or an upload",
+        )
 
     if cover_image and cover_image.size > 0:
-        storage = LocalStorage()
-        article.cover_image = storage.upload(cover_image)
+        article.cover_image = await run_in_threadpool(get_storage().upload, cover_image)
         if cover_image.content_type not in ("image/png", "image/jpeg"):
             raise HTTPException(
                 status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                 detail="Invalid image format",
             )
 
-    db_session.add(article)
-    db_session.commit()
-    db_session.refresh(article)
+    new_article = NewArticle(article, user, upload_id)
+    if settings.ARTICLE_GROUP_COMMIT:
+        return await article_writer.submit(new_article, db_session.get_bind())
+    (article,) = insert_articles([new_article], db_session)
     return article
 
 
-def get_all_articles(db_session: Session) -> list[Type[Article]]:
-    return db_session.query(Article).all()
+def get_all_articles(
+    db_session: Session,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+    include_content: bool = True,
+    limit: int | None = None,
+    offset: int = 0,
+) -> list[Type[Article]]:
+    queries = [
+        created_within(
+            with_bodies(query, include_content), created_after, created_before
+        )
+        for query in author_queries(shard_sessions(db_session))
+    ]
+    return attach_authors(gather_articles(queries, limit, offset), db_session)
 
 
 def get_articles_by_author_id(
-    author_id: int, db_session: Session
+    author_id: int,
+    db_session: Session,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+    include_content: bool = True,
+    limit: int | None = None,
+    offset: int = 0,
 ) -> list[Type[Article]]:
-    return db_session.query(Article).filter(Article.author_id == author_id).all()
+    queries = [
+        created_within(
+            with_bodies(query, include_content), created_after, created_before
+        )
+        for query in author_queries(shard_sessions(db_session), [author_id])
+    ]
+    return attach_authors(gather_articles(queries, limit, offset), db_session)
 
 
-def get_student_articles_query(teacher_id: int, db_session: Session) -> Query:
-    return (
-        db_session.query(Article)
-        .join(Student, Article.author_id == Student.user_id)
-        .join(teacher_student, Student.id == teacher_student.c.student_id)
-        .join(Teacher, teacher_student.c.teacher_id == Teacher.id)
-        .filter(Teacher.user_id == teacher_id)
-    )
+def get_student_articles_queries(teacher_id: int, db_session: Session) -> list[Query]:
+    student_ids = db_session.scalars(student_user_ids(teacher_id)).all()
+    return author_queries(shard_sessions(db_session), student_ids)
 
 
-def get_students_articles(teacher_id: int, db_session: Session) -> list[Type[Article]]:
-    query = get_student_articles_query(teacher_id, db_session)
-    return query.all()
+def get_students_articles(
+    teacher_id: int,
+    db_session: Session,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+    include_content: bool = True,
+    limit: int | None = None,
+    offset: int = 0,
+) -> list[Type[Article]]:
+    queries = [
+        created_within(
+            with_bodies(query, include_content), created_after, created_before
+        )
+        for query in get_student_articles_queries(teacher_id, db_session)
+    ]
+    return attach_authors(gather_articles(queries, limit, offset), db_session)
 
 
 def get_student_article_by_id(
     teacher_id: int, article_id: int, db_session: Session
 ) -> Type[Article]:
-    query = get_student_articles_query(teacher_id, db_session)
-    return query.filter(Article.id == article_id).first()
+    queries = get_student_articles_queries(teacher_id, db_session)
+    article = first_article(
+        [with_bodies(query.filter(Article.id == article_id)) for query in queries]
+    )
+    return attach_authors([article], db_session)[0] if article else None
 
 
 def get_own_article_by_id(
     article_id: int, user: User, db_session: Session
 ) -> "Article":
-    return (
-        db_session.query(Article)
+    query = (
+        shard_sessions(db_session)
+        .for_author(user.id)
+        .query(Article)
         .filter(Article.id == article_id, Article.author_id == user.id)
-        .first()
     )
+    article = with_bodies(query).first()
+    return attach_authors([article], db_session)[0] if article else None
 
 
 def delete_own_article_by_id(article_id: int, user: User, db_session: Session) -> int:
-    article = get_own_article_by_id(article_id, user, db_session)
-    if article is None:
+    criteria = [Article.id == article_id, Article.author_id == user.id]
+    if not delete_articles(criteria, db_session, [user.id]):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Article not found"
         )
-    db_session.delete(article)
-    db_session.commit()
     return article_id
+
+
+def get_visible_articles_by_ids(
+    article_ids: list[int], user: User, db_session: Session
+) -> list[Type[Article]]:
+    queries = author_queries(
+        shard_sessions(db_session), visible_author_ids(user, db_session)
+    )
+    articles = [
+        article
+        for query in queries
+        for article in with_bodies(query.filter(Article.id.in_(article_ids)))
+    ]
+    return attach_authors(articles, db_session)
+
+
+def check_change_cursor(since: int, db_session: Session) -> None:
+    if since < get_compaction_horizon(db_session):
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Cursor is too old, fetch the full list again",
+        )
+
+
+def get_article_changes(
+    since: int, limit: int, user: User, db_session: Session
+) -> tuple[list[Type[ArticleChange]], dict[int, Article]]:
+    """
+    Returns the changes visible to the user after the ``since`` cursor, together
+    with the articles that still exist for the returned creations.
+    """
+    check_change_cursor(since, db_session)
+    settled = datetime.now() - timedelta(seconds=settings.CHANGES_SETTLE_SECONDS)
+    query = db_session.query(ArticleChange).filter(
+        ArticleChange.id > since, ArticleChange.created_at <= settled
+    )
+    changes = (
+        visible_to(query, user, ArticleChange.author_id)
+        .order_by(ArticleChange.id)
+        .limit(limit)
+        .all()
+    )
+    created = {
+        change.article_id: change.author_id
+        for change in changes
+        if change.operation == ChangeOperation.create
+    }
+    articles = {}
+    if created:
+        queries = author_queries(shard_sessions(db_session), set(created.values()))
+        found = [
+            article
+            for query in queries
+            for article in with_bodies(query.filter(Article.id.in_(created)))
+        ]
+        articles = {
+            article.id: article for article in attach_authors(found, db_session)
+        }
+    return changes, articles
+
+
+def get_student_article_events(
+    teacher_id: int,
+    since: int,
+    db_session: Session,
+    limit: int = settings.EVENTS_MAX_REPLAY,
+) -> list[Event]:
+    """
+    Returns the changes of the teacher's students' articles after the ``since``
+    cursor, used to replay the events a reconnecting subscriber missed. Subscribers
+    that missed more than ``limit`` events have to page through the change log.
+    """
+    check_change_cursor(since, db_session)
+    changes = (
+        db_session.query(ArticleChange)
+        .filter(
+            ArticleChange.id > since,
+            ArticleChange.author_id.in_(student_user_ids(teacher_id)),
+        )
+        .order_by(ArticleChange.id)
+        .limit(limit + 1)
+        .all()
+    )
+    if len(changes) > limit:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Too many missed events, fetch the changes instead",
+        )
+    return [change_event(change) for change in changes]
+
+
+def migrate_article_bodies(
+    db_session: Session, batch_size: int = 1000, drop_column: bool = False
+) -> int:
+    """
+    Moves article contents from the legacy ``articles.content`` column to the
+    article bodies table in batches. Running workers read the column until they
+    are restarted, so it is only dropped when asked for.
+
+    :return: The number of moved article bodies
+    """
+    connection = db_session.connection()
+    columns = inspect(connection).get_columns(Article.__tablename__)
+    if "content" not in {column["name"] for column in columns}:
+        return 0
+    moved = 0
+    last_id = 0
+    while True:
+        rows = db_session.execute(
+            text(
+                "SELECT id, content FROM articles WHERE id > :last_id "
+                "ORDER BY id LIMIT :batch_size"
+            ),
+            {"last_id": last_id, "batch_size": batch_size},
+        ).all()
+        if not rows:
+            break
+        existing = set(
+            db_session.scalars(
+                select(ArticleBody.article_id).where(
+                    ArticleBody.article_id.in_([row.id for row in rows])
+                )
+            )
+        )
+        for row in rows:
+            if row.id not in existing and row.content is not None:
+                body = ArticleBody(article_id=row.id)
+                body.text = row.content
+                db_session.add(body)
+                moved += 1
+        db_session.commit()
+        last_id = rows[-1].id
+    if drop_column:
+        db_session.execute(text("ALTER TABLE articles DROP COLUMN content"))
+        db_session.commit()
+    return moved
@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from sqlalchemy import delete, func, select, and_
+from sqlalchemy.orm import Session, aliased
+
+from app.core import settings
+from app.core.enums import ChangeOperation
+from app.core.events import broker, Event
+from app.core.invalidation import author_articles_key, invalidate
+from app.core.jobs import job, enqueue
+from app.models.articles import ArticleChange, ArticleChangeCompaction
+from app.models.users import Student, Teacher, teacher_student
+
+COMPACTION_INTERVAL = timedelta(days=1)
+
+
+def record_article_changes(
+    db_session: Session,
+    operation: ChangeOperation,
+    articles: Iterable[tuple[int, int]],
+) -> list[Event]:
+    """
+    Appends entries to the change log in the caller's transaction.
+
+    :param db_session: The session the articles are written with
+    :param operation: Whether the articles were created or deleted
+    :param articles: Pairs of article id and author id
+    :return: The events to publish once the transaction is committed
+    """
+    changes = [
+        ArticleChange(operation=operation, article_id=article_id, author_id=author_id)
+        for article_id, author_id in articles
+    ]
+    db_session.add_all(changes)
+    db_session.flush()
+    # The articles of the authors change at the version of the change log
+    for change in changes:
+        invalidate(db_session, author_articles_key(change.author_id), change.id)
+    return [change_event(change) for change in changes]
+
+
+def change_event(change: ArticleChange) -> Event:
+    return Event(
+        id=change.id,
+        type=change.operation.value,
+        data={"article_id": change.article_id, "author_id": change.author_id},
+    )
+
+
+def publish_article_changes(db_session: Session, events: list[Event]) -> None:
+    """
+    Pushes committed changes to the teachers of their authors.
+    """
+    if not events or not broker.has_subscribers():
+        return
+    author_ids = {event.data["author_id"] for event in events}
+    teachers = {}
+    for author_id, teacher_id in db_session.execute(
+        select(Student.user_id, Teacher.user_id)
+        .join(teacher_student, Student.id == teacher_student.c.student_id)
+        .join(Teacher, teacher_student.c.teacher_id == Teacher.id)
+        .where(Student.user_id.in_(author_ids))
+    ):
+        teachers.setdefault(author_id, []).append(teacher_id)
+    for event in events:
+        broker.publish(teachers.get(event.data["author_id"], []), event)
+
+
+def get_compaction_horizon(db_session: Session) -> int:
+    horizon = db_session.scalar(
+        select(func.max(ArticleChangeCompaction.compacted_through))
+    )
+    return horizon or 0
+
+
+def compact_article_changes(db_session: Session, retention: timedelta) -> int:
+    """
+    Shrinks the change log. Entries superseded by a newer entry for the same
+    article are dropped regardless of age, as the newer entry carries the state.
+    Deletions older than ``retention`` are dropped as well and move the compaction
+    horizon, clients with a cursor below it have to resynchronize.
+
+    :return: The number of removed entries
+    """
+    newer = aliased(ArticleChange)
+    superseded = db_session.execute(
+        delete(ArticleChange)
+        .where(
+            select(newer.id)
+            .where(
+                and_(
+                    newer.article_id == ArticleChange.article_id,
+                    newer.id > ArticleChange.id,
+                )
+            )
+            .exists()
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    expired = db_session.scalars(
+        delete(ArticleChange)
+        .where(
+            ArticleChange.operation == ChangeOperation.delete,
+            ArticleChange.created_at < datetime.now() - retention,
+        )
+        .returning(ArticleChange.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if expired:
+        db_session.add(ArticleChangeCompaction(compacted_through=max(expired)))
+    return superseded + len(expired)
+
+
+@job("compact_article_changes")
+def compact_article_changes_job(db_session: Session) -> None:
+    retention = timedelta(days=settings.CHANGES_RETENTION_DAYS)
+    compact_article_changes(db_session, retention)
+    enqueue(
+        db_session,
+        "compact_article_changes",
+        run_at=datetime.now() + COMPACTION_INTERVAL,
+    )
@@ -0,0 +1,117 @@
+from collections import Counter
+from datetime import date, datetime
+from typing import Iterable
+
+from sqlalchemy import func, delete, insert, select, Row
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.core.sharding import shard_sessions
+from app.models.articles import Article, ArticleStat
+from app.models.users import Student, Teacher, teacher_student
+
+
+def update_article_stats(
+    db_session: Session, articles: Iterable[tuple[int, datetime]], delta: int
+) -> None:
+    """
+    Adds ``delta`` to the daily counters of the given articles. Runs in the caller's
+    transaction, so the counters are committed together with the articles.
+
+    :param db_session: The session the articles are written with
+    :param articles: Pairs of author id and creation time
+    :param delta: 1 for created articles, -1 for deleted ones
+    """
+    counts = Counter(
+        (author_id, created_at.date()) for author_id, created_at in articles
+    )
+    if not counts:
+        return
+    dialect = postgresql if db_session.bind.dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(ArticleStat).values(
+        [
+            {"author_id": author_id, "day": day, "count": count * delta}
+            for (author_id, day), count in sorted(counts.items())
+        ]
+    )
+    db_session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[ArticleStat.author_id, ArticleStat.day],
+            set_={"count": ArticleStat.count + statement.excluded.count},
+        )
+    )
+
+
+def stats_within(statement, since: date | None, until: date | None):
+    if since is not None:
+        statement = statement.where(ArticleStat.day >= since)
+    if until is not None:
+        statement = statement.where(ArticleStat.day <= until)
+    return statement
+
+
+def get_author_stats(
+    db_session: Session,
+    since: date | None = None,
+    until: date | None = None,
+    per_day: bool = False,
+) -> list[Row]:
+    columns = [ArticleStat.author_id] + ([ArticleStat.day] if per_day else [])
+    statement = (
+        select(*columns, func.sum(ArticleStat.count).label("articles"))
+        .group_by(*columns)
+        .having(func.sum(ArticleStat.count) > 0)
+        .order_by(*columns)
+    )
+    return db_session.execute(stats_within(statement, since, until)).all()
+
+
+def get_teacher_stats(
+    db_session: Session,
+    since: date | None = None,
+    until: date | None = None,
+    per_day: bool = False,
+) -> list[Row]:
+    columns = [Teacher.user_id.label("teacher_id")]
+    if per_day:
+        columns.append(ArticleStat.day)
+    statement = (
+        select(*columns, func.sum(ArticleStat.count).label("articles"))
+        .join(Student, ArticleStat.author_id == Student.user_id)
+        .join(teacher_student, Student.id == teacher_student.c.student_id)
+        .join(Teacher, teacher_student.c.teacher_id == Teacher.id)
+        .group_by(*columns)
+        .having(func.sum(ArticleStat.count) > 0)
+        .order_by(*columns)
+    )
+    return db_session.execute(stats_within(statement, since, until)).all()
+
+
+def rebuild_article_stats(db_session: Session) -> int:
+    """
+    Recomputes all counters from the articles tables of all shards.
+
+    :return: The number of counter rows written
+    """
+    day = func.date(Article.created_at)
+    counts = Counter()
+    for shard_session in shard_sessions(db_session).covering():
+        for author_id, article_day, count in shard_session.execute(
+            select(Article.author_id, day, func.count()).group_by(
+                Article.author_id, day
+            )
+        ):
+            if isinstance(article_day, str):
+                article_day = date.fromisoformat(article_day)
+            counts[author_id, article_day] += count
+    db_session.execute(delete(ArticleStat))
+    if counts:
+        db_session.execute(
+            insert(ArticleStat),
+            [
+                {"author_id": author_id, "day": article_day, "count": count}
+                for (author_id, article_day), count in counts.items()
+            ],
+        )
+    db_session.commit()
+    return len(counts)
@@ -0,0 +1,305 @@
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator
+
+from fastapi import HTTPException, status
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core import settings
+from app.core.enums import UploadStatus
+from app.core.jobs import job, enqueue
+from app.core.storage import Storage, get_storage
+from app.models.uploads import Upload
+from app.models.users import User
+from app.schemas.uploads import UploadCreateSchema, COVER_IMAGE_TYPES
+
+EXPIRY_INTERVAL = timedelta(hours=1)
+
+
+def stored_filename(upload: Upload) -> str:
+    return f"{upload.id}{COVER_IMAGE_TYPES[upload.content_type]}"
+
+
+async def create_upload(
+    data: UploadCreateSchema,
+    user: User,
+    db_session: Session,
+    storage: Storage | None = None,
+) -> Upload:
+    storage = storage or get_storage()
+    upload = Upload(
+        id=uuid.uuid4().hex,
+        owner_id=user.id,
+        **data.dict(),
+        expires_at=datetime.now() + timedelta(hours=settings.UPLOADS_EXPIRE_HOURS),
+    )
+    upload.storage_handle = await run_in_threadpool(
+        storage.start_upload, upload.id, stored_filename(upload)
+    )
+    db_session.add(upload)
+    db_session.commit()
+    return upload
+
+
+def get_own_upload(upload_id: str, user: User, db_session: Session) -> Upload:
+    upload = (
+        db_session.query(Upload)
+        .filter(
+            Upload.id == upload_id,
+            Upload.owner_id == user.id,
+            Upload.expires_at > datetime.now(),
+        )
+        .first()
+    )
+    if upload is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found"
+        )
+    return upload
+
+
+def check_chunk_size(offset: int, written: int, data: bytes, size: int) -> None:
+    if written + len(data) > settings.UPLOADS_MAX_CHUNK_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Chunk is too large",
+        )
+    if offset + written + len(data) > size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Chunk exceeds the declared upload size",
+        )
+
+
+def claim_chunk(upload_id: str, offset: int, db_session: Session) -> datetime:
+    """
+    Reserves the offset for one chunk, so concurrent or retried requests cannot
+    write the same range. Claims of writers that went away expire.
+
+    :return: The claim, to be passed to ``record_received``
+    """
+    claimed_at = datetime.now()
+    lease = timedelta(seconds=settings.UPLOADS_CHUNK_LEASE_SECONDS)
+    result = db_session.execute(
+        update(Upload)
+        .where(
+            Upload.id == upload_id,
+            Upload.status == UploadStatus.pending,
+            Upload.received == offset,
+            or_(
+                Upload.chunk_claimed_at.is_(None),
+                Upload.chunk_claimed_at < claimed_at - lease,
+            ),
+        )
+        .values(chunk_claimed_at=claimed_at)
+    )
+    db_session.commit()
+    if result.rowcount != 1:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Another chunk is being written at this offset",
+        )
+    return claimed_at
+
+
+def record_received(
+    upload_id: str,
+    offset: int,
+    received: int,
+    claimed_at: datetime,
+    db_session: Session,
+) -> bool:
+    """
+    Moves the offset past the written data and releases the claim.
+
+    :return: Whether the claim was still held
+    """
+    result = db_session.execute(
+        update(Upload)
+        .where(
+            Upload.id == upload_id,
+            Upload.received == offset,
+            Upload.chunk_claimed_at == claimed_at,
+        )
+        .values(received=received, chunk_claimed_at=None)
+    )
+    db_session.commit()
+    return result.rowcount == 1
+
+
+def lost_claim() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="The chunk took too long and was taken over",
+    )
+
+
+async def write_upload_chunk(
+    upload: Upload,
+    offset: int,
+    chunks: AsyncIterator[bytes],
+    db_session: Session,
+    storage: Storage | None = None,
+) -> Upload:
+    """
+    Streams a chunk of the upload into storage. A chunk has to continue where the
+    previous one ended, clients resume an interrupted upload from its offset.
+    Backends with a minimum part size receive the chunk in full before it is
+    written, an interrupted chunk is then sent again as a whole.
+    """
+    storage = storage or get_storage()
+    if upload.status != UploadStatus.pending:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Upload is already completed"
+        )
+    if offset != upload.received:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload continues at offset {upload.received}",
+        )
+    upload_id, size, handle = upload.id, upload.size, upload.storage_handle
+    # Committed right away, which also releases the connection while the client
+    # is sending the chunk
+    claimed_at = claim_chunk(upload_id, offset, db_session)
+    if storage.min_chunk_size > 0:
+        await write_buffered_chunk(
+            storage, upload_id, handle, offset, size, chunks, claimed_at, db_session
+        )
+        return upload
+    written = 0
+    try:
+        async for data in chunks:
+            if not data:
+                continue
+            check_chunk_size(offset, written, data, size)
+            await run_in_threadpool(
+                storage.write_chunk, upload_id, handle, offset + written, data
+            )
+            written += len(data)
+    finally:
+        # Whatever reached storage counts, even if the client went away mid-chunk
+        recorded = record_received(
+            upload_id, offset, offset + written, claimed_at, db_session
+        )
+    if not recorded:
+        raise lost_claim()
+    return upload
+
+
+async def write_buffered_chunk(
+    storage: Storage,
+    upload_id: str,
+    handle: str | None,
+    offset: int,
+    size: int,
+    chunks: AsyncIterator[bytes],
+    claimed_at: datetime,
+    db_session: Session,
+) -> None:
+    chunk = bytearray()
+    try:
+        async for data in chunks:
+            check_chunk_size(offset, len(chunk), data, size)
+            chunk += data
+        if offset + len(chunk) < size and len(chunk) < storage.min_chunk_size:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=(
+                    f"Chunks before the last one need {storage.min_chunk_size} bytes"
+                ),
+            )
+        if chunk:
+            await run_in_threadpool(
+                storage.write_chunk, upload_id, handle, offset, bytes(chunk)
+            )
+    except BaseException:
+        # Nothing counts of a chunk that was not written in full
+        record_received(upload_id, offset, offset, claimed_at, db_session)
+        raise
+    if not record_received(
+        upload_id, offset, offset + len(chunk), claimed_at, db_session
+    ):
+        raise lost_claim()
+
+
+async def complete_upload(
+    upload: Upload, db_session: Session, storage: Storage | None = None
+) -> Upload:
+    storage = storage or get_storage()
+    if upload.status == UploadStatus.completed:
+        return upload
+    if upload.received != upload.size:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Upload is incomplete, {upload.received} of {upload.size} bytes",
+        )
+    filename = stored_filename(upload)
+    path = await run_in_threadpool(
+        storage.finish_upload, upload.id, upload.storage_handle, filename
+    )
+    if upload.sha256 is not None:
+        checksum = await run_in_threadpool(storage.checksum, path)
+        if checksum != upload.sha256:
+            # The data is corrupt, the client has to upload it again
+            await run_in_threadpool(storage.delete, path)
+            upload.storage_handle = await run_in_threadpool(
+                storage.start_upload, upload.id, filename
+            )
+            upload.received = 0
+            db_session.commit()
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Checksum mismatch",
+            )
+    upload.path = path
+    upload.status = UploadStatus.completed
+    db_session.commit()
+    return upload
+
+
+def take_completed_upload(upload_id: str, user: User, db_session: Session) -> str:
+    """
+    Hands the file of a completed upload over to the caller, who commits the
+    session once the file is referenced.
+
+    :return: The storage path of the uploaded file
+    """
+    upload = get_own_upload(upload_id, user, db_session)
+    if upload.status != UploadStatus.completed:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Upload is not completed",
+        )
+    db_session.delete(upload)
+    return upload.path
+
+
+def expire_uploads(
+    db_session: Session, now: datetime | None = None, storage: Storage | None = None
+) -> int:
+    """
+    Removes uploads that were abandoned before being attached to an article.
+
+    :return: The number of removed uploads
+    """
+    storage = storage or get_storage()
+    expired = (
+        db_session.query(Upload)
+        .filter(Upload.expires_at <= (now or datetime.now()))
+        .all()
+    )
+    for upload in expired:
+        if upload.status == UploadStatus.completed:
+            storage.delete(upload.path)
+        else:
+            storage.discard_upload(upload.id, upload.storage_handle)
+        db_session.delete(upload)
+    return len(expired)
+
+
+@job("expire_uploads")
+def expire_uploads_job(db_session: Session) -> None:
+    expire_uploads(db_session)
+    enqueue(db_session, "expire_uploads", run_at=datetime.now() + EXPIRY_INTERVAL)
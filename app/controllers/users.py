@@ -1,15 +1,11 @@
 from typing import Union, Type
 
 from fastapi import HTTPException
-from pydantic import ValidationError
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 from app.models.users import User, profile_model_factory
-from app.schemas.users import (
-    UserCreateSchema,
-    Role,
-    profile_schema_factory,
-)
+from app.schemas.users import UserCreateSchema, Role
 
 
 def get_user_by_id(user_id: int, db_session: Session) -> Union[User, None]:
@@ -22,25 +18,20 @@ def create_user(user: UserCreateSchema, db_session: Session) -> User:
             status_code=400, detail="User with this email already exists"
         )
 
-    user_data = user.dict()
-    profile_data = user_data.pop("profile")
-
-    password = user_data.pop("password")
+    user_data = user.dict(exclude={"profile", "password"})
     db_user = User(**user_data)
-    db_user.password = password
-    db_user = assign_profile_to_user(db_user, profile_data, db_session=db_session)
+    db_user.password = user.password
+    db_user = assign_profile_to_user(db_user, user.profile, db_session=db_session)
     db_session.add(db_user)
     db_session.commit()
     db_session.refresh(db_user)
     return db_user
 
 
-def assign_profile_to_user(user: User, profile_data: dict, db_session: Session) -> User:
-    try:
-        profile = profile_schema_factory(user.role)(**profile_data)
-    except ValidationError as e:
-        raise HTTPException(status_code=400, detail=e.errors())
-
+def assign_profile_to_user(user: User, profile: BaseModel, db_session: Session) -> User:
+    """
+    :param profile: The profile, already validated against the schema of the role
+    """
     db_profile = profile_model_factory(user.role, profile.dict(), db_session=db_session)
     user.profile = db_profile
     return user
@@ -0,0 +1,218 @@
+import math
+import time
+from collections import OrderedDict
+from enum import Enum
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Scope, Receive, Send
+
+from app.core import settings
+from app.core.enums import Role
+from app.core.events import EventStreamRoutes, event_stream_routes
+from app.core.invalidation import invalidation_bus, key_id
+
+KNOWN_PRINCIPALS_MAX_SIZE = 100_000
+
+
+class RouteClass(str, Enum):
+    read = "read"
+    write = "write"
+    upload = "upload"
+    stream = "stream"
+
+
+class RateLimitBackend:
+    """
+    Stores token buckets. Replace the in-memory backend with a shared one to
+    enforce limits across workers.
+    """
+
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        """
+        Takes a token from the bucket stored under ``key``.
+
+        :param key: The bucket key
+        :param rate: Tokens added to the bucket per second
+        :param burst: The bucket capacity
+        :return: 0 if a token was taken, otherwise seconds until one is available
+        """
+        raise NotImplementedError
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    def __init__(self, max_size: int = KNOWN_PRINCIPALS_MAX_SIZE):
+        self.max_size = max_size
+        self._buckets = OrderedDict()
+
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_size:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= self.limit:
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self) -> None:
+        self.in_flight -= 1
+
+
+class AdmissionController:
+    """
+    Decides whether a request may enter the application. Principals are rate
+    limited by their role, and the number of requests in flight is capped for
+    every route class.
+    """
+
+    def __init__(
+        self,
+        backend: RateLimitBackend | None = None,
+        role_limits: dict[Role | None, tuple[float, int]] | None = None,
+        concurrency_limits: dict[RouteClass, int] | None = None,
+        enabled: bool = settings.ADMISSION_ENABLED,
+        stream_routes: EventStreamRoutes | None = None,
+    ):
+        self.backend = backend or InMemoryRateLimitBackend()
+        self.role_limits = role_limits or {
+            Role.admin: (settings.ADMISSION_RATE_ADMIN, settings.ADMISSION_BURST_ADMIN),
+            Role.teacher: (
+                settings.ADMISSION_RATE_TEACHER,
+                settings.ADMISSION_BURST_TEACHER,
+            ),
+            Role.student: (
+                settings.ADMISSION_RATE_STUDENT,
+                settings.ADMISSION_BURST_STUDENT,
+            ),
+            None: (
+                settings.ADMISSION_RATE_ANONYMOUS,
+                settings.ADMISSION_BURST_ANONYMOUS,
+            ),
+        }
+        concurrency_limits = concurrency_limits or {
+            RouteClass.read: settings.ADMISSION_MAX_READS,
+            RouteClass.write: settings.ADMISSION_MAX_WRITES,
+            RouteClass.upload: settings.ADMISSION_MAX_UPLOADS,
+            RouteClass.stream: settings.ADMISSION_MAX_STREAMS,
+        }
+        self.limiters = {
+            route_class: ConcurrencyLimiter(limit)
+            for route_class, limit in concurrency_limits.items()
+        }
+        self.enabled = enabled
+        self.stream_routes = stream_routes or event_stream_routes
+        self._roles = OrderedDict()
+
+    def remember_role(self, principal: str, role: Role) -> None:
+        """
+        Records the role of an authenticated principal, so later requests of the
+        principal are limited by their role without a database lookup.
+        """
+        self._roles[principal] = role
+        self._roles.move_to_end(principal)
+        if len(self._roles) > KNOWN_PRINCIPALS_MAX_SIZE:
+            self._roles.popitem(last=False)
+
+    def forget_role(self, principal: str) -> None:
+        self._roles.pop(principal, None)
+
+    def forget_roles(self) -> None:
+        self._roles.clear()
+
+    def role_of(self, principal: str | None) -> Role | None:
+        return self._roles.get(principal)
+
+    def classify(self, scope: Scope, headers: Headers) -> RouteClass:
+        # Decided by the route, clients choose their headers
+        if self.stream_routes.matches(scope):
+            return RouteClass.stream
+        if scope["method"] in ("GET", "HEAD", "OPTIONS"):
+            return RouteClass.read
+        content_type = headers.get("content-type", "")
+        if content_type.startswith(("multipart/", "application/octet-stream")):
+            return RouteClass.upload
+        return RouteClass.write
+
+    async def rate_limit(self, scope: Scope, headers: Headers) -> float:
+        principal = headers.get("user-id")
+        role = self.role_of(principal)
+        if role is not None:
+            key = f"user:{principal}"
+        else:
+            # Unverified ids are free to pick, they share the bucket of the client
+            client = scope.get("client")
+            key = f"ip:{client[0] if client else 'unknown'}"
+        rate, burst = self.role_limits[role]
+        return await self.backend.acquire(key, rate, burst)
+
+    async def admit(
+        self, scope: Scope
+    ) -> tuple[ConcurrencyLimiter | None, JSONResponse | None]:
+        """
+        Takes a token of the principal and a slot of the route class for a request.
+
+        :return: The limiter to release once the request is done, or the response
+            rejecting the request
+        """
+        headers = Headers(scope=scope)
+        wait = await self.rate_limit(scope, headers)
+        if wait > 0:
+            return None, rejection(429, "Too many requests", wait)
+        limiter = self.limiters[self.classify(scope, headers)]
+        if not limiter.try_acquire():
+            return None, rejection(503, "Server is overloaded", 1)
+        return limiter, None
+
+
+def rejection(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        {"detail": detail},
+        status_code=status_code,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+admission_controller = AdmissionController()
+invalidation_bus.subscribe(
+    "user:",
+    lambda key, version: admission_controller.forget_role(str(key_id(key))),
+    admission_controller.forget_roles,
+)
+
+
+class AdmissionMiddleware:
+    def __init__(self, app: ASGIApp, controller: AdmissionController | None = None):
+        self.app = app
+        self.controller = controller or admission_controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        controller = self.controller
+        if scope["type"] != "http" or not controller.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        limiter, response = await controller.admit(scope)
+        if response is not None:
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import logging
+from contextlib import AsyncExitStack
+from urllib.parse import urlencode, urlsplit
+
+from sqlalchemy.orm import Session
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.types import Message, Scope
+
+from app.core import settings
+from app.core.admission import admission_controller
+from app.core.sharding import close_shard_sessions
+from app.models.users import User
+from app.schemas.batch import BatchItemSchema, BatchItemResultSchema
+
+logger = logging.getLogger(__name__)
+
+# Headers describing the batch request itself rather than its items
+BATCH_HEADERS = {b"content-length", b"content-type", b"transfer-encoding"}
+
+
+def item_scope(scope: Scope, item: BatchItemSchema) -> tuple[Scope, bytes]:
+    url = urlsplit(item.path)
+    item_headers = {name.lower(): value for name, value in item.headers.items()}
+    # The principal of the batch is the principal of every item
+    item_headers.pop("user-id", None)
+    body = b""
+    if item.json_body is not None:
+        body = json.dumps(item.json_body).encode("utf-8")
+        item_headers["content-type"] = "application/json"
+    elif item.form is not None:
+        body = urlencode(item.form).encode("utf-8")
+        item_headers["content-type"] = "application/x-www-form-urlencoded"
+    item_headers["content-length"] = str(len(body))
+    headers = [
+        (name, value)
+        for name, value in scope["headers"]
+        if name not in BATCH_HEADERS and name.decode("latin-1") not in item_headers
+    ]
+    headers += [
+        (name.encode("latin-1"), value.encode("latin-1"))
+        for name, value in item_headers.items()
+    ]
+    child_scope = {
+        key: value
+        for key, value in scope.items()
+        if key not in ("endpoint", "path_params", "route", "state")
+    }
+    child_scope.update(
+        method=item.method,
+        path=url.path,
+        raw_path=url.path.encode("utf-8"),
+        query_string=url.query.encode("utf-8"),
+        headers=headers,
+    )
+    return child_scope, body
+
+
+def error_response(request: Request, exc: Exception):
+    handlers = request.app.exception_handlers
+    for cls in type(exc).__mro__:
+        if cls in handlers:
+            return handlers[cls](request, exc)
+    return None
+
+
+def item_result(
+    status_code: int, raw_headers: list, body: bytes
+) -> BatchItemResultSchema:
+    headers = {
+        name.decode("latin-1"): value.decode("latin-1")
+        for name, value in raw_headers
+        if name != b"content-length"
+    }
+    content = None
+    if body:
+        if headers.get("content-type", "").startswith("application/json"):
+            content = json.loads(body)
+        else:
+            content = body.decode("utf-8", errors="replace")
+    return BatchItemResultSchema(status=status_code, headers=headers, body=content)
+
+
+async def dispatch(
+    request: Request, item: BatchItemSchema, user: User, db_session: Session
+) -> BatchItemResultSchema:
+    """
+    Runs one item of a batch through the routes of the application, with the
+    principal and a session of the batch. Items are admitted like requests of
+    their own, so a batch cannot get around the rate and concurrency limits.
+    """
+    scope, body = item_scope(request.scope, item)
+    scope["state"] = {"batch_user": user, "batch_session": db_session}
+    if not admission_controller.enabled:
+        return await run_item(request, item, scope, body)
+    limiter, response = await admission_controller.admit(scope)
+    if response is not None:
+        return item_result(response.status_code, response.raw_headers, response.body)
+    try:
+        return await run_item(request, item, scope, body)
+    finally:
+        limiter.release()
+
+
+async def run_item(
+    request: Request, item: BatchItemSchema, scope: Scope, body: bytes
+) -> BatchItemResultSchema:
+    body_sent = False
+    start: Message | None = None
+    chunks = []
+    streaming = False
+
+    async def receive() -> Message:
+        nonlocal body_sent
+        if body_sent:
+            return {"type": "http.disconnect"}
+        body_sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message: Message) -> None:
+        nonlocal start, streaming
+        if message["type"] == "http.response.start":
+            start = message
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            # Event streams end once they see the disconnect after the body
+            streaming = content_type.startswith("text/event-stream")
+        elif message["type"] == "http.response.body" and not streaming:
+            chunks.append(message.get("body", b""))
+
+    try:
+        async with AsyncExitStack() as stack:
+            # Dependencies with yield are closed when the item is done
+            scope["fastapi_astack"] = stack
+            await asyncio.wait_for(
+                request.app.router(scope, receive, send), settings.BATCH_ITEM_TIMEOUT
+            )
+    except asyncio.TimeoutError:
+        response = JSONResponse({"detail": "Request timed out"}, status_code=504)
+    except Exception as exc:
+        response = error_response(Request(scope, receive), exc)
+        if asyncio.iscoroutine(response):
+            response = await response
+        if response is None:
+            logger.exception("Batch item %s %s failed", item.method, item.path)
+            response = JSONResponse(
+                {"detail": "Internal Server Error"}, status_code=500
+            )
+    else:
+        if not streaming:
+            return item_result(start["status"], start["headers"], b"".join(chunks))
+        response = JSONResponse(
+            {"detail": "Streaming responses cannot be batched"}, status_code=400
+        )
+    return item_result(response.status_code, response.raw_headers, response.body)
+
+
+async def run_batch(
+    request: Request, items: list[BatchItemSchema], user: User, db_session: Session
+) -> list[BatchItemResultSchema]:
+    """
+    Runs the items of a batch in order. Consecutive reads run concurrently, up to
+    ``BATCH_MAX_CONCURRENCY`` at a time, each on a session of its own, as sessions
+    are not safe for concurrent use. Any other item waits for the reads before it
+    and runs alone on the session of the batch.
+    """
+    results: list[BatchItemResultSchema | None] = [None] * len(items)
+    free_sessions = [db_session]
+    lane_sessions = []
+    limit = asyncio.Semaphore(settings.BATCH_MAX_CONCURRENCY)
+
+    async def read(index: int) -> None:
+        async with limit:
+            if free_sessions:
+                session = free_sessions.pop()
+            else:
+                session = Session(bind=db_session.get_bind(), autoflush=False)
+                lane_sessions.append(session)
+            try:
+                results[index] = await dispatch(request, items[index], user, session)
+            finally:
+                free_sessions.append(session)
+
+    try:
+        index = 0
+        while index < len(items):
+            if items[index].method != "GET":
+                results[index] = await dispatch(request, items[index], user, db_session)
+                if results[index].status >= 400:
+                    # A failed write may leave the transaction unusable for the
+                    # items after it
+                    close_shard_sessions(db_session)
+                    db_session.rollback()
+                index += 1
+                continue
+            end = index
+            while end < len(items) and items[end].method == "GET":
+                end += 1
+            await asyncio.gather(*(read(i) for i in range(index, end)))
+            # Later reads see what the writes in between committed
+            for session in lane_sessions:
+                session.rollback()
+            index = end
+    finally:
+        for session in lane_sessions:
+            close_shard_sessions(session)
+            session.close()
+    return results
@@ -0,0 +1,338 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Hashable
+
+from fastapi import HTTPException, status
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from app.core import settings
+from app.core.db import engine
+
+STALE_WARNING = b'110 - "Response is Stale"'
+
+
+class BreakerState(str, Enum):
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Tracks the outcome and latency of database calls over a sliding window of
+    one second buckets. The breaker opens when too many calls fail or are slow,
+    rejects work while open, and after ``open_seconds`` lets a single probe
+    through. The first call of the probe decides whether the breaker closes
+    again, so a probe serving a long response does not hold up other requests.
+    """
+
+    def __init__(
+        self,
+        window: int = settings.BREAKER_WINDOW_SECONDS,
+        min_calls: int = settings.BREAKER_MIN_CALLS,
+        failure_rate: float = settings.BREAKER_FAILURE_RATE,
+        slow_call_seconds: float = settings.BREAKER_SLOW_CALL_SECONDS,
+        slow_call_rate: float = settings.BREAKER_SLOW_CALL_RATE,
+        open_seconds: float = settings.BREAKER_OPEN_SECONDS,
+        enabled: bool = settings.BREAKER_ENABLED,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.enabled = enabled
+        self.clock = clock
+        # Calls are recorded from the threadpool
+        self._lock = threading.Lock()
+        self._buckets: deque[list[int]] = deque()
+        self._state = BreakerState.closed
+        self._opened_at = 0.0
+        self._probing = False
+
+    def _update_state(self, now: float) -> None:
+        if (
+            self._state == BreakerState.open
+            and now - self._opened_at >= self.open_seconds
+        ):
+            self._state = BreakerState.half_open
+            self._probing = False
+
+    def _open(self, now: float) -> None:
+        self._state = BreakerState.open
+        self._opened_at = now
+        self._buckets.clear()
+
+    def _end_probe(self, failed: bool, now: float) -> None:
+        if failed:
+            self._open(now)
+        else:
+            self._state = BreakerState.closed
+            self._buckets.clear()
+        self._probing = False
+
+    @property
+    def state(self) -> BreakerState:
+        with self._lock:
+            self._update_state(self.clock())
+            return self._state
+
+    def retry_after(self) -> float:
+        with self._lock:
+            return max(0.0, self._opened_at + self.open_seconds - self.clock())
+
+    def acquire(self, probe: bool = True) -> bool | None:
+        """
+        Asks for permission to use the database.
+
+        :param probe: Whether the call may be the probe of a half-open breaker
+        :return: None if the call is rejected, otherwise whether it is the probe
+        """
+        if not self.enabled:
+            return False
+        with self._lock:
+            self._update_state(self.clock())
+            if self._state == BreakerState.closed:
+                return False
+            if self._state == BreakerState.half_open and probe and not self._probing:
+                self._probing = True
+                return True
+            return None
+
+    def release(self, probe: bool) -> None:
+        if not probe:
+            return
+        with self._lock:
+            if self._state == BreakerState.half_open and self._probing:
+                # The probe got by without a call
+                self._end_probe(False, self.clock())
+
+    def record(self, failed: bool, latency: float = 0.0) -> None:
+        if not self.enabled:
+            return
+        slow = latency >= self.slow_call_seconds
+        now = self.clock()
+        with self._lock:
+            self._update_state(now)
+            if self._state == BreakerState.half_open:
+                if self._probing:
+                    self._end_probe(failed or slow, now)
+                return
+            if self._state == BreakerState.open:
+                return
+            second = int(now)
+            if not self._buckets or self._buckets[-1][0] != second:
+                self._buckets.append([second, 0, 0, 0])
+            while self._buckets[0][0] <= second - self.window:
+                self._buckets.popleft()
+            bucket = self._buckets[-1]
+            bucket[1] += 1
+            bucket[2] += failed
+            bucket[3] += slow
+            calls = sum(bucket[1] for bucket in self._buckets)
+            if calls < self.min_calls:
+                return
+            failures = sum(bucket[2] for bucket in self._buckets)
+            slow_calls = sum(bucket[3] for bucket in self._buckets)
+            if (
+                failures / calls >= self.failure_rate
+                or slow_calls / calls >= self.slow_call_rate
+            ):
+                self._open(now)
+
+    @contextmanager
+    def guard(self, probe: bool = True):
+        """
+        Wraps a unit of work using the database. Raises a 503 error right away
+        while the breaker is open.
+
+        :param probe: Whether the work may be the probe of a half-open breaker.
+            Work that keeps its session without using it, such as an event
+            stream, would tell nothing about the database.
+        """
+        probe = self.acquire(probe)
+        if probe is None:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Database is unavailable",
+                headers={"Retry-After": str(max(1, round(self.retry_after())))},
+            )
+        try:
+            yield
+        except exc.TimeoutError:
+            # Waiting for a pooled connection timed out, no statement was run
+            self.record(failed=True)
+            raise
+        finally:
+            self.release(probe)
+
+    def watch(self, watched_engine: Engine) -> None:
+        """Records the statements of the engine."""
+
+        @event.listens_for(watched_engine, "before_cursor_execute")
+        def start_timer(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("breaker_started", []).append(time.perf_counter())
+
+        @event.listens_for(watched_engine, "after_cursor_execute")
+        def stop_timer(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info["breaker_started"].pop()
+            self.record(failed=False, latency=time.perf_counter() - started)
+
+        @event.listens_for(watched_engine, "handle_error")
+        def record_error(context):
+            if context.connection is not None:
+                started = context.connection.info.get("breaker_started")
+                if started:
+                    started.pop()
+            # Constraint violations and the like say nothing about the database
+            if context.is_disconnect or isinstance(
+                context.sqlalchemy_exception, (exc.OperationalError, exc.InterfaceError)
+            ):
+                self.record(failed=True)
+
+
+db_breaker = CircuitBreaker()
+db_breaker.watch(engine)
+
+
+@dataclass
+class StoredResponse:
+    status: int
+    headers: list[tuple[bytes, bytes]]
+    body: bytes
+    stored_at: float
+
+
+class StaleResponseStore:
+    """The last good responses of read requests, least recently used go first."""
+
+    def __init__(
+        self,
+        max_entries: int = settings.BREAKER_STALE_MAX_ENTRIES,
+        max_body_size: int = settings.BREAKER_STALE_MAX_BODY_SIZE,
+    ):
+        self.max_entries = max_entries
+        self.max_body_size = max_body_size
+        self._responses: OrderedDict[Hashable, StoredResponse] = OrderedDict()
+
+    def get(self, key: Hashable) -> StoredResponse | None:
+        response = self._responses.get(key)
+        if response is not None:
+            self._responses.move_to_end(key)
+        return response
+
+    def put(self, key: Hashable, response: StoredResponse) -> None:
+        self._responses[key] = response
+        self._responses.move_to_end(key)
+        if len(self._responses) > self.max_entries:
+            self._responses.popitem(last=False)
+
+
+stale_responses = StaleResponseStore()
+
+
+def stale_key(scope: Scope) -> Hashable:
+    # Responses depend on the principal, so they are stored per user
+    headers = Headers(scope=scope)
+    return scope["path"], scope["query_string"], headers.get("user-id")
+
+
+async def send_stale(stored: StoredResponse, send: Send) -> None:
+    age = str(int(time.time() - stored.stored_at)).encode()
+    headers = [
+        (name, value)
+        for name, value in stored.headers
+        if name not in (b"age", b"warning")
+    ]
+    headers += [(b"age", age), (b"warning", STALE_WARNING)]
+    await send(
+        {"type": "http.response.start", "status": stored.status, "headers": headers}
+    )
+    await send({"type": "http.response.body", "body": stored.body})
+
+
+class CircuitBreakerMiddleware:
+    """
+    Serves the last good response of a read request, marked with ``Warning`` and
+    ``Age`` headers, when the database breaker is open or the request fails while
+    it is not closed.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        breaker: CircuitBreaker | None = None,
+        store: StaleResponseStore | None = None,
+    ):
+        self.app = app
+        self.breaker = breaker
+        self.store = store
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        breaker = self.breaker or db_breaker
+        store = self.store or stale_responses
+        if scope["type"] != "http" or scope["method"] != "GET" or not breaker.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        key = stale_key(scope)
+        stored = store.get(key)
+        if stored is not None and breaker.state == BreakerState.open:
+            await send_stale(stored, send)
+            return
+
+        start: Message | None = None
+        body = bytearray()
+        storable = replaced = False
+
+        async def send_or_replace(message: Message) -> None:
+            nonlocal start, storable, replaced
+            if message["type"] == "http.response.start":
+                if (
+                    message["status"] >= 500
+                    and stored is not None
+                    and breaker.state != BreakerState.closed
+                ):
+                    replaced = True
+                    return
+                start = message
+                content_type = Headers(raw=message["headers"]).get("content-type", "")
+                storable = message["status"] == 200 and not content_type.startswith(
+                    "text/event-stream"
+                )
+            elif replaced:
+                return
+            elif storable:
+                body.extend(message.get("body", b""))
+                if len(body) > store.max_body_size:
+                    storable = False
+                elif not message.get("more_body", False):
+                    store.put(
+                        key,
+                        StoredResponse(
+                            start["status"], start["headers"], bytes(body), time.time()
+                        ),
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_or_replace)
+        except Exception:
+            if (
+                start is not None
+                or stored is None
+                or breaker.state == BreakerState.closed
+            ):
+                raise
+            replaced = True
+        if replaced:
+            await send_stale(stored, send)
@@ -0,0 +1,93 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+from fastapi import HTTPException, status
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+
+from app.core import settings
+from app.core.invalidation import invalidation_bus
+from app.core.sharding import close_shard_sessions
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers arriving while a call is in
+    flight wait for it and share its result or exception.
+    """
+
+    def __init__(self, timeout: float = settings.COALESCING_TIMEOUT):
+        self.timeout = timeout
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            # A separate task keeps the call alive if the first caller goes away
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget_call(key, done))
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Timed out waiting for an identical request",
+                headers={"Retry-After": "1"},
+            )
+
+    def _forget_call(self, key: Hashable, task: asyncio.Task) -> None:
+        # A newer call may have taken the key after the task was forgotten
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def forget(self, matches: Callable[[Hashable], bool]) -> None:
+        """
+        Lets later callers start a new call instead of joining one in flight, for
+        keys whose data changed. Callers already waiting keep their call.
+        """
+        for key in [key for key in self._calls if matches(key)]:
+            del self._calls[key]
+
+
+def is_article_list(key: Hashable) -> bool:
+    return isinstance(key, tuple) and key[:1] == ("articles",)
+
+
+def forget_article_lists(*invalidation) -> None:
+    # Lists started before a write would hand out what the write replaced
+    single_flight.forget(is_article_list)
+
+
+single_flight = SingleFlight()
+for prefix in ("articles:", "user:"):
+    invalidation_bus.subscribe(prefix, forget_article_lists, forget_article_lists)
+
+
+async def coalesced_json_response(
+    key: Hashable, render: Callable[[Session], bytes], bind: Engine
+) -> Response:
+    """
+    Renders a JSON body in the threadpool, sharing the query and the serialized
+    body with identical requests in flight. The call may outlive the request that
+    started it, so it queries with a session of its own.
+
+    :param key: Identifies the route, principal scope and parameters of the request
+    :param render: Queries the data with the given session and returns the
+        serialized body
+    :param bind: The engine to open the session on
+    """
+
+    def run() -> bytes:
+        with Session(bind=bind, autoflush=False) as db_session:
+            try:
+                return render(db_session)
+            finally:
+                close_shard_sessions(db_session)
+
+    body = await single_flight.do(key, lambda: run_in_threadpool(run))
+    return Response(body, media_type="application/json")
@@ -0,0 +1,51 @@
+import zlib
+
+from app.core import settings
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+ZLIB = "zlib"
+ZSTD = "zstd"
+
+
+def available_codec(preferred: str = settings.ARTICLE_COMPRESSION_CODEC) -> str:
+    if preferred == ZSTD and zstandard is None:
+        return ZLIB
+    return preferred
+
+
+def compress(
+    text: str, threshold: int = settings.ARTICLE_COMPRESSION_THRESHOLD
+) -> tuple[str | None, bytes | None]:
+    """
+    Compresses text longer than ``threshold`` bytes, shorter text is not worth it.
+
+    :return: The codec and the compressed payload, or ``(None, None)`` when the text
+        should be stored as is
+    """
+    data = text.encode("utf-8")
+    if len(data) <= threshold:
+        return None, None
+    codec = available_codec()
+    if codec == ZSTD:
+        payload = zstandard.ZstdCompressor().compress(data)
+    else:
+        payload = zlib.compress(data)
+    if len(payload) >= len(data):
+        return None, None
+    return codec, payload
+
+
+def decompress(codec: str, payload: bytes) -> str:
+    if codec == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd compressed data")
+        data = zstandard.ZstdDecompressor().decompress(payload)
+    elif codec == ZLIB:
+        data = zlib.decompress(payload)
+    else:
+        raise ValueError(f"Unknown compression codec: {codec}")
+    return data.decode("utf-8")
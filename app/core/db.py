@@ -1,9 +1,9 @@
-from environs import Env
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import Connection
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.schema import CreateColumn
 
-env = Env()
-env.read_env()
+from app.core.settings import env
 
 DB_USER = env("DB_USER")
 DB_PASSWORD = env("DB_PASSWORD")
@@ -21,3 +21,56 @@ DBSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 Base.metadata.bind = engine
+
+
+def create_missing_indexes(connection: Connection) -> list[str]:
+    """
+    Creates the indexes declared on the models that are missing from existing tables.
+    ``create_all`` only creates indexes together with new tables, so this is needed to
+    bring an already deployed database up to date.
+
+    :param connection: The connection to create the indexes with
+    :return: The names of the created indexes
+    """
+    inspector = inspect(connection)
+    created = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            if connection.dialect.name == "postgresql":
+                # Build without blocking writes, requires an autocommit connection
+                index.dialect_options["postgresql"]["concurrently"] = True
+            index.create(connection)
+            created.append(index.name)
+    return created
+
+
+def add_missing_columns(connection: Connection) -> list[str]:
+    """
+    Adds the columns declared on the models that are missing from existing tables,
+    which ``create_all`` leaves alone. Added columns have to be nullable or have a
+    server default.
+
+    :param connection: The connection to add the columns with
+    :return: The names of the added columns
+    """
+    inspector = inspect(connection)
+    added = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            definition = CreateColumn(column).compile(dialect=connection.dialect)
+            table_name = connection.dialect.identifier_preparer.format_table(table)
+            connection.execute(
+                text(f"ALTER TABLE {table_name} ADD COLUMN {definition}")
+            )
+            added.append(f"{table.name}.{column.name}")
+    return added
@@ -1,27 +1,43 @@
-from fastapi import Depends, HTTPException, Header
+from fastapi import Depends, HTTPException, Header, Request
 from fastapi.security import SecurityScopes
 from sqlalchemy.orm import Session
 from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_403_FORBIDDEN
 
 from app.controllers.users import get_user_by_id
+from app.core.admission import admission_controller
+from app.core.breaker import db_breaker
 from app.core.db import DBSession
+from app.core.events import event_stream_routes
+from app.core.profiling import phase
+from app.core.sharding import close_shard_sessions
 from app.schemas.users import UserSchema
 
 
-def get_db():
-    db_session = DBSession()
-    try:
-        yield db_session
-    finally:
-        db_session.close()
+def get_db(request: Request):
+    batch_session = getattr(request.state, "batch_session", None)
+    if batch_session is not None:
+        # Items of a batch run on the sessions of the batch, which closes them
+        yield batch_session
+        return
+    # Event streams close their session early, they must not become the probe
+    with db_breaker.guard(probe=not event_stream_routes.matches(request.scope)):
+        db_session = DBSession()
+        try:
+            yield db_session
+        finally:
+            close_shard_sessions(db_session)
+            db_session.close()
 
 
 async def get_current_user(
+    request: Request,
     user_id=Header(None),
     db_session: Session = Depends(get_db),
     security_scopes: SecurityScopes = SecurityScopes(),
 ) -> UserSchema:
-    if user_id is None:
+    # Items of a batch run as the principal of the batch, looked up once
+    user = getattr(request.state, "batch_user", None)
+    if user is None and user_id is None:
         raise HTTPException(
             status_code=HTTP_401_UNAUTHORIZED,
             detail="Unauthorized",
@@ -34,11 +50,12 @@ async def get_current_user(
         status_code=HTTP_403_FORBIDDEN,
         detail="You don't have enough permissions",
     )
-    if user_id is None:
-        raise credentials_exception
-    user = get_user_by_id(user_id, db_session)
     if user is None:
-        raise credentials_exception
+        with phase("get_current_user"):
+            user = get_user_by_id(user_id, db_session)
+        if user is None:
+            raise credentials_exception
+        admission_controller.remember_role(user_id, user.role)
     if security_scopes.scopes:
         if user.role not in security_scopes.scopes:
             raise permissions_exception
@@ -12,3 +12,19 @@ class Role(str, Enum):
     admin = "admin"
     teacher = "teacher"
     student = "student"
+
+
+class JobStatus(str, Enum):
+    pending = "pending"
+    running = "running"
+    failed = "failed"
+
+
+class ChangeOperation(str, Enum):
+    create = "create"
+    delete = "delete"
+
+
+class UploadStatus(str, Enum):
+    pending = "pending"
+    completed = "completed"
@@ -0,0 +1,153 @@
+import asyncio
+import json
+from dataclasses import dataclass
+from typing import AsyncIterator, Hashable, Iterable
+
+from starlette.responses import StreamingResponse
+from starlette.routing import BaseRoute, Match
+from starlette.types import Scope
+
+from app.core import settings
+
+
+@dataclass(frozen=True)
+class Event:
+    id: int
+    type: str
+    data: dict
+
+    def encode(self) -> str:
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data)}\n\n"
+
+
+class EventStreamResponse(StreamingResponse):
+    """Marks the routes serving event streams, declared as their response class."""
+
+    media_type = "text/event-stream"
+
+
+class EventStreamRoutes:
+    """
+    The routes serving event streams. Streams stay open while idle, so admission
+    and the circuit breaker treat them apart from other requests, before the
+    request has been routed.
+    """
+
+    def __init__(self):
+        self._routes: list[BaseRoute] = []
+
+    def register(self, routes: Iterable[BaseRoute]) -> None:
+        self._routes += [
+            route
+            for route in routes
+            if getattr(route, "response_class", None) is EventStreamResponse
+        ]
+
+    def matches(self, scope: Scope) -> bool:
+        route = scope.get("route")
+        if route is not None:
+            return getattr(route, "response_class", None) is EventStreamResponse
+        return any(route.matches(scope)[0] == Match.FULL for route in self._routes)
+
+
+event_stream_routes = EventStreamRoutes()
+
+
+class Subscription:
+    def __init__(self, broker: "Broker", topic: Hashable, queue_size: int):
+        self.broker = broker
+        self.topic = topic
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+
+    def deliver(self, event: Event) -> None:
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A slow consumer is dropped rather than buffered without bound,
+            # it reconnects with Last-Event-ID and replays what it missed
+            self.close()
+
+    def close(self) -> None:
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class Broker:
+    """
+    In-process pub/sub. Subscribers get a bounded queue per subscription, events
+    can be published from any thread.
+    """
+
+    def __init__(self, queue_size: int = settings.EVENTS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._topics: dict[Hashable, set[Subscription]] = {}
+        self._loop = None
+
+    def has_subscribers(self) -> bool:
+        return bool(self._topics)
+
+    def subscribe(self, topic: Hashable) -> Subscription:
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(self, topic, self.queue_size)
+        self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._topics.get(subscription.topic, set())
+        subscribers.discard(subscription)
+        if not subscribers:
+            self._topics.pop(subscription.topic, None)
+
+    def publish(self, topics: Iterable[Hashable], event: Event) -> None:
+        if self._loop is None or self._loop.is_closed():
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._deliver(list(topics), event)
+        else:
+            self._loop.call_soon_threadsafe(self._deliver, list(topics), event)
+
+    def _deliver(self, topics: list[Hashable], event: Event) -> None:
+        for topic in topics:
+            for subscription in list(self._topics.get(topic, ())):
+                subscription.deliver(event)
+
+
+broker = Broker()
+
+
+async def stream_events(
+    subscription: Subscription,
+    replay: Iterable[Event] = (),
+    heartbeat: float = settings.EVENTS_HEARTBEAT_SECONDS,
+) -> AsyncIterator[str]:
+    """
+    Yields server-sent events, starting with the replayed ones. Live events already
+    covered by the replay are skipped, a comment is sent when idle for ``heartbeat``
+    seconds to keep the connection open.
+    """
+    last_id = 0
+    try:
+        for event in replay:
+            last_id = event.id
+            yield event.encode()
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            if event is None:
+                return
+            if event.id > last_id:
+                yield event.encode()
+    finally:
+        subscription.broker.unsubscribe(subscription)
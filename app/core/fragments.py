@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+from typing import Iterable, Type
+
+from pydantic import BaseModel
+
+from app.core import settings
+from app.core.invalidation import invalidation_bus, key_id
+from app.core.serialization import render_json
+from app.models.users import User
+from app.schemas.users import UserSchema
+
+AUTHOR_KEY = b',"author":'
+MISSING_AUTHOR = b"null"
+
+
+class AuthorFragmentCache:
+    """
+    The JSON of authors, keyed by user id and profile version. A change to a user
+    or its profile moves the version, so an entry is never served after it. The
+    entries of changed users are dropped on every worker by the invalidation bus.
+    """
+
+    def __init__(self, max_entries: int = settings.AUTHOR_FRAGMENT_CACHE_SIZE):
+        self.max_entries = max_entries
+        # Lists are rendered in the threadpool
+        self._lock = threading.Lock()
+        self._fragments: OrderedDict[tuple[int, int], bytes] = OrderedDict()
+
+    def get(self, author: User) -> bytes:
+        key = (author.id, author.profile_version)
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self._fragments.move_to_end(key)
+                return fragment
+        fragment = render_json(UserSchema, author)
+        with self._lock:
+            self._fragments[key] = fragment
+            if len(self._fragments) > self.max_entries:
+                self._fragments.popitem(last=False)
+        return fragment
+
+    def evict(self, user_ids: Iterable[int]) -> None:
+        user_ids = set(user_ids)
+        with self._lock:
+            for key in [key for key in self._fragments if key[0] in user_ids]:
+                del self._fragments[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._fragments.clear()
+
+
+author_fragments = AuthorFragmentCache()
+invalidation_bus.subscribe(
+    "user:",
+    lambda key, version: author_fragments.evict([key_id(key)]),
+    author_fragments.clear,
+)
+
+
+def render_articles(fields_schema: Type[BaseModel], articles) -> bytes:
+    """
+    Renders a list of articles with the JSON of their authors spliced in from the
+    cache, so the cost of the authors grows with the number of distinct authors.
+
+    :param fields_schema: The schema of the articles without their author
+    """
+    fragments = []
+    for article in articles:
+        fields = render_json(fields_schema, article)
+        # Authors missing from the main database are rendered as null
+        author = MISSING_AUTHOR
+        if article.author is not None:
+            author = author_fragments.get(article.author)
+        fragments.append(fields[:-1] + AUTHOR_KEY + author + b"}")
+    return b"[" + b",".join(fragments) + b"]"
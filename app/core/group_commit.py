@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from typing import Callable, Generic, TypeVar
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core import settings
+from app.core.sharding import close_shard_sessions
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class PendingBatch:
+    def __init__(self):
+        self.items: list = []
+        self.futures: list[asyncio.Future] = []
+        self.timer: asyncio.TimerHandle | None = None
+
+
+class GroupCommitter(Generic[T, R]):
+    """
+    Collects items submitted within ``window`` seconds of the first one and writes
+    them with a single call of ``write`` in one transaction, so concurrent writers
+    share a commit. Every caller gets the result for its own item. If the batch
+    fails, its items are written again one by one, and an error only reaches the
+    caller whose item caused it.
+
+    :param write: Writes and commits the items with the given session, returning
+        one result per item in the same order
+    """
+
+    def __init__(
+        self,
+        write: Callable[[list[T], Session], list[R]],
+        window: float = settings.ARTICLE_GROUP_COMMIT_WINDOW,
+        max_size: int = settings.ARTICLE_GROUP_COMMIT_MAX_SIZE,
+    ):
+        self.write = write
+        self.window = window
+        self.max_size = max_size
+        self._batches: dict[Engine, PendingBatch] = {}
+        # Keeps running batches from being garbage collected
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, item: T, bind: Engine) -> R:
+        loop = asyncio.get_running_loop()
+        batch = self._batches.get(bind)
+        if batch is None:
+            batch = self._batches[bind] = PendingBatch()
+            batch.timer = loop.call_later(self.window, self._start, bind, batch)
+        future = loop.create_future()
+        batch.items.append(item)
+        batch.futures.append(future)
+        if len(batch.items) >= self.max_size:
+            batch.timer.cancel()
+            self._start(bind, batch)
+        return await future
+
+    def _start(self, bind: Engine, batch: PendingBatch) -> None:
+        if self._batches.get(bind) is batch:
+            del self._batches[bind]
+        task = asyncio.ensure_future(self._run(bind, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _write(self, bind: Engine, items: list[T]) -> list[R]:
+        with Session(bind=bind, autoflush=False) as db_session:
+            try:
+                return self.write(items, db_session)
+            finally:
+                close_shard_sessions(db_session)
+
+    async def _run(self, bind: Engine, batch: PendingBatch) -> None:
+        try:
+            results = await run_in_threadpool(self._write, bind, batch.items)
+        except Exception as exc:
+            if len(batch.items) == 1:
+                set_outcome(batch.futures[0], exception=exc)
+                return
+            logger.warning(
+                "Group commit of %d items failed, writing them one by one",
+                len(batch.items),
+                exc_info=True,
+            )
+            for item, future in zip(batch.items, batch.futures):
+                try:
+                    (result,) = await run_in_threadpool(self._write, bind, [item])
+                except Exception as exc:
+                    set_outcome(future, exception=exc)
+                else:
+                    set_outcome(future, result=result)
+            return
+        for future, result in zip(batch.futures, results):
+            set_outcome(future, result=result)
+
+
+def set_outcome(future: asyncio.Future, result=None, exception=None) -> None:
+    # Callers that went away have cancelled their future
+    if future.done():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
@@ -0,0 +1,370 @@
+import asyncio
+import json
+import logging
+import queue
+import select
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Protocol
+
+from sqlalchemy import delete, event, func, insert, text
+from sqlalchemy import select as select_rows
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.core import settings
+from app.models.invalidations import CacheInvalidation
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Invalidation:
+    key: str
+    version: int
+
+    def encode(self) -> str:
+        return json.dumps([self.key, self.version])
+
+    @classmethod
+    def decode(cls, payload: str) -> "Invalidation":
+        key, version = json.loads(payload)
+        return cls(key, version)
+
+
+def user_key(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def author_articles_key(author_id: int) -> str:
+    return f"articles:author:{author_id}"
+
+
+def key_id(key: str) -> int:
+    return int(key.rsplit(":", 1)[1])
+
+
+class Transport(Protocol):
+    def publish(self, payloads: list[str]) -> None:
+        ...
+
+    def listen(
+        self,
+        deliver: Callable[[str], None],
+        connected: Callable[[], None],
+        stopped: threading.Event,
+    ) -> None:
+        """Delivers payloads of all workers until stopped or disconnected."""
+
+
+class NotifyTransport:
+    """
+    Postgres LISTEN/NOTIFY on one channel. Notifications sent while a worker is not
+    listening are lost, so the bus clears its caches whenever it reconnects.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        channel: str = settings.INVALIDATION_CHANNEL,
+        wait: float = settings.INVALIDATION_POLL_INTERVAL,
+    ):
+        self.engine = engine
+        self.channel = channel
+        self.wait = wait
+
+    def publish(self, payloads: list[str]) -> None:
+        with self.engine.connect() as connection:
+            connection.execute(
+                text(
+                    "SELECT pg_notify(:channel, payload) "
+                    "FROM unnest(CAST(:payloads AS text[])) AS payload"
+                ),
+                {"channel": self.channel, "payloads": payloads},
+            )
+            connection.commit()
+
+    def listen(self, deliver, connected, stopped) -> None:
+        raw_connection = self.engine.raw_connection()
+        # Kept out of the pool, the connection listens for as long as the worker runs
+        raw_connection.detach()
+        try:
+            connection = raw_connection.driver_connection
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+            connected()
+            while not stopped.is_set():
+                readable, _, _ = select.select([connection], [], [], self.wait)
+                if not readable:
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    deliver(connection.notifies.pop(0).payload)
+        finally:
+            raw_connection.close()
+
+
+class PollingTransport:
+    """
+    Keeps invalidations in a table polled by every worker, for databases without
+    LISTEN/NOTIFY such as the SQLite database of the tests. Invalidations reach
+    other workers within ``interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        interval: float = settings.INVALIDATION_POLL_INTERVAL,
+        retention: int = settings.INVALIDATION_RETENTION_SECONDS,
+    ):
+        self.engine = engine
+        self.interval = interval
+        self.retention = retention
+        self.last_id: int | None = None
+
+    def publish(self, payloads: list[str]) -> None:
+        with Session(bind=self.engine) as db_session:
+            db_session.execute(
+                insert(CacheInvalidation),
+                [{"payload": payload} for payload in payloads],
+            )
+            db_session.execute(
+                delete(CacheInvalidation).where(
+                    CacheInvalidation.created_at
+                    < datetime.now() - timedelta(seconds=self.retention)
+                )
+            )
+            db_session.commit()
+
+    def poll(self) -> list[str]:
+        with Session(bind=self.engine) as db_session:
+            if self.last_id is None:
+                # Only invalidations published from now on are of interest
+                self.last_id = db_session.scalar(
+                    select_rows(func.max(CacheInvalidation.id))
+                )
+                self.last_id = self.last_id or 0
+                return []
+            rows = db_session.execute(
+                select_rows(CacheInvalidation.id, CacheInvalidation.payload)
+                .where(CacheInvalidation.id > self.last_id)
+                .order_by(CacheInvalidation.id)
+            ).all()
+        if rows:
+            self.last_id = rows[-1].id
+        return [row.payload for row in rows]
+
+    def listen(self, deliver, connected, stopped) -> None:
+        self.poll()
+        connected()
+        while not stopped.wait(self.interval):
+            for payload in self.poll():
+                deliver(payload)
+
+
+def transport_for(engine: Engine, kind: str = settings.INVALIDATION_BUS):
+    if kind == "auto":
+        kind = "notify" if engine.dialect.name == "postgresql" else "polling"
+    if kind == "notify":
+        return NotifyTransport(engine)
+    if kind == "polling":
+        return PollingTransport(engine)
+    return None
+
+
+@dataclass
+class Subscriber:
+    prefix: str
+    evict: Callable[[str, int], None]
+    clear: Callable[[], None]
+
+
+class InvalidationBus:
+    """
+    Evicts cached data on every worker. Writes record the keys they change with
+    ``invalidate``, and the keys are published once the session commits. A worker
+    applies its own invalidations right away and those of other workers as they
+    arrive. Every key carries a version, so late and repeated invalidations are
+    ignored. Subscribers are called on the event loop.
+    """
+
+    def __init__(self, max_keys: int = settings.INVALIDATION_MAX_KEYS):
+        self.max_keys = max_keys
+        self._subscribers: list[Subscriber] = []
+        self._versions: OrderedDict[str, int] = OrderedDict()
+        # Invalidations are applied from request threads and the listener
+        self._lock = threading.Lock()
+        self._transport: Transport | None = None
+        self._outbox = queue.SimpleQueue()
+        self._stopped = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def subscribe(
+        self, prefix: str, evict: Callable[[str, int], None], clear: Callable[[], None]
+    ) -> None:
+        """
+        :param prefix: Keys of interest start with it
+        :param evict: Called with the key and version of every new invalidation
+        :param clear: Called when invalidations may have been missed
+        """
+        self._subscribers.append(Subscriber(prefix, evict, clear))
+
+    def publish(self, invalidations: Iterable[Invalidation]) -> None:
+        invalidations = self.apply(invalidations)
+        if invalidations and self._transport is not None:
+            for invalidation in invalidations:
+                self._outbox.put(invalidation.encode())
+
+    def apply(self, invalidations: Iterable[Invalidation]) -> list[Invalidation]:
+        """
+        Evicts the data behind invalidations newer than the ones seen before.
+
+        :return: The invalidations that were new
+        """
+        fresh = []
+        with self._lock:
+            for invalidation in invalidations:
+                seen = self._versions.get(invalidation.key)
+                if seen is not None and seen >= invalidation.version:
+                    continue
+                self._versions[invalidation.key] = invalidation.version
+                self._versions.move_to_end(invalidation.key)
+                if len(self._versions) > self.max_keys:
+                    self._versions.popitem(last=False)
+                fresh.append(invalidation)
+        if fresh:
+            self._call_on_loop(self._evict, fresh)
+        return fresh
+
+    def reset(self) -> None:
+        with self._lock:
+            self._versions.clear()
+        self._call_on_loop(self._clear)
+
+    def _evict(self, invalidations: list[Invalidation]) -> None:
+        for invalidation in invalidations:
+            for subscriber in self._subscribers:
+                if invalidation.key.startswith(subscriber.prefix):
+                    subscriber.evict(invalidation.key, invalidation.version)
+
+    def _clear(self) -> None:
+        for subscriber in self._subscribers:
+            subscriber.clear()
+
+    def _call_on_loop(self, func: Callable, *args) -> None:
+        if self._loop is None or self._loop.is_closed():
+            func(*args)
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            func(*args)
+        else:
+            self._loop.call_soon_threadsafe(func, *args)
+
+    def _receive(self, payload: str) -> None:
+        try:
+            invalidation = Invalidation.decode(payload)
+        except (ValueError, TypeError):
+            logger.warning("Ignoring malformed invalidation %r", payload)
+            return
+        self.apply([invalidation])
+
+    def _listen(self) -> None:
+        connections = 0
+
+        def connected() -> None:
+            nonlocal connections
+            connections += 1
+            if connections > 1:
+                # Invalidations published while reconnecting were missed
+                self.reset()
+
+        while not self._stopped.is_set():
+            try:
+                self._transport.listen(self._receive, connected, self._stopped)
+            except Exception:
+                logger.exception("Invalidation listener failed, reconnecting")
+                self._stopped.wait(settings.INVALIDATION_POLL_INTERVAL)
+
+    def _send(self) -> None:
+        while True:
+            payloads = [self._outbox.get()]
+            while not self._outbox.empty():
+                payloads.append(self._outbox.get())
+            stopping = None in payloads
+            payloads = [payload for payload in payloads if payload is not None]
+            if payloads:
+                try:
+                    self._transport.publish(payloads)
+                except Exception:
+                    logger.exception(
+                        "Failed to publish %d invalidations", len(payloads)
+                    )
+            if stopping:
+                return
+
+    def start(self, transport: Transport | None) -> None:
+        """
+        Connects the bus to the other workers. Without a transport, invalidations
+        only reach the caches of this worker.
+        """
+        if transport is None:
+            return
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._loop = None
+        self._transport = transport
+        self._stopped.clear()
+        self._threads = [
+            threading.Thread(target=self._listen, name="invalidation-listener"),
+            threading.Thread(target=self._send, name="invalidation-sender"),
+        ]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def stop(self) -> None:
+        if self._transport is None:
+            return
+        self._stopped.set()
+        self._outbox.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._transport = None
+        self._loop = None
+
+
+invalidation_bus = InvalidationBus()
+
+
+def invalidate(db_session: Session, key: str, version: int) -> None:
+    """
+    Records that the transaction of the session changes the data behind ``key``.
+    The key is published with the highest recorded version once the session
+    commits, and dropped if it rolls back.
+    """
+    pending = db_session.info.setdefault("invalidations", {})
+    pending[key] = max(version, pending.get(key, version))
+
+
+@event.listens_for(Session, "after_commit")
+def publish_invalidations(session: Session) -> None:
+    pending = session.info.pop("invalidations", None)
+    if pending:
+        invalidation_bus.publish(
+            Invalidation(key, version) for key, version in pending.items()
+        )
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_invalidations(session: Session) -> None:
+    session.info.pop("invalidations", None)
@@ -0,0 +1,213 @@
+import importlib
+import logging
+import random
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable
+
+from sqlalchemy import and_, or_, select, update, delete
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.core import settings
+from app.core.enums import JobStatus
+from app.core.sharding import close_shard_sessions
+from app.models.jobs import Job
+
+logger = logging.getLogger(__name__)
+
+# Modules registering job handlers, imported whenever a worker is created
+JOB_MODULES = [
+    "app.core.sweeper",
+    "app.core.partitions",
+    "app.controllers.changes",
+    "app.controllers.uploads",
+]
+
+handlers: dict[str, Callable] = {}
+
+
+def job(name: str):
+    """
+    Registers the decorated function as the handler for jobs with the given name.
+    Handlers are called as ``handler(db_session, **payload)`` and the session is
+    committed by the worker once the handler returns.
+
+    :param name: The name the job is enqueued under
+    """
+
+    def decorator(func: Callable) -> Callable:
+        handlers[name] = func
+        return func
+
+    return decorator
+
+
+def enqueue(
+    db_session: Session, name: str, run_at: datetime | None = None, **payload
+) -> Job:
+    """
+    Adds a job to the session without committing it, so the job is persisted in the
+    same transaction as the change that caused it.
+
+    :param db_session: The session holding the domain change
+    :param name: The name of a registered job handler
+    :param run_at: When the job becomes due, immediately if not provided
+    :param payload: JSON-serializable keyword arguments for the handler
+    :return: The pending job
+    """
+    pending_job = Job(
+        name=name,
+        payload=payload,
+        run_at=run_at or datetime.now(),
+        max_attempts=settings.JOBS_MAX_ATTEMPTS,
+    )
+    db_session.add(pending_job)
+    return pending_job
+
+
+def ensure_scheduled(db_session: Session, name: str) -> None:
+    """
+    Enqueues and commits a job unless one with the same name is already waiting or
+    running. Used to start self-rescheduling maintenance jobs.
+    """
+    scheduled = (
+        db_session.query(Job.id)
+        .filter(Job.name == name, Job.status != JobStatus.failed)
+        .first()
+    )
+    if scheduled is None:
+        enqueue(db_session, name)
+        db_session.commit()
+
+
+def load_handlers() -> None:
+    for module in JOB_MODULES:
+        importlib.import_module(module)
+
+
+def backoff(attempts: int) -> timedelta:
+    delay = min(settings.JOBS_BACKOFF_BASE**attempts, settings.JOBS_BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def claim_jobs(db_session: Session, limit: int, visibility_timeout: int) -> list[int]:
+    """
+    Claims up to ``limit`` due jobs. A claimed job is hidden from other workers
+    until its visibility timeout expires, after which it is picked up again.
+
+    :return: The ids of the claimed jobs
+    """
+    now = datetime.now()
+    claimable = or_(
+        and_(Job.status == JobStatus.pending, Job.run_at <= now),
+        and_(Job.status == JobStatus.running, Job.locked_until < now),
+    )
+    candidates = db_session.scalars(
+        select(Job.id)
+        .where(claimable)
+        .order_by(Job.run_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not candidates:
+        db_session.rollback()
+        return []
+    claimed = db_session.scalars(
+        update(Job)
+        .where(Job.id.in_(candidates), claimable)
+        .values(
+            status=JobStatus.running,
+            attempts=Job.attempts + 1,
+            locked_until=now + timedelta(seconds=visibility_timeout),
+        )
+        .returning(Job.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db_session.commit()
+    return claimed
+
+
+class JobWorker:
+    def __init__(
+        self,
+        session_factory: sessionmaker,
+        concurrency: int = settings.JOBS_WORKER_CONCURRENCY,
+        visibility_timeout: int = settings.JOBS_VISIBILITY_TIMEOUT,
+        poll_interval: float = settings.JOBS_POLL_INTERVAL,
+    ):
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="job"
+        )
+        self._stopped = threading.Event()
+        self._thread = None
+        load_handlers()
+
+    def run_job(self, job_id: int) -> None:
+        with self.session_factory() as db_session:
+            claimed = db_session.get(Job, job_id)
+            if claimed is None:
+                # Deleted since it was claimed, there is nothing left to run
+                return
+            try:
+                handler = handlers[claimed.name]
+                handler(db_session, **claimed.payload)
+                db_session.execute(delete(Job).where(Job.id == job_id))
+                db_session.commit()
+            except Exception:
+                db_session.rollback()
+                logger.exception("Job %s (%s) failed", job_id, claimed.name)
+                self.fail_job(db_session, claimed, traceback.format_exc())
+            finally:
+                close_shard_sessions(db_session)
+
+    @staticmethod
+    def fail_job(db_session: Session, failed_job: Job, error: str) -> None:
+        failed_job.last_error = error
+        failed_job.locked_until = None
+        if failed_job.attempts >= failed_job.max_attempts:
+            failed_job.status = JobStatus.failed
+        else:
+            failed_job.status = JobStatus.pending
+            failed_job.run_at = datetime.now() + backoff(failed_job.attempts)
+        db_session.commit()
+
+    def run_once(self) -> int:
+        """
+        Claims a batch of due jobs and runs them concurrently, waiting for all of
+        them to finish.
+
+        :return: The number of jobs that were run
+        """
+        with self.session_factory() as db_session:
+            claimed = claim_jobs(db_session, self.concurrency, self.visibility_timeout)
+        list(self._executor.map(self.run_job, claimed))
+        return len(claimed)
+
+    def run_forever(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                processed = self.run_once()
+            except Exception:
+                logger.exception("Failed to claim jobs")
+                processed = 0
+            if not processed:
+                self._stopped.wait(self.poll_interval)
+
+    def start(self) -> None:
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self.run_forever, name="job-worker", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
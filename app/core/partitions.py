@@ -0,0 +1,182 @@
+import re
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import column, delete, event, func, select, table, text, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.core import settings
+from app.core.jobs import job, enqueue
+from app.core.sharding import SHARD_METADATA, shard_router
+from app.models.articles import Article, ArticleBody, ArticleStat
+
+PARENT_TABLE = Article.__tablename__
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+ARCHIVE_SCHEMA = "archive"
+PARTITION_NAME_PATTERN = re.compile(rf"^{PARENT_TABLE}_p(\d{{4}})(\d{{2}})$")
+MAINTENANCE_INTERVAL = timedelta(days=1)
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_p{month.year:04d}{month.month:02d}"
+
+
+def partition_month(name: str) -> date | None:
+    match = PARTITION_NAME_PATTERN.match(name)
+    if match is None:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def partition_ddl(month: date) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} "
+        f"PARTITION OF {PARENT_TABLE} "
+        f"FOR VALUES FROM ('{month.isoformat()}') "
+        f"TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+def list_article_partitions(connection: Connection) -> list[str]:
+    return list(
+        connection.scalars(
+            text(
+                "SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+                "WHERE parent.relname = :parent"
+            ),
+            {"parent": PARENT_TABLE},
+        )
+    )
+
+
+def ensure_article_partitions(
+    connection: Connection,
+    months_ahead: int = settings.ARTICLES_PARTITIONS_AHEAD,
+    today: date | None = None,
+) -> list[str]:
+    """
+    Creates monthly partitions of the articles table from the current month up to
+    ``months_ahead`` months in the future, plus a default partition catching rows
+    outside of any range.
+
+    :param connection: A connection to the Postgres database
+    :param months_ahead: How many future months should have a partition
+    :param today: The date to count from, defaults to today
+    :return: The names of the partitions that did not exist before
+    """
+    existing = set(list_article_partitions(connection))
+    current = month_start(today or date.today())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if partition_name(month) not in existing:
+            connection.execute(text(partition_ddl(month)))
+            created.append(partition_name(month))
+    if DEFAULT_PARTITION not in existing:
+        connection.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} "
+                f"PARTITION OF {PARENT_TABLE} DEFAULT"
+            )
+        )
+    return created
+
+
+def subtract_partition_stats(connection: Connection, name: str, month: date) -> None:
+    """
+    Takes the articles of a detached partition out of the daily counters, and removes
+    the counters of the month that are left at zero.
+    """
+    partition = table(name, column("author_id"), column("created_at"))
+    day = func.date(partition.c.created_at)
+    dropped = (
+        select(partition.c.author_id, day.label("day"), func.count().label("count"))
+        .group_by(partition.c.author_id, day)
+        .subquery()
+    )
+    connection.execute(
+        update(ArticleStat)
+        .where(
+            ArticleStat.author_id == dropped.c.author_id,
+            ArticleStat.day == dropped.c.day,
+        )
+        .values(count=ArticleStat.count - dropped.c.count)
+    )
+    connection.execute(
+        delete(ArticleStat).where(
+            ArticleStat.count <= 0,
+            ArticleStat.day >= month,
+            ArticleStat.day < add_months(month, 1),
+        )
+    )
+
+
+def archive_article_partitions(
+    connection: Connection, before: date, drop: bool = False
+) -> list[str]:
+    """
+    Detaches the monthly partitions holding only rows created before the given month.
+    Detached partitions are moved to the archive schema, or dropped together with
+    their article bodies and counters if ``drop`` is set.
+
+    :param connection: A connection to the Postgres database
+    :param before: The first month that is kept attached
+    :param drop: Whether to drop the detached partitions instead of archiving them
+    :return: The names of the detached partitions
+    """
+    cutoff = month_start(before)
+    archived = []
+    for name in sorted(list_article_partitions(connection)):
+        month = partition_month(name)
+        if month is None or add_months(month, 1) > cutoff:
+            continue
+        connection.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+        if drop:
+            connection.execute(
+                text(
+                    f"DELETE FROM {ArticleBody.__tablename__} "
+                    f"WHERE article_id IN (SELECT id FROM {name})"
+                )
+            )
+            subtract_partition_stats(connection, name, month)
+            connection.execute(text(f"DROP TABLE {name}"))
+        else:
+            connection.execute(text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}"))
+            connection.execute(text(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}"))
+        archived.append(name)
+    return archived
+
+
+@event.listens_for(Article.__table__, "after_create")
+def create_initial_partitions(target, connection, **kwargs):
+    if settings.ARTICLES_PARTITIONED and connection.dialect.name == "postgresql":
+        ensure_article_partitions(connection)
+
+
+event.listen(
+    SHARD_METADATA.tables[PARENT_TABLE], "after_create", create_initial_partitions
+)
+
+
+@job("maintain_article_partitions")
+def maintain_article_partitions(db_session: Session) -> None:
+    ensure_article_partitions(db_session.connection())
+    for engine in shard_router.engines:
+        with engine.begin() as connection:
+            ensure_article_partitions(connection)
+    enqueue(
+        db_session,
+        "maintain_article_partitions",
+        run_at=datetime.now() + MAINTENANCE_INTERVAL,
+    )
@@ -0,0 +1,327 @@
+import cProfile
+import functools
+import inspect
+import json
+import os
+import random
+import re
+import secrets
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Callable
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from app.core import settings
+
+try:
+    import pyinstrument
+except ImportError:  # pragma: no cover - optional dependency
+    pyinstrument = None
+
+PROFILE_HEADER = "x-profile"
+CAPTURE_ID_PATTERN = re.compile(r"^\d{8}T\d{6}-[0-9a-f]{8}$")
+# Consecutive phases of a routed request, other phases overlap with them
+ROUTE_PHASES = ("dependencies", "endpoint", "serialization")
+
+
+@dataclass
+class Capture:
+    id: str
+    method: str
+    path: str
+    started_at: datetime
+    status_code: int | None = None
+    duration: float = 0.0
+    phases: dict[str, float] = field(default_factory=dict)
+    sql_queries: int = 0
+    format: str = "pstats"
+    # perf_counter() readings of the endpoint start and end, not stored
+    marks: dict[str, float] = field(default_factory=dict)
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        del data["marks"]
+        return data
+
+
+current_capture: ContextVar[Capture | None] = ContextVar(
+    "current_capture", default=None
+)
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Adds the time spent in the block to the given phase of the profiled request.
+    Does nothing when the current request is not profiled.
+    """
+    capture = current_capture.get()
+    if capture is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        capture.add(name, time.perf_counter() - started)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if current_capture.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    capture = current_capture.get()
+    if capture is not None and conn.info.get("query_started"):
+        capture.add("sql", time.perf_counter() - conn.info["query_started"].pop())
+        capture.sql_queries += 1
+
+
+@contextmanager
+def endpoint_marks():
+    capture = current_capture.get()
+    if capture is None:
+        yield
+        return
+    capture.marks["endpoint_started"] = time.perf_counter()
+    try:
+        yield
+    finally:
+        capture.marks["endpoint_finished"] = time.perf_counter()
+
+
+def timed_endpoint(endpoint: Callable) -> Callable:
+    if inspect.iscoroutinefunction(endpoint):
+
+        @functools.wraps(endpoint)
+        async def timed(*args, **kwargs):
+            with endpoint_marks():
+                return await endpoint(*args, **kwargs)
+
+    else:
+
+        @functools.wraps(endpoint)
+        def timed(*args, **kwargs):
+            with endpoint_marks():
+                return endpoint(*args, **kwargs)
+
+    return timed
+
+
+class ProfiledRoute(APIRoute):
+    """
+    Splits the time of profiled requests into dependency resolution, the endpoint
+    itself and the serialization of its result.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, timed_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def profiled_handler(request):
+            capture = current_capture.get()
+            if capture is None:
+                return await handler(request)
+            started = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                finished = time.perf_counter()
+                endpoint_started = capture.marks.get("endpoint_started", finished)
+                endpoint_finished = capture.marks.get("endpoint_finished", finished)
+                capture.add("dependencies", endpoint_started - started)
+                capture.add("endpoint", endpoint_finished - endpoint_started)
+                capture.add("serialization", finished - endpoint_finished)
+
+        return profiled_handler
+
+
+class ProfileStore:
+    """
+    Keeps the most recent ``max_captures`` profiles on disk, older ones are removed
+    when a new profile is saved.
+    """
+
+    def __init__(
+        self,
+        directory: str = settings.PROFILING_DIR,
+        max_captures: int = settings.PROFILING_MAX_CAPTURES,
+    ):
+        self.directory = directory
+        self.max_captures = max_captures
+
+    def metadata_path(self, capture_id: str) -> str:
+        return os.path.join(self.directory, f"{capture_id}.json")
+
+    def profile_path(self, capture: Capture) -> str:
+        extension = "html" if capture.format == "html" else "prof"
+        return os.path.join(self.directory, f"{capture.id}.{extension}")
+
+    def save(self, capture: Capture, write_profile: Callable[[str], None]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        write_profile(self.profile_path(capture))
+        with open(self.metadata_path(capture.id), "w") as f:
+            json.dump(capture.to_dict(), f, default=str)
+        for stale in self.list()[self.max_captures :]:
+            self.remove(stale)
+
+    def list(self) -> list[Capture]:
+        """Returns the stored captures, newest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        captures = []
+        for file_name in os.listdir(self.directory):
+            capture_id, ext = os.path.splitext(file_name)
+            if ext == ".json" and CAPTURE_ID_PATTERN.match(capture_id):
+                capture = self.get(capture_id)
+                if capture is not None:
+                    captures.append(capture)
+        return sorted(captures, key=lambda capture: capture.id, reverse=True)
+
+    def get(self, capture_id: str) -> Capture | None:
+        if not CAPTURE_ID_PATTERN.match(capture_id):
+            return None
+        try:
+            with open(self.metadata_path(capture_id)) as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        data["started_at"] = datetime.fromisoformat(data["started_at"])
+        return Capture(**data)
+
+    def remove(self, capture: Capture) -> None:
+        for path in (self.metadata_path(capture.id), self.profile_path(capture)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class RequestProfiler:
+    """
+    Decides which requests are profiled: requests carrying the profiling token in
+    the X-Profile header, and a random sample of all requests.
+    """
+
+    def __init__(
+        self,
+        token: str = settings.PROFILING_TOKEN,
+        sample_rate: float = settings.PROFILING_SAMPLE_RATE,
+        store: ProfileStore | None = None,
+    ):
+        self.token = token
+        self.sample_rate = sample_rate
+        self.store = store or ProfileStore()
+        self.active = False
+
+    def should_profile(self, headers: Headers) -> bool:
+        # Profilers hook into the whole thread, so requests are profiled one at a time
+        if self.active:
+            return False
+        requested = headers.get(PROFILE_HEADER)
+        if requested is not None and self.token:
+            return secrets.compare_digest(requested, self.token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @staticmethod
+    def new_capture(scope: Scope) -> Capture:
+        started_at = datetime.now()
+        return Capture(
+            id=f"{started_at:%Y%m%dT%H%M%S}-{secrets.token_hex(4)}",
+            method=scope["method"],
+            path=scope["path"],
+            started_at=started_at,
+            format="html" if pyinstrument is not None else "pstats",
+        )
+
+
+request_profiler = RequestProfiler()
+
+
+class CProfile:
+    """
+    Deterministic profiler of the event loop thread, code running in the threadpool
+    only shows up as time spent waiting for it.
+    """
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self) -> None:
+        self.profile.enable()
+
+    def stop(self) -> None:
+        self.profile.disable()
+
+    def write(self, path: str) -> None:
+        self.profile.dump_stats(path)
+
+
+class SamplingProfile:
+    """Statistical profiler attributing awaited time to the awaiting coroutine."""
+
+    def __init__(self):
+        self.profile = pyinstrument.Profiler(async_mode="enabled")
+
+    def start(self) -> None:
+        self.profile.start()
+
+    def stop(self) -> None:
+        self.profile.stop()
+
+    def write(self, path: str) -> None:
+        with open(path, "w") as f:
+            f.write(self.profile.output_html())
+
+
+class ProfilingMiddleware:
+    def __init__(self, app: ASGIApp, profiler: RequestProfiler | None = None):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        profiler = self.profiler or request_profiler
+        if scope["type"] != "http" or not profiler.should_profile(Headers(scope=scope)):
+            await self.app(scope, receive, send)
+            return
+
+        capture = profiler.new_capture(scope)
+
+        async def send_with_capture_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                capture.status_code = message["status"]
+                MutableHeaders(scope=message).append("X-Profile-Id", capture.id)
+            await send(message)
+
+        profile = SamplingProfile() if pyinstrument is not None else CProfile()
+        profiler.active = True
+        token = current_capture.set(capture)
+        started = time.perf_counter()
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_capture_id)
+        finally:
+            profile.stop()
+            capture.duration = time.perf_counter() - started
+            routed = sum(capture.phases.get(name, 0.0) for name in ROUTE_PHASES)
+            capture.add("other", capture.duration - routed)
+            current_capture.reset(token)
+            profiler.active = False
+            await run_in_threadpool(profiler.store.save, capture, profile.write)
@@ -0,0 +1,472 @@
+import asyncio
+import hashlib
+import hmac
+import random
+import threading
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from typing import Coroutine
+from urllib.parse import quote, urlsplit
+from xml.etree import ElementTree
+
+import httpx
+from fastapi import UploadFile
+
+from app.core import settings
+from app.core.storage import Storage
+
+ALGORITHM = "AWS4-HMAC-SHA256"
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+# S3 rejects multipart uploads with a part, other than the last one, below 5 MiB
+MIN_PART_SIZE = 5 * 1024 * 1024
+RETRY_BASE_DELAY = 0.1
+RETRY_MAX_DELAY = 5.0
+
+
+class S3Error(Exception):
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"S3 request failed with status {status_code}: {body}")
+        self.status_code = status_code
+        self.body = body
+
+
+def uri_encode(value: str, safe: str = "") -> str:
+    return quote(value, safe="-_.~" + safe)
+
+
+def canonical_query(params: dict[str, str]) -> str:
+    return "&".join(
+        f"{uri_encode(key)}={uri_encode(str(value))}"
+        for key, value in sorted(params.items())
+    )
+
+
+def signing_key(secret_key: str, day: str, region: str, service: str) -> bytes:
+    key = f"AWS4{secret_key}".encode()
+    for part in (day, region, service, "aws4_request"):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    return key
+
+
+def signature(
+    secret_key: str,
+    region: str,
+    amz_date: str,
+    method: str,
+    path: str,
+    query: dict[str, str],
+    headers: dict[str, str],
+    payload_hash: str,
+    service: str = "s3",
+) -> str:
+    """
+    Computes an AWS Signature Version 4 over a request.
+
+    :param amz_date: The request time, formatted as ``%Y%m%dT%H%M%SZ``
+    :param path: The URL path, not encoded yet
+    :param headers: The signed headers, with lowercase names
+    """
+    signed_headers = ";".join(sorted(headers))
+    canonical_request = "\n".join(
+        [
+            method,
+            uri_encode(path, safe="/"),
+            canonical_query(query),
+            "".join(f"{name}:{headers[name].strip()}\n" for name in sorted(headers)),
+            signed_headers,
+            payload_hash,
+        ]
+    )
+    day = amz_date[:8]
+    string_to_sign = "\n".join(
+        [
+            ALGORITHM,
+            amz_date,
+            f"{day}/{region}/{service}/aws4_request",
+            hashlib.sha256(canonical_request.encode()).hexdigest(),
+        ]
+    )
+    key = signing_key(secret_key, day, region, service)
+    return hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+
+def amz_now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def local_name(element: ElementTree.Element) -> str:
+    return element.tag.rsplit("}", 1)[-1]
+
+
+def find_text(element: ElementTree.Element, name: str) -> str | None:
+    # Responses are namespaced by AWS but not necessarily by compatible servers
+    for child in element.iter():
+        if local_name(child) == name:
+            return child.text
+    return None
+
+
+class S3Client:
+    """
+    Async client for the subset of the S3 API used for storage, with path style
+    URLs. Requests share one connection pool and are retried with exponential
+    backoff and jitter on connection errors, throttling and server errors.
+    """
+
+    def __init__(
+        self,
+        endpoint_url: str,
+        bucket: str,
+        region: str,
+        access_key_id: str,
+        secret_access_key: str,
+        max_connections: int = settings.S3_MAX_CONNECTIONS,
+        max_retries: int = settings.S3_MAX_RETRIES,
+        timeout: float = settings.S3_TIMEOUT,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.host = urlsplit(self.endpoint_url).netloc
+        self.bucket = bucket
+        self.region = region
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.max_retries = max_retries
+        self.http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            timeout=timeout,
+            transport=transport,
+        )
+
+    def object_path(self, key: str) -> str:
+        return f"/{self.bucket}/{key}"
+
+    def signed_headers(
+        self, method: str, path: str, query: dict[str, str], payload: bytes
+    ) -> dict[str, str]:
+        amz_date = amz_now()
+        payload_hash = hashlib.sha256(payload).hexdigest()
+        headers = {
+            "host": self.host,
+            "x-amz-content-sha256": payload_hash,
+            "x-amz-date": amz_date,
+        }
+        request_signature = signature(
+            self.secret_access_key,
+            self.region,
+            amz_date,
+            method,
+            path,
+            query,
+            headers,
+            payload_hash,
+        )
+        headers["authorization"] = (
+            f"{ALGORITHM} Credential={self.access_key_id}/{amz_date[:8]}/"
+            f"{self.region}/s3/aws4_request, "
+            f"SignedHeaders={';'.join(sorted(headers))}, "
+            f"Signature={request_signature}"
+        )
+        return headers
+
+    def url(self, path: str, query: dict[str, str]) -> str:
+        url = self.endpoint_url + uri_encode(path, safe="/")
+        return f"{url}?{canonical_query(query)}" if query else url
+
+    async def retry_delay(self, attempt: int) -> None:
+        delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt)
+        await asyncio.sleep(random.uniform(0, delay))
+
+    async def request(
+        self,
+        method: str,
+        key: str,
+        query: dict[str, str] | None = None,
+        payload: bytes = b"",
+        headers: dict[str, str] | None = None,
+    ) -> httpx.Response:
+        path = self.object_path(key)
+        query = query or {}
+        attempt = 0
+        while True:
+            # Signed again on every attempt, signatures are only valid for a while
+            request_headers = self.signed_headers(method, path, query, payload)
+            request_headers.update(headers or {})
+            try:
+                response = await self.http.request(
+                    method,
+                    self.url(path, query),
+                    content=payload,
+                    headers=request_headers,
+                )
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                retryable = response.status_code >= 500 or response.status_code == 429
+                if not retryable or attempt >= self.max_retries:
+                    if response.is_error:
+                        raise S3Error(response.status_code, response.text)
+                    return response
+            await self.retry_delay(attempt)
+            attempt += 1
+
+    async def put_object(
+        self, key: str, data: bytes, content_type: str | None = None
+    ) -> None:
+        headers = {"content-type": content_type} if content_type else None
+        await self.request("PUT", key, payload=data, headers=headers)
+
+    async def delete_object(self, key: str) -> None:
+        await self.request("DELETE", key)
+
+    async def object_sha256(self, key: str) -> str:
+        path = self.object_path(key)
+        attempt = 0
+        while True:
+            digest = hashlib.sha256()
+            try:
+                async with self.http.stream(
+                    "GET",
+                    self.url(path, {}),
+                    headers=self.signed_headers("GET", path, {}, b""),
+                ) as response:
+                    retryable = (
+                        response.status_code >= 500 or response.status_code == 429
+                    )
+                    if not retryable or attempt >= self.max_retries:
+                        if response.is_error:
+                            await response.aread()
+                            raise S3Error(response.status_code, response.text)
+                        async for block in response.aiter_bytes():
+                            digest.update(block)
+                        return digest.hexdigest()
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    raise
+            await self.retry_delay(attempt)
+            attempt += 1
+
+    async def create_multipart_upload(
+        self, key: str, content_type: str | None = None
+    ) -> str:
+        headers = {"content-type": content_type} if content_type else None
+        response = await self.request("POST", key, {"uploads": ""}, headers=headers)
+        return find_text(ElementTree.fromstring(response.content), "UploadId")
+
+    async def upload_part(
+        self, key: str, upload_id: str, part_number: int, data: bytes
+    ) -> dict:
+        response = await self.request(
+            "PUT",
+            key,
+            {"partNumber": str(part_number), "uploadId": upload_id},
+            payload=data,
+        )
+        return {"PartNumber": part_number, "ETag": response.headers["etag"]}
+
+    async def list_parts(self, key: str, upload_id: str) -> list[dict]:
+        parts = []
+        query = {"uploadId": upload_id}
+        while True:
+            response = await self.request("GET", key, query)
+            root = ElementTree.fromstring(response.content)
+            for element in root:
+                if local_name(element) == "Part":
+                    parts.append(
+                        {
+                            "PartNumber": int(find_text(element, "PartNumber")),
+                            "ETag": find_text(element, "ETag"),
+                        }
+                    )
+            if find_text(root, "IsTruncated") != "true":
+                return parts
+            query = {
+                "uploadId": upload_id,
+                "part-number-marker": find_text(root, "NextPartNumberMarker"),
+            }
+
+    async def complete_multipart_upload(
+        self, key: str, upload_id: str, parts: list[dict]
+    ) -> None:
+        payload = "".join(
+            f"<Part><PartNumber>{part['PartNumber']}</PartNumber>"
+            f"<ETag>{part['ETag']}</ETag></Part>"
+            for part in sorted(parts, key=lambda part: part["PartNumber"])
+        )
+        payload = f"<CompleteMultipartUpload>{payload}</CompleteMultipartUpload>"
+        response = await self.request(
+            "POST", key, {"uploadId": upload_id}, payload=payload.encode()
+        )
+        # Failures after the upload started are reported with a 200 status
+        if local_name(ElementTree.fromstring(response.content)) == "Error":
+            raise S3Error(response.status_code, response.text)
+
+    async def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        await self.request("DELETE", key, {"uploadId": upload_id})
+
+    def presign_get(self, key: str, expires: int) -> str:
+        path = self.object_path(key)
+        amz_date = amz_now()
+        query = {
+            "X-Amz-Algorithm": ALGORITHM,
+            "X-Amz-Credential": (
+                f"{self.access_key_id}/{amz_date[:8]}/{self.region}/s3/aws4_request"
+            ),
+            "X-Amz-Date": amz_date,
+            "X-Amz-Expires": str(expires),
+            "X-Amz-SignedHeaders": "host",
+        }
+        query["X-Amz-Signature"] = signature(
+            self.secret_access_key,
+            self.region,
+            amz_date,
+            "GET",
+            path,
+            query,
+            {"host": self.host},
+            UNSIGNED_PAYLOAD,
+        )
+        return self.url(path, query)
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
+
+
+class S3Storage(Storage):
+    """
+    Stores files in an S3 compatible bucket. The storage interface is synchronous,
+    so requests run on an event loop of their own, which lets every thread share
+    one connection pool and keeps several parts of a file in flight at once.
+
+    Resumable uploads map to multipart uploads, a chunk written at ``offset``
+    becomes part ``offset // min_chunk_size + 1``.
+    """
+
+    min_chunk_size = MIN_PART_SIZE
+
+    def __init__(
+        self,
+        client: S3Client,
+        prefix: str = "",
+        multipart_threshold: int = settings.S3_MULTIPART_THRESHOLD,
+        part_size: int = settings.S3_PART_SIZE,
+        presign_expires: int = settings.S3_PRESIGN_EXPIRES,
+        max_concurrency: int = settings.S3_MAX_CONNECTIONS,
+    ):
+        self.client = client
+        self.prefix = prefix
+        self.multipart_threshold = max(multipart_threshold, MIN_PART_SIZE)
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.presign_expires = presign_expires
+        self.max_concurrency = max_concurrency
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="s3-storage", daemon=True
+        )
+        self._thread.start()
+
+    @classmethod
+    def from_settings(cls) -> "S3Storage":
+        client = S3Client(
+            settings.S3_ENDPOINT_URL,
+            settings.S3_BUCKET,
+            settings.S3_REGION,
+            settings.S3_ACCESS_KEY_ID,
+            settings.S3_SECRET_ACCESS_KEY,
+        )
+        return cls(client, prefix=settings.S3_PREFIX)
+
+    def _submit(self, coroutine: Coroutine) -> Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def _run(self, coroutine: Coroutine):
+        return self._submit(coroutine).result()
+
+    def key(self, filename: str) -> str:
+        return f"{self.prefix}{filename}"
+
+    def upload(self, file: UploadFile) -> str:
+        key = self.key(file.filename)
+        data = file.file.read(self.multipart_threshold + 1)
+        if len(data) <= self.multipart_threshold:
+            self._run(self.client.put_object(key, data, file.content_type))
+            return key
+
+        upload_id = self._run(
+            self.client.create_multipart_upload(key, file.content_type)
+        )
+        parts, pending = [], deque()
+        try:
+            part_number = 0
+            while data:
+                # Every part but the last is full, the file is read while earlier
+                # parts are still being sent
+                while len(data) < self.part_size:
+                    more = file.file.read(self.part_size)
+                    if not more:
+                        break
+                    data += more
+                part, data = data[: self.part_size], data[self.part_size :]
+                part_number += 1
+                if len(pending) >= self.max_concurrency:
+                    parts.append(pending.popleft().result())
+                pending.append(
+                    self._submit(
+                        self.client.upload_part(key, upload_id, part_number, part)
+                    )
+                )
+            parts.extend(future.result() for future in pending)
+            self._run(self.client.complete_multipart_upload(key, upload_id, parts))
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            self._run(self.client.abort_multipart_upload(key, upload_id))
+            raise
+        return key
+
+    def delete(self, path: str) -> bool:
+        # S3 does not tell whether the object existed
+        self._run(self.client.delete_object(path))
+        return True
+
+    def url(self, path: str) -> str:
+        return self.client.presign_get(path, self.presign_expires)
+
+    def checksum(self, path: str) -> str:
+        return self._run(self.client.object_sha256(path))
+
+    def start_upload(self, upload_id: str, filename: str) -> str:
+        key = self.key(filename)
+        multipart_id = self._run(self.client.create_multipart_upload(key))
+        # Upload ids of S3 are URL safe, so they never contain the separator
+        return f"{multipart_id}:{key}"
+
+    def write_chunk(self, upload_id: str, handle: str, offset: int, data: bytes):
+        multipart_id, key = handle.split(":", 1)
+        # Non-final chunks are at least min_chunk_size long, so part numbers grow
+        # with the offset and a retried chunk replaces its own part
+        part_number = offset // self.min_chunk_size + 1
+        self._run(self.client.upload_part(key, multipart_id, part_number, data))
+
+    def finish_upload(self, upload_id: str, handle: str, filename: str) -> str:
+        multipart_id, key = handle.split(":", 1)
+        parts = self._run(self.client.list_parts(key, multipart_id))
+        self._run(self.client.complete_multipart_upload(key, multipart_id, parts))
+        return key
+
+    def discard_upload(self, upload_id: str, handle: str | None) -> bool:
+        if handle is None:
+            return False
+        multipart_id, key = handle.split(":", 1)
+        self._run(self.client.abort_multipart_upload(key, multipart_id))
+        return True
+
+    def close(self) -> None:
+        self._run(self.client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
@@ -0,0 +1,116 @@
+from environs import Env
+
+env = Env()
+env.read_env()
+
+JOBS_WORKER_IN_PROCESS = env.bool("JOBS_WORKER_IN_PROCESS", True)
+JOBS_WORKER_CONCURRENCY = env.int("JOBS_WORKER_CONCURRENCY", 4)
+JOBS_POLL_INTERVAL = env.float("JOBS_POLL_INTERVAL", 1.0)
+JOBS_VISIBILITY_TIMEOUT = env.int("JOBS_VISIBILITY_TIMEOUT", 300)
+JOBS_MAX_ATTEMPTS = env.int("JOBS_MAX_ATTEMPTS", 5)
+JOBS_BACKOFF_BASE = env.float("JOBS_BACKOFF_BASE", 2.0)
+JOBS_BACKOFF_MAX = env.float("JOBS_BACKOFF_MAX", 600.0)
+
+ARTICLES_PARTITIONED = env.bool("ARTICLES_PARTITIONED", False)
+ARTICLES_PARTITIONS_AHEAD = env.int("ARTICLES_PARTITIONS_AHEAD", 3)
+
+ADMISSION_ENABLED = env.bool("ADMISSION_ENABLED", True)
+# Token bucket per principal: sustained requests per second and burst size, by role
+ADMISSION_RATE_ADMIN = env.float("ADMISSION_RATE_ADMIN", 50.0)
+ADMISSION_BURST_ADMIN = env.int("ADMISSION_BURST_ADMIN", 100)
+ADMISSION_RATE_TEACHER = env.float("ADMISSION_RATE_TEACHER", 20.0)
+ADMISSION_BURST_TEACHER = env.int("ADMISSION_BURST_TEACHER", 40)
+ADMISSION_RATE_STUDENT = env.float("ADMISSION_RATE_STUDENT", 10.0)
+ADMISSION_BURST_STUDENT = env.int("ADMISSION_BURST_STUDENT", 20)
+ADMISSION_RATE_ANONYMOUS = env.float("ADMISSION_RATE_ANONYMOUS", 5.0)
+ADMISSION_BURST_ANONYMOUS = env.int("ADMISSION_BURST_ANONYMOUS", 10)
+# Requests in flight per worker, by route class
+ADMISSION_MAX_READS = env.int("ADMISSION_MAX_READS", 64)
+ADMISSION_MAX_WRITES = env.int("ADMISSION_MAX_WRITES", 16)
+ADMISSION_MAX_UPLOADS = env.int("ADMISSION_MAX_UPLOADS", 4)
+# Event streams stay open while idle, they are capped apart from other reads
+ADMISSION_MAX_STREAMS = env.int("ADMISSION_MAX_STREAMS", 1000)
+
+# Seconds a request waits for an identical in-flight request before giving up
+COALESCING_TIMEOUT = env.float("COALESCING_TIMEOUT", 10.0)
+
+# Changes newer than this are held back, so a cursor never skips a change
+# committed late by a concurrent transaction
+CHANGES_SETTLE_SECONDS = env.float("CHANGES_SETTLE_SECONDS", 0.5)
+CHANGES_RETENTION_DAYS = env.int("CHANGES_RETENTION_DAYS", 30)
+CHANGES_MAX_PAGE_SIZE = env.int("CHANGES_MAX_PAGE_SIZE", 500)
+
+EVENTS_QUEUE_SIZE = env.int("EVENTS_QUEUE_SIZE", 100)
+EVENTS_HEARTBEAT_SECONDS = env.float("EVENTS_HEARTBEAT_SECONDS", 15.0)
+# Reconnecting subscribers that missed more events resync from the change log
+EVENTS_MAX_REPLAY = env.int("EVENTS_MAX_REPLAY", 500)
+
+# Article bodies longer than this many bytes are stored compressed
+ARTICLE_COMPRESSION_THRESHOLD = env.int("ARTICLE_COMPRESSION_THRESHOLD", 1024)
+ARTICLE_COMPRESSION_CODEC = env.str("ARTICLE_COMPRESSION_CODEC", "zstd")
+
+# Database URLs of the article shards, articles stay in the main database if empty
+ARTICLE_SHARDS = env.list("ARTICLE_SHARDS", [])
+
+# Requests sending this token in the X-Profile header are profiled, disabled if empty
+PROFILING_TOKEN = env.str("PROFILING_TOKEN", "")
+# Share of all requests that are profiled, between 0 and 1
+PROFILING_SAMPLE_RATE = env.float("PROFILING_SAMPLE_RATE", 0.0)
+PROFILING_DIR = env.str("PROFILING_DIR", "profiles")
+PROFILING_MAX_CAPTURES = env.int("PROFILING_MAX_CAPTURES", 100)
+
+# Resumable uploads
+UPLOADS_DIR = env.str("UPLOADS_DIR", "uploads")
+UPLOADS_MAX_SIZE = env.int("UPLOADS_MAX_SIZE", 50 * 1024 * 1024)
+UPLOADS_MAX_CHUNK_SIZE = env.int("UPLOADS_MAX_CHUNK_SIZE", 8 * 1024 * 1024)
+UPLOADS_EXPIRE_HOURS = env.int("UPLOADS_EXPIRE_HOURS", 24)
+# Seconds a chunk in progress keeps its offset from other writers
+UPLOADS_CHUNK_LEASE_SECONDS = env.int("UPLOADS_CHUNK_LEASE_SECONDS", 600)
+
+# Storage backend for cover images, "local" or "s3"
+STORAGE_BACKEND = env.str("STORAGE_BACKEND", "local")
+S3_ENDPOINT_URL = env.str("S3_ENDPOINT_URL", "https://s3.amazonaws.com")
+S3_REGION = env.str("S3_REGION", "us-east-1")
+S3_BUCKET = env.str("S3_BUCKET", "")
+S3_PREFIX = env.str("S3_PREFIX", "")
+S3_ACCESS_KEY_ID = env.str("S3_ACCESS_KEY_ID", "")
+S3_SECRET_ACCESS_KEY = env.str("S3_SECRET_ACCESS_KEY", "")
+S3_MAX_CONNECTIONS = env.int("S3_MAX_CONNECTIONS", 20)
+S3_MAX_RETRIES = env.int("S3_MAX_RETRIES", 3)
+S3_TIMEOUT = env.float("S3_TIMEOUT", 30.0)
+# Files larger than this are uploaded in parts of S3_PART_SIZE bytes
+S3_MULTIPART_THRESHOLD = env.int("S3_MULTIPART_THRESHOLD", 16 * 1024 * 1024)
+S3_PART_SIZE = env.int("S3_PART_SIZE", 8 * 1024 * 1024)
+S3_PRESIGN_EXPIRES = env.int("S3_PRESIGN_EXPIRES", 3600)
+
+# Circuit breaker around the database, see app/core/breaker.py
+BREAKER_ENABLED = env.bool("BREAKER_ENABLED", True)
+BREAKER_WINDOW_SECONDS = env.int("BREAKER_WINDOW_SECONDS", 10)
+BREAKER_MIN_CALLS = env.int("BREAKER_MIN_CALLS", 20)
+BREAKER_FAILURE_RATE = env.float("BREAKER_FAILURE_RATE", 0.5)
+BREAKER_SLOW_CALL_SECONDS = env.float("BREAKER_SLOW_CALL_SECONDS", 1.0)
+BREAKER_SLOW_CALL_RATE = env.float("BREAKER_SLOW_CALL_RATE", 0.5)
+BREAKER_OPEN_SECONDS = env.float("BREAKER_OPEN_SECONDS", 5.0)
+BREAKER_STALE_MAX_ENTRIES = env.int("BREAKER_STALE_MAX_ENTRIES", 1000)
+BREAKER_STALE_MAX_BODY_SIZE = env.int("BREAKER_STALE_MAX_BODY_SIZE", 256 * 1024)
+
+BATCH_MAX_ITEMS = env.int("BATCH_MAX_ITEMS", 50)
+# Read-only sub-requests of a batch running at the same time, each with a session
+BATCH_MAX_CONCURRENCY = env.int("BATCH_MAX_CONCURRENCY", 4)
+BATCH_ITEM_TIMEOUT = env.float("BATCH_ITEM_TIMEOUT", 10.0)
+
+# Rendered authors kept for article listings, see app/core/fragments.py
+AUTHOR_FRAGMENT_CACHE_SIZE = env.int("AUTHOR_FRAGMENT_CACHE_SIZE", 10000)
+
+# Concurrent article creations written in one transaction, see app/core/group_commit.py
+ARTICLE_GROUP_COMMIT = env.bool("ARTICLE_GROUP_COMMIT", False)
+ARTICLE_GROUP_COMMIT_WINDOW = env.float("ARTICLE_GROUP_COMMIT_WINDOW", 0.005)
+ARTICLE_GROUP_COMMIT_MAX_SIZE = env.int("ARTICLE_GROUP_COMMIT_MAX_SIZE", 100)
+
+# Eviction of in-process caches on every worker, see app/core/invalidation.py. One of
+# auto, notify (Postgres LISTEN/NOTIFY), polling (a table) or local (this worker only)
+INVALIDATION_BUS = env.str("INVALIDATION_BUS", "auto")
+INVALIDATION_CHANNEL = env.str("INVALIDATION_CHANNEL", "cache_invalidation")
+INVALIDATION_POLL_INTERVAL = env.float("INVALIDATION_POLL_INTERVAL", 1.0)
+INVALIDATION_RETENTION_SECONDS = env.int("INVALIDATION_RETENTION_SECONDS", 300)
+INVALIDATION_MAX_KEYS = env.int("INVALIDATION_MAX_KEYS", 100000)
@@ -0,0 +1,299 @@
+import heapq
+from itertools import islice
+from typing import Callable, Iterable, TypeVar
+
+from sqlalchemy import MetaData, create_engine, delete, func, insert, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker, selectinload
+
+from app.core import settings
+from app.models.articles import Article, ArticleBody, ArticleIdTicket
+
+T = TypeVar("T")
+
+# Tables living on the shards, every other table stays in the main database
+SHARDED_TABLES = [Article.__table__, ArticleBody.__table__]
+RESHARD_BATCH_SIZE = 500
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash (Lamping and Veach). Going from n to n + 1 buckets moves
+    only 1 / (n + 1) of the keys, all of them to the new bucket.
+
+    :param key: A non-negative integer key
+    :param buckets: The number of buckets
+    :return: The bucket of the key, in ``range(buckets)``
+    """
+    bucket, jump = -1, 0
+    key &= 0xFFFFFFFFFFFFFFFF
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_metadata() -> MetaData:
+    # Shards have no users table, so references to it are left out
+    metadata = MetaData()
+    for table in SHARDED_TABLES:
+        shard_table = table.to_metadata(metadata)
+        for constraint in list(shard_table.foreign_key_constraints):
+            shard_table.constraints.discard(constraint)
+        shard_table.foreign_keys.clear()
+        for column in shard_table.columns:
+            column.foreign_keys.clear()
+    return metadata
+
+
+SHARD_METADATA = shard_metadata()
+
+
+class ShardRouter:
+    """
+    Maps authors to the databases holding their articles. Without configured
+    shards there is a single shard, the main database.
+    """
+
+    def __init__(self, urls: Iterable[str] = ()):
+        self.engines = [create_engine(url) for url in urls]
+        self.session_factories = [
+            sessionmaker(autocommit=False, autoflush=False, bind=engine)
+            for engine in self.engines
+        ]
+
+    @property
+    def sharded(self) -> bool:
+        return bool(self.engines)
+
+    @property
+    def shard_count(self) -> int:
+        return len(self.engines) or 1
+
+    def shard_of(self, author_id: int) -> int:
+        return jump_hash(author_id, self.shard_count)
+
+    def create_tables(self) -> None:
+        for engine in self.engines:
+            SHARD_METADATA.create_all(bind=engine)
+
+    def dispose(self) -> None:
+        for engine in self.engines:
+            engine.dispose()
+
+
+shard_router = ShardRouter(settings.ARTICLE_SHARDS)
+
+
+class ShardSessions:
+    """
+    The shard sessions of one unit of work, opened on first use. Without configured
+    shards every shard session is the main session.
+    """
+
+    def __init__(self, db_session: Session, router: ShardRouter):
+        self.db_session = db_session
+        self.router = router
+        self._sessions: dict[int, Session] = {}
+
+    def get(self, shard: int) -> Session:
+        if not self.router.sharded:
+            return self.db_session
+        if shard not in self._sessions:
+            self._sessions[shard] = self.router.session_factories[shard]()
+        return self._sessions[shard]
+
+    def for_author(self, author_id: int) -> Session:
+        return self.get(self.router.shard_of(author_id))
+
+    def group_by_shard(self, author_ids: Iterable[int]) -> list[tuple[Session, list]]:
+        groups = {}
+        for author_id in author_ids:
+            groups.setdefault(self.router.shard_of(author_id), []).append(author_id)
+        return [(self.get(shard), ids) for shard, ids in sorted(groups.items())]
+
+    def covering(self, author_ids: Iterable[int] | None = None) -> list[Session]:
+        """
+        Returns the sessions of the shards holding the given authors' articles, or
+        of all shards if the authors are not known.
+        """
+        if author_ids is None:
+            return [self.get(shard) for shard in range(self.router.shard_count)]
+        return [session for session, _ in self.group_by_shard(author_ids)]
+
+    def commit(self) -> None:
+        # Articles are committed first, the main session then records their side
+        # effects. Stats drifting after a failure in between are fixed by
+        # reconcile-stats.
+        for session in self._sessions.values():
+            session.commit()
+        self.db_session.commit()
+
+    def close(self) -> None:
+        for session in self._sessions.values():
+            session.close()
+        self._sessions.clear()
+
+
+def shard_sessions(db_session: Session) -> ShardSessions:
+    shards = db_session.info.get("shards")
+    if shards is None or shards.router is not shard_router:
+        shards = db_session.info["shards"] = ShardSessions(db_session, shard_router)
+    return shards
+
+
+def close_shard_sessions(db_session: Session) -> None:
+    shards = db_session.info.pop("shards", None)
+    if shards is not None:
+        shards.close()
+
+
+def merge_ordered(
+    results: Iterable[Iterable[T]],
+    key: Callable[[T], tuple],
+    offset: int = 0,
+    limit: int | None = None,
+) -> list[T]:
+    """
+    Merges results that are each sorted by ``key`` and returns one page of them.
+    Every result must hold at least ``offset + limit`` items if it has that many.
+    """
+    stop = offset + limit if limit is not None else None
+    return list(islice(heapq.merge(*results, key=key), offset, stop))
+
+
+def next_article_ids(db_session: Session, count: int) -> list[int]:
+    """
+    Hands out ids for ``count`` articles with one multi-row
+    ``INSERT ... RETURNING`` on the ticket table.
+    """
+    if count == 0:
+        return []
+    if db_session.get_bind().dialect.name == "postgresql":
+        # A serial column takes its default only when left out of the row
+        sequence = func.pg_get_serial_sequence(ArticleIdTicket.__tablename__, "id")
+        statement = insert(ArticleIdTicket).from_select(
+            ["id"],
+            select(func.nextval(sequence)).select_from(func.generate_series(1, count)),
+        )
+    else:
+        statement = insert(ArticleIdTicket).values([{"id": None}] * count)
+    # Taken in its own transaction, so an id is never handed out twice
+    with Session(bind=db_session.get_bind()) as ticket_session:
+        article_ids = ticket_session.scalars(
+            statement.returning(ArticleIdTicket.id)
+        ).all()
+        ticket_session.commit()
+    return sorted(article_ids)
+
+
+def seed_article_ids(db_session: Session, article_id: int) -> None:
+    """
+    Makes sure ids handed out by ``next_article_ids`` are greater than the given id.
+    """
+    current = db_session.scalar(select(func.max(ArticleIdTicket.id))) or 0
+    if current >= article_id:
+        return
+    db_session.execute(insert(ArticleIdTicket).values(id=article_id))
+    if db_session.get_bind().dialect.name == "postgresql":
+        db_session.execute(
+            text("SELECT setval(pg_get_serial_sequence(:table, 'id'), :article_id)"),
+            {"table": ArticleIdTicket.__tablename__, "article_id": article_id},
+        )
+    db_session.commit()
+
+
+def same_database(first: Engine, second: Engine) -> bool:
+    first_url = first.url.render_as_string(hide_password=False)
+    return first_url == second.url.render_as_string(hide_password=False)
+
+
+def reshard_articles(
+    sources: Iterable[Engine],
+    router: ShardRouter,
+    db_session: Session,
+    batch_size: int = RESHARD_BATCH_SIZE,
+) -> int:
+    """
+    Moves articles and their bodies from the source databases to the shards of
+    their authors. Rows are copied before they are deleted from the source, so an
+    interrupted run can simply be repeated.
+
+    :param sources: The databases to move articles out of
+    :param router: The target shard layout
+    :param db_session: A session of the main database, used to seed article ids
+    :param batch_size: How many articles to read from a source at once
+    :return: The number of moved articles
+    """
+    article_columns = [column.key for column in Article.__table__.columns]
+    body_columns = [column.key for column in ArticleBody.__table__.columns]
+    moved = 0
+    max_id = 0
+    for source in sources:
+        with Session(bind=source) as source_session:
+            last_id = 0
+            while True:
+                articles = (
+                    source_session.query(Article)
+                    .options(selectinload(Article.body))
+                    .filter(Article.id > last_id)
+                    .order_by(Article.id)
+                    .limit(batch_size)
+                    .all()
+                )
+                if not articles:
+                    break
+                last_id = articles[-1].id
+                max_id = max(max_id, last_id)
+
+                targets = {}
+                for article in articles:
+                    shard = router.shard_of(article.author_id)
+                    if not same_database(router.engines[shard], source):
+                        targets.setdefault(shard, []).append(article)
+                for shard, batch in targets.items():
+                    article_ids = [article.id for article in batch]
+                    with router.session_factories[shard]() as target:
+                        existing = set(
+                            target.scalars(
+                                select(Article.id).where(Article.id.in_(article_ids))
+                            )
+                        )
+                        copied = [
+                            article for article in batch if article.id not in existing
+                        ]
+                        if copied:
+                            target.execute(
+                                insert(Article),
+                                [
+                                    {
+                                        key: getattr(article, key)
+                                        for key in article_columns
+                                    }
+                                    for article in copied
+                                ],
+                            )
+                        bodies = [
+                            {key: getattr(article.body, key) for key in body_columns}
+                            for article in copied
+                            if article.body is not None
+                        ]
+                        if bodies:
+                            target.execute(insert(ArticleBody), bodies)
+                        target.commit()
+                    source_session.execute(
+                        delete(ArticleBody).where(
+                            ArticleBody.article_id.in_(article_ids)
+                        )
+                    )
+                    source_session.execute(
+                        delete(Article)
+                        .where(Article.id.in_(article_ids))
+                        .execution_options(synchronize_session=False)
+                    )
+                    source_session.commit()
+                    moved += len(batch)
+                source_session.expunge_all()
+    seed_article_ids(db_session, max_id)
+    return moved
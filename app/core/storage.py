@@ -1,22 +1,125 @@
+import hashlib
 import os
 import shutil
 
 from fastapi import UploadFile
 
+from app.core import settings
+
 MEDIA_ROOT = "storage"
+CHECKSUM_BLOCK_SIZE = 1024 * 1024
 
 
 class Storage:
+    # Smallest chunk of a resumable upload, except for its last chunk
+    min_chunk_size = 0
+
     def upload(self, file):
         raise NotImplementedError
 
+    def delete(self, path):
+        raise NotImplementedError
+
+    def url(self, path):
+        """Returns a URL clients download the stored file from."""
+        raise NotImplementedError
+
+    def checksum(self, path):
+        """Returns the hex SHA-256 digest of a stored file."""
+        raise NotImplementedError
+
+    def start_upload(self, upload_id, filename):
+        """
+        Prepares a resumable upload to be published under the filename.
+
+        :return: A handle passed to the other upload methods, or None
+        """
+        raise NotImplementedError
+
+    def write_chunk(self, upload_id, handle, offset, data):
+        """Appends a chunk of a resumable upload, which starts at the given offset."""
+        raise NotImplementedError
+
+    def finish_upload(self, upload_id, handle, filename):
+        """Publishes a complete upload under the filename and returns its path."""
+        raise NotImplementedError
+
+    def discard_upload(self, upload_id, handle):
+        raise NotImplementedError
+
 
 class LocalStorage(Storage):
-    def __init__(self, root=MEDIA_ROOT):
+    def __init__(self, root=MEDIA_ROOT, uploads_root=settings.UPLOADS_DIR):
         self.root = root
+        # Partial uploads are kept out of the publicly served root
+        self.uploads_root = uploads_root
 
     def upload(self, file: UploadFile) -> str:
         path = os.path.join(self.root, file.filename)
         with open(path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         return path
+
+    def delete(self, path: str) -> bool:
+        root = os.path.abspath(self.root)
+        if os.path.commonpath([root, os.path.abspath(path)]) != root:
+            raise ValueError(f"Path outside of storage root: {path}")
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def url(self, path: str) -> str:
+        # The media root is mounted as static files under its own name
+        return f"/{path}"
+
+    def checksum(self, path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(CHECKSUM_BLOCK_SIZE), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def partial_path(self, upload_id: str) -> str:
+        return os.path.join(self.uploads_root, f"{upload_id}.part")
+
+    def start_upload(self, upload_id: str, filename: str) -> None:
+        return None
+
+    def write_chunk(self, upload_id: str, handle, offset: int, data: bytes) -> None:
+        os.makedirs(self.uploads_root, exist_ok=True)
+        path = self.partial_path(upload_id)
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            f.seek(offset)
+            f.write(data)
+            f.truncate()
+
+    def finish_upload(self, upload_id: str, handle, filename: str) -> str:
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, filename)
+        shutil.move(self.partial_path(upload_id), path)
+        return path
+
+    def discard_upload(self, upload_id: str, handle) -> bool:
+        try:
+            os.remove(self.partial_path(upload_id))
+        except FileNotFoundError:
+            return False
+        return True
+
+
+_storage = None
+
+
+def get_storage() -> Storage:
+    """Returns the storage backend selected by ``STORAGE_BACKEND``."""
+    global _storage
+    if _storage is None:
+        if settings.STORAGE_BACKEND == "s3":
+            from app.core.s3 import S3Storage
+
+            _storage = S3Storage.from_settings()
+        else:
+            _storage = LocalStorage()
+    return _storage
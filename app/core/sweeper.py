@@ -0,0 +1,53 @@
+from typing import Iterable
+
+from sqlalchemy.orm import Session
+
+from app.core.jobs import job
+from app.core.sharding import shard_sessions
+from app.core.storage import Storage, get_storage
+from app.models.articles import Article
+
+SWEEP_BATCH_SIZE = 100
+
+
+class CoverImageSweeper:
+    """
+    Removes cover images of deleted articles once no article references them
+    anymore. Paths are unlinked in batches, with one reference query per batch.
+    """
+
+    def __init__(
+        self, storage: Storage | None = None, batch_size: int = SWEEP_BATCH_SIZE
+    ):
+        self._storage = storage
+        self.batch_size = batch_size
+
+    @property
+    def storage(self) -> Storage:
+        # Resolved on use, the backend is created on first access
+        return self._storage or get_storage()
+
+    def sweep(self, paths: Iterable[str], db_session: Session) -> int:
+        paths = sorted(set(paths))
+        removed = 0
+        for start in range(0, len(paths), self.batch_size):
+            batch = paths[start : start + self.batch_size]
+            referenced = {
+                path
+                for shard_session in shard_sessions(db_session).covering()
+                for path, in shard_session.query(Article.cover_image).filter(
+                    Article.cover_image.in_(batch)
+                )
+            }
+            for path in batch:
+                if path not in referenced and self.storage.delete(path):
+                    removed += 1
+        return removed
+
+
+cover_image_sweeper = CoverImageSweeper()
+
+
+@job("sweep_cover_images")
+def sweep_cover_images(db_session: Session, paths: list[str]) -> int:
+    return cover_image_sweeper.sweep(paths, db_session)
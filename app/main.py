@@ -4,12 +4,25 @@ import uvicorn
 from fastapi import Depends, FastAPI
 from fastapi.staticfiles import StaticFiles
 
-from app.core.db import engine, Base
+from app.controllers.articles import prepare_legacy_content
+from app.core import settings, partitions  # noqa: F401, partitions the new table
+from app.core.admission import AdmissionMiddleware
+from app.core.breaker import CircuitBreakerMiddleware
+from app.core.profiling import ProfilingMiddleware
+from app.core.db import engine, Base, DBSession, add_missing_columns
 from app.core.dependencies import get_current_user
+from app.core.events import event_stream_routes
+from app.core.invalidation import invalidation_bus, transport_for
+from app.core.jobs import JobWorker, ensure_scheduled
+from app.core.sharding import shard_router
 from app.core.storage import MEDIA_ROOT
-from app.routers import users, articles
+from app.routers import users, articles, profiles, uploads, batch
 
 Base.metadata.create_all(bind=engine)
+shard_router.create_tables()
+with engine.begin() as connection:
+    add_missing_columns(connection)
+    prepare_legacy_content(connection)
 
 app = FastAPI(
     title="Test Task API",
@@ -19,6 +32,11 @@ app = FastAPI(
     redoc_url="/docs/redoc",
 )
 
+# middlewares, the last one added runs first
+app.add_middleware(CircuitBreakerMiddleware)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(AdmissionMiddleware)
+
 # routes
 app.include_router(
     users.router,
@@ -33,6 +51,59 @@ app.include_router(
     dependencies=[Depends(get_current_user)],
     responses={404: {"description": "Not found"}},
 )
+app.include_router(
+    uploads.router,
+    prefix="/uploads",
+    tags=["uploads"],
+    dependencies=[Depends(get_current_user)],
+    responses={404: {"description": "Not found"}},
+)
+app.include_router(
+    batch.router,
+    prefix="/batch",
+    tags=["batch"],
+    dependencies=[Depends(get_current_user)],
+)
+app.include_router(
+    profiles.router,
+    prefix="/profiles",
+    tags=["profiles"],
+    dependencies=[Depends(get_current_user)],
+    responses={404: {"description": "Not found"}},
+)
+
+# admission and the breaker tell event streams apart before routing
+event_stream_routes.register(app.routes)
+
+# background jobs
+job_worker = JobWorker(DBSession)
+
+
+@app.on_event("startup")
+def start_job_worker():
+    with DBSession() as db_session:
+        ensure_scheduled(db_session, "compact_article_changes")
+        ensure_scheduled(db_session, "expire_uploads")
+        if settings.ARTICLES_PARTITIONED:
+            ensure_scheduled(db_session, "maintain_article_partitions")
+    if settings.JOBS_WORKER_IN_PROCESS:
+        job_worker.start()
+
+
+@app.on_event("shutdown")
+def stop_job_worker():
+    job_worker.stop()
+
+
+@app.on_event("startup")
+def start_invalidation_bus():
+    invalidation_bus.start(transport_for(engine))
+
+
+@app.on_event("shutdown")
+def stop_invalidation_bus():
+    invalidation_bus.stop()
+
 
 # static files
 if not os.path.exists(MEDIA_ROOT):
@@ -0,0 +1,215 @@
+import argparse
+import logging
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine
+
+from app.controllers.articles import migrate_article_bodies
+from app.controllers.changes import compact_article_changes
+from app.controllers.stats import rebuild_article_stats
+from app.core import settings
+from app.core.db import DBSession, engine, create_missing_indexes
+from app.core.jobs import JobWorker
+from app.core.partitions import ensure_article_partitions, archive_article_partitions
+from app.core.enums import Degree, Role
+from app.core.serialization import render_json
+from app.core.sharding import shard_router, reshard_articles
+from app.models import articles, jobs, uploads, users  # noqa: F401, all tables
+from app.schemas.articles import ArticleCreateSchema, ArticleSchema
+from app.schemas.users import UserCreateSchema, UserSchema
+
+BENCHMARK_REGISTRATION = {
+    "email": "student@example.com",
+    "password": "password1",
+    "role": "student",
+    "profile": {
+        "first_name": "First",
+        "last_name": "Student",
+        "teachers": [1],
+        "entry_date": "2020-09-01",
+    },
+}
+
+
+def run_worker(args: argparse.Namespace) -> None:
+    worker = JobWorker(DBSession, concurrency=args.concurrency)
+    try:
+        worker.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def create_indexes(args: argparse.Namespace) -> None:
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        created = create_missing_indexes(connection)
+    print(f"Created indexes: {', '.join(created) or 'none'}")
+
+
+def reconcile_stats(args: argparse.Namespace) -> None:
+    with DBSession() as db_session:
+        rows = rebuild_article_stats(db_session)
+    print(f"Rebuilt {rows} article stats rows")
+
+
+def migrate_bodies(args: argparse.Namespace) -> None:
+    with DBSession() as db_session:
+        moved = migrate_article_bodies(db_session, args.batch_size, args.drop_column)
+    print(f"Moved {moved} article bodies")
+
+
+def compact_changes(args: argparse.Namespace) -> None:
+    with DBSession() as db_session:
+        removed = compact_article_changes(db_session, timedelta(days=args.retention))
+        db_session.commit()
+    print(f"Removed {removed} article change log entries")
+
+
+def reshard(args: argparse.Namespace) -> None:
+    shard_router.create_tables()
+    sources = [engine, *shard_router.engines]
+    sources += [create_engine(url) for url in args.source or []]
+    with DBSession() as db_session:
+        moved = reshard_articles(sources, shard_router, db_session, args.batch_size)
+    print(f"Moved {moved} articles")
+
+
+def create_partitions(args: argparse.Namespace) -> None:
+    with engine.begin() as connection:
+        created = ensure_article_partitions(connection, months_ahead=args.months_ahead)
+    print(f"Created partitions: {', '.join(created) or 'none'}")
+
+
+def archive_articles(args: argparse.Namespace) -> None:
+    with engine.begin() as connection:
+        archived = archive_article_partitions(connection, args.before, drop=args.drop)
+    print(f"Detached partitions: {', '.join(archived) or 'none'}")
+
+
+def benchmark_schemas(args: argparse.Namespace) -> None:
+    # Unsaved objects, so only the schema work is measured
+    teacher = users.Teacher(
+        id=1, first_name="First", last_name="Teacher", degree=Degree.PHD
+    )
+    user = users.User(id=1, email="student@example.com", role=Role.student)
+    user.student = users.Student(
+        id=1,
+        first_name="First",
+        last_name="Student",
+        entry_date=date(2020, 9, 1),
+        teachers=[teacher],
+    )
+    article = articles.Article(
+        id=1, title="Title", author_id=user.id, created_at=datetime.now()
+    )
+    article.content = "Content " * 100
+    article.author = user
+
+    def register():
+        UserCreateSchema.parse_obj(BENCHMARK_REGISTRATION)
+        render_json(UserSchema, user)
+
+    def post_article():
+        ArticleCreateSchema(title=article.title, content=article.content)
+        render_json(ArticleSchema, article)
+
+    for name, request in (("register", register), ("post article", post_article)):
+        for _ in range(min(args.iterations, 100)):
+            request()
+        started = time.process_time()
+        for _ in range(args.iterations):
+            request()
+        elapsed = time.process_time() - started
+        print(f"{name}: {elapsed / args.iterations * 1e6:.1f} us CPU per request")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Angle2 Test Task management commands")
+    subparsers = parser.add_subparsers(required=True)
+
+    worker_parser = subparsers.add_parser("worker", help="Run background job worker")
+    worker_parser.add_argument(
+        "--concurrency", type=int, default=settings.JOBS_WORKER_CONCURRENCY
+    )
+    worker_parser.set_defaults(func=run_worker)
+
+    indexes_parser = subparsers.add_parser(
+        "create-indexes", help="Create indexes missing from existing tables"
+    )
+    indexes_parser.set_defaults(func=create_indexes)
+
+    stats_parser = subparsers.add_parser(
+        "reconcile-stats", help="Rebuild article stats from the articles table"
+    )
+    stats_parser.set_defaults(func=reconcile_stats)
+
+    bodies_parser = subparsers.add_parser(
+        "migrate-article-bodies",
+        help="Move article contents out of the articles table",
+    )
+    bodies_parser.add_argument("--batch-size", type=int, default=1000)
+    bodies_parser.add_argument(
+        "--drop-column",
+        action="store_true",
+        help="Drop the legacy column, once no worker reads it anymore",
+    )
+    bodies_parser.set_defaults(func=migrate_bodies)
+
+    changes_parser = subparsers.add_parser(
+        "compact-changes", help="Compact the article change log"
+    )
+    changes_parser.add_argument(
+        "--retention",
+        type=int,
+        default=settings.CHANGES_RETENTION_DAYS,
+        help="Days to keep deletions for",
+    )
+    changes_parser.set_defaults(func=compact_changes)
+
+    reshard_parser = subparsers.add_parser(
+        "reshard", help="Move articles to the shards configured in ARTICLE_SHARDS"
+    )
+    reshard_parser.add_argument(
+        "--source",
+        action="append",
+        help="Database URL of a retired shard to move articles out of",
+    )
+    reshard_parser.add_argument("--batch-size", type=int, default=500)
+    reshard_parser.set_defaults(func=reshard)
+
+    partitions_parser = subparsers.add_parser(
+        "create-partitions", help="Create upcoming monthly article partitions"
+    )
+    partitions_parser.add_argument(
+        "--months-ahead", type=int, default=settings.ARTICLES_PARTITIONS_AHEAD
+    )
+    partitions_parser.set_defaults(func=create_partitions)
+
+    archive_parser = subparsers.add_parser(
+        "archive-articles", help="Detach article partitions older than a month"
+    )
+    archive_parser.add_argument(
+        "--before",
+        type=date.fromisoformat,
+        required=True,
+        help="First month to keep, e.g. 2023-01-01",
+    )
+    archive_parser.add_argument(
+        "--drop", action="store_true", help="Drop instead of archiving"
+    )
+    archive_parser.set_defaults(func=archive_articles)
+
+    benchmark_parser = subparsers.add_parser(
+        "benchmark-schemas",
+        help="Measure the CPU time of validating and serializing write requests",
+    )
+    benchmark_parser.add_argument("--iterations", type=int, default=5000)
+    benchmark_parser.set_defaults(func=benchmark_schemas)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
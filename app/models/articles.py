@@ -6,21 +6,122 @@ from sqlalchemy import (
     Integer,
     String,
     DateTime,
+    Date,
+    Enum,
+    Index,
+    LargeBinary,
+    Text,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, foreign, query_expression
 
+from app.core.compression import compress, decompress
 from app.core.db import Base
+from app.core.enums import ChangeOperation
+from app.core.settings import ARTICLES_PARTITIONED
 
 
 class Article(Base):
     __tablename__ = "articles"
-    id = Column(Integer, primary_key=True, index=True)
+    __table_args__ = (
+        Index("ix_articles_author_id_created_at", "author_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"}
+        if ARTICLES_PARTITIONED
+        else {},
+    )
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     title = Column(String(100), nullable=False)
     cover_image = Column(String(256), nullable=True)
-    content = Column(String, nullable=False)
-    created_at = Column(DateTime, nullable=False, default=datetime.now)
+    # Postgres requires the partition key to be part of the primary key
+    created_at = Column(
+        DateTime,
+        nullable=False,
+        default=datetime.now,
+        primary_key=ARTICLES_PARTITIONED,
+    )
     author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     author = relationship("User", back_populates="articles", uselist=False)
+    # Bodies live in their own table, so listing articles never reads them
+    body = relationship(
+        "ArticleBody",
+        primaryjoin="Article.id == foreign(ArticleBody.article_id)",
+        uselist=False,
+        cascade="all, delete-orphan",
+    )
+    # The legacy ``articles.content`` column, only loaded until its migration ran
+    legacy_content = query_expression()
 
     def __repr__(self):
         return f"<{self.id}: {self.title}>"
+
+    @property
+    def content(self):
+        return self.body.text if self.body is not None else self.legacy_content
+
+    @content.setter
+    def content(self, text):
+        if self.body is None:
+            self.body = ArticleBody()
+        self.body.text = text
+
+
+class ArticleBody(Base):
+    __tablename__ = "article_bodies"
+    article_id = Column(Integer, primary_key=True, autoincrement=False)
+    content = Column(Text, nullable=True)
+    compressed_content = Column(LargeBinary, nullable=True)
+    compression = Column(String(16), nullable=True)
+
+    @property
+    def text(self):
+        if self.compression is None:
+            return self.content
+        return decompress(self.compression, self.compressed_content)
+
+    @text.setter
+    def text(self, text):
+        self.compression, self.compressed_content = compress(text)
+        self.content = text if self.compression is None else None
+
+
+class ArticleIdTicket(Base):
+    """Hands out article ids that are unique across all shards."""
+
+    __tablename__ = "article_id_tickets"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+
+class ArticleStat(Base):
+    """Number of articles per author and day, kept up to date on every write."""
+
+    __tablename__ = "article_stats"
+    author_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<{self.author_id} @ {self.day}: {self.count}>"
+
+
+class ArticleChange(Base):
+    """Change log entry, its id is the cursor clients sync from."""
+
+    __tablename__ = "article_changes"
+    id = Column(Integer, primary_key=True, index=True)
+    operation = Column(Enum(ChangeOperation), nullable=False)
+    article_id = Column(Integer, nullable=False, index=True)
+    author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (Index("ix_article_changes_author_id_id", "author_id", "id"),)
+
+    def __repr__(self):
+        return f"<{self.id}: {self.operation} {self.article_id}>"
+
+
+class ArticleChangeCompaction(Base):
+    """Records the highest cursor up to which deletions were discarded."""
+
+    __tablename__ = "article_change_compactions"
+    id = Column(Integer, primary_key=True, index=True)
+    compacted_through = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
@@ -0,0 +1,19 @@
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, DateTime, Index
+
+from app.core.db import Base
+
+
+class CacheInvalidation(Base):
+    """
+    An invalidation published through the polling transport, for databases without
+    LISTEN/NOTIFY. Rows are removed once every worker has had time to poll them.
+    """
+
+    __tablename__ = "cache_invalidations"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    payload = Column(String(1024), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (Index("ix_cache_invalidations_created_at", "created_at"),)
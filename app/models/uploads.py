@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from sqlalchemy import Column, ForeignKey, Integer, String, DateTime, Enum, Index
+
+from app.core.db import Base
+from app.core.enums import UploadStatus
+
+
+class Upload(Base):
+    """A resumable upload, its data is kept by the storage backend."""
+
+    __tablename__ = "uploads"
+    id = Column(String(32), primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    filename = Column(String(256), nullable=False)
+    content_type = Column(String(100), nullable=False)
+    size = Column(Integer, nullable=False)
+    sha256 = Column(String(64), nullable=True)
+    received = Column(Integer, nullable=False, default=0)
+    status = Column(Enum(UploadStatus), nullable=False, default=UploadStatus.pending)
+    path = Column(String(256), nullable=True)
+    # Identifies the upload in progress to the storage backend, if it needs to
+    storage_handle = Column(String(1024), nullable=True)
+    # Set while a chunk is being written, other writers at the offset are refused
+    chunk_claimed_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (Index("ix_uploads_expires_at", "expires_at"),)
+
+    @property
+    def offset(self) -> int:
+        return self.received
+
+    def __repr__(self):
+        return f"<{self.id}: {self.filename} ({self.received}/{self.size})>"
@@ -1,5 +1,10 @@
+from itertools import chain
+
 from fastapi import HTTPException
 from sqlalchemy import (
+    event,
+    inspect,
+    select,
     Column,
     ForeignKey,
     Integer,
@@ -7,10 +12,12 @@ from sqlalchemy import (
     Date,
     Enum,
     Table,
+    Index,
 )
 from sqlalchemy.orm import relationship, Session
 
 from app.core.db import Base
+from app.core.invalidation import invalidate, user_key
 from app.core.enums import Role, Degree
 
 
@@ -19,7 +26,9 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, nullable=False)
     hashed_password = Column(String(256), nullable=False)
-    role = Column(Enum(Role), nullable=False)
+    role = Column(Enum(Role), nullable=False, index=True)
+    # Moves whenever the user or its profile changes, see bump_profile_versions
+    profile_version = Column(Integer, nullable=False, default=1, server_default="1")
     admin = relationship("Admin", back_populates="user", uselist=False)
     teacher = relationship("Teacher", back_populates="user", uselist=False)
     student = relationship("Student", back_populates="user", uselist=False)
@@ -63,7 +72,7 @@ class Admin(Base):
     __tablename__ = "admins"
     id = Column(Integer, primary_key=True, index=True)
     full_name = Column(String)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     user = relationship("User", back_populates="admin")
 
 
@@ -73,7 +82,7 @@ class Teacher(Base):
     first_name = Column(String, nullable=False)
     last_name = Column(String, nullable=False)
     degree = Column(Enum(Degree))
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     user = relationship("User", back_populates="teacher")
     students = relationship(
         "Student", secondary="teacher_student", back_populates="teachers"
@@ -86,7 +95,7 @@ class Student(Base):
     first_name = Column(String, nullable=False)
     last_name = Column(String, nullable=False)
     entry_date = Column(Date, nullable=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     user = relationship("User", back_populates="student")
     teachers = relationship("Teacher", secondary="teacher_student")
 
@@ -96,9 +105,56 @@ teacher_student = Table(
     Base.metadata,
     Column("teacher_id", Integer, ForeignKey("teachers.id")),
     Column("student_id", Integer, ForeignKey("students.id")),
+    Index("ix_teacher_student_teacher_id_student_id", "teacher_id", "student_id"),
+    Index("ix_teacher_student_student_id_teacher_id", "student_id", "teacher_id"),
 )
 
 
+@event.listens_for(Session, "before_flush")
+def bump_profile_versions(session: Session, flush_context, instances) -> None:
+    """
+    Moves the profile version of users whose row or profile changed, and of the
+    students of changed teachers, as student profiles list their teachers. The ids
+    of the users are kept in ``session.info["changed_user_ids"]`` until the flush
+    is done.
+    """
+    users = set()
+    for instance in chain(session.dirty, session.deleted):
+        if instance in session.dirty and not session.is_modified(instance):
+            continue
+        if isinstance(instance, User):
+            users.add(instance)
+        elif isinstance(instance, (Admin, Teacher, Student)):
+            users.add(instance.user)
+        if isinstance(instance, Teacher):
+            students = inspect(instance).attrs.students.load_history().sum()
+            users.update(student.user for student in students)
+    users = {
+        user
+        for user in users
+        if user is not None and user not in session.deleted and user.id is not None
+    }
+    for user in users:
+        # Computed by the database, concurrent changes each move the version
+        user.profile_version = User.profile_version + 1
+    session.info.setdefault("changed_user_ids", set()).update(user.id for user in users)
+
+
+@event.listens_for(Session, "after_flush")
+def invalidate_changed_users(session: Session, flush_context) -> None:
+    user_ids = session.info.pop("changed_user_ids", set())
+    user_ids.update(
+        instance.id for instance in session.new if isinstance(instance, User)
+    )
+    if not user_ids:
+        return
+    versions = session.execute(
+        select(User.id, User.profile_version).where(User.id.in_(user_ids))
+    )
+    for user_id, version in versions:
+        invalidate(session, user_key(user_id), version)
+
+
 def profile_model_factory(role: Role, data: dict, db_session: Session):
     if role == Role.admin:
         return Admin(**data)
@@ -1,12 +1,18 @@
+from datetime import datetime, date
+
 from fastapi import (
     APIRouter,
+    Body,
     Depends,
     Security,
     HTTPException,
     status,
     UploadFile,
     Form,
+    Query,
+    Header,
 )
+from fastapi.responses import Response
 from pydantic import parse_obj_as
 from sqlalchemy.orm import Session
 
@@ -17,23 +23,88 @@ from app.controllers.articles import (
     get_own_article_by_id,
     delete_own_article_by_id,
     delete_article_by_id,
+    get_visible_articles_by_ids,
+    bulk_delete_articles,
+    get_articles_by_author_id,
+    get_article_changes,
+    get_student_article_events,
 )
 from app.controllers.articles import get_all_articles
+from app.controllers.stats import get_author_stats, get_teacher_stats
+from app.core import settings
+from app.core.coalescing import coalesced_json_response
 from app.core.dependencies import get_db, get_current_user
+from app.core.events import EventStreamResponse, broker, stream_events
+from app.core.fragments import render_articles
+from app.core.profiling import ProfiledRoute
+from app.core.serialization import json_response
 from app.core.enums import Role
 from app.models.users import User
-from app.schemas.articles import ArticleSchema, ArticleCreateSchema
+from app.schemas.articles import (
+    ArticleSchema,
+    ArticleFieldsSchema,
+    ArticleSummarySchema,
+    ArticleSummaryFieldsSchema,
+    ArticleCreateSchema,
+    ArticleBatchSchema,
+    ArticleChangeSchema,
+    ArticleChangesSchema,
+    ArticleBulkDeleteSchema,
+    ArticleBulkDeleteResultSchema,
+    AuthorArticleStatsSchema,
+    TeacherArticleStatsSchema,
+)
+
+MAX_BATCH_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+router = APIRouter(route_class=ProfiledRoute)
+
 
-router = APIRouter()
+def article_fields_schema(include_content: bool) -> type:
+    # Summaries leave the article bodies unread
+    return ArticleFieldsSchema if include_content else ArticleSummaryFieldsSchema
+
+
+def article_list_response(articles, include_content: bool) -> Response:
+    return Response(
+        render_articles(article_fields_schema(include_content), articles),
+        media_type="application/json",
+    )
 
 
 @router.get("", status_code=status.HTTP_200_OK)
 async def fetch_all_articles(
     user: User = Security(get_current_user, scopes=[Role.admin]),
     db_session: Session = Depends(get_db),
-) -> list[ArticleSchema]:
-    articles = get_all_articles(db_session)
-    return parse_obj_as(list[ArticleSchema], articles)
+    created_after: datetime | None = Query(None),
+    created_before: datetime | None = Query(None),
+    include_content: bool = Query(True),
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+) -> list[ArticleSchema] | list[ArticleSummarySchema]:
+    def render(render_session: Session) -> bytes:
+        articles = get_all_articles(
+            render_session,
+            created_after,
+            created_before,
+            include_content,
+            limit,
+            offset,
+        )
+        return render_articles(article_fields_schema(include_content), articles)
+
+    # Admins share one scope, as they all see every article
+    key = (
+        "articles",
+        Role.admin,
+        created_after,
+        created_before,
+        include_content,
+        limit,
+        offset,
+    )
+    return await coalesced_json_response(key, render, db_session.get_bind())
 
 
 @router.post("", status_code=status.HTTP_201_CREATED)
@@ -41,6 +112,7 @@ async def post_article(
     cover_image: UploadFile | None = None,
     title: str = Form(...),
     content: str = Form(...),
+    upload_id: str | None = Form(None),
     user: User = Security(get_current_user, scopes=[Role.teacher, Role.student]),
     db_session: Session = Depends(get_db),
 ) -> ArticleSchema:
@@ -49,26 +121,151 @@ async def post_article(
         user,
         cover_image=cover_image,
         db_session=db_session,
+        upload_id=upload_id,
     )
-    return ArticleSchema.from_orm(article)
+    return json_response(ArticleSchema, article, status.HTTP_201_CREATED)
+
+
+@router.get("/batch", status_code=status.HTTP_200_OK)
+async def fetch_articles_batch(
+    ids: list[int] = Query(..., min_items=1, max_items=MAX_BATCH_SIZE),
+    user: User = Depends(get_current_user),
+    db_session: Session = Depends(get_db),
+) -> ArticleBatchSchema:
+    article_ids = list(dict.fromkeys(ids))
+    articles = get_visible_articles_by_ids(article_ids, user, db_session)
+    found = {article.id: article for article in articles}
+    return ArticleBatchSchema(
+        items=[found[article_id] for article_id in article_ids if article_id in found],
+        missing=[article_id for article_id in article_ids if article_id not in found],
+    )
+
+
+@router.get("/changes", status_code=status.HTTP_200_OK)
+async def fetch_article_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=settings.CHANGES_MAX_PAGE_SIZE),
+    user: User = Depends(get_current_user),
+    db_session: Session = Depends(get_db),
+) -> ArticleChangesSchema:
+    changes, articles = get_article_changes(since, limit, user, db_session)
+    return ArticleChangesSchema(
+        changes=[
+            ArticleChangeSchema(
+                cursor=change.id,
+                operation=change.operation,
+                article_id=change.article_id,
+                article=articles.get(change.article_id),
+            )
+            for change in changes
+        ],
+        cursor=changes[-1].id if changes else since,
+        has_more=len(changes) == limit,
+    )
+
+
+@router.get("/stats/authors", status_code=status.HTTP_200_OK)
+async def fetch_author_stats(
+    user: User = Security(get_current_user, scopes=[Role.admin]),
+    db_session: Session = Depends(get_db),
+    since: date | None = Query(None),
+    until: date | None = Query(None),
+    per_day: bool = Query(False),
+) -> list[AuthorArticleStatsSchema]:
+    stats = get_author_stats(db_session, since, until, per_day)
+    return parse_obj_as(list[AuthorArticleStatsSchema], stats)
+
+
+@router.get("/stats/teachers", status_code=status.HTTP_200_OK)
+async def fetch_teacher_stats(
+    user: User = Security(get_current_user, scopes=[Role.admin]),
+    db_session: Session = Depends(get_db),
+    since: date | None = Query(None),
+    until: date | None = Query(None),
+    per_day: bool = Query(False),
+) -> list[TeacherArticleStatsSchema]:
+    stats = get_teacher_stats(db_session, since, until, per_day)
+    return parse_obj_as(list[TeacherArticleStatsSchema], stats)
 
 
 @router.get("/own", status_code=status.HTTP_200_OK)
 async def fetch_own_articles(
     user: User = Security(get_current_user, scopes=[Role.teacher, Role.student]),
     db_session: Session = Depends(get_db),
-) -> list[ArticleSchema]:
-    articles = user.articles
-    return parse_obj_as(list[ArticleSchema], articles)
+    created_after: datetime | None = Query(None),
+    created_before: datetime | None = Query(None),
+    include_content: bool = Query(True),
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+) -> list[ArticleSchema] | list[ArticleSummarySchema]:
+    articles = get_articles_by_author_id(
+        user.id,
+        db_session,
+        created_after,
+        created_before,
+        include_content,
+        limit,
+        offset,
+    )
+    return article_list_response(articles, include_content)
 
 
 @router.get("/students", status_code=status.HTTP_200_OK)
 async def fetch_student_articles(
     user: User = Security(get_current_user, scopes=[Role.teacher]),
     db_session: Session = Depends(get_db),
-) -> list[ArticleSchema]:
-    articles = get_students_articles(user.id, db_session)
-    return parse_obj_as(list[ArticleSchema], articles)
+    created_after: datetime | None = Query(None),
+    created_before: datetime | None = Query(None),
+    include_content: bool = Query(True),
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+) -> list[ArticleSchema] | list[ArticleSummarySchema]:
+    def render(render_session: Session) -> bytes:
+        articles = get_students_articles(
+            user.id,
+            render_session,
+            created_after,
+            created_before,
+            include_content,
+            limit,
+            offset,
+        )
+        return render_articles(article_fields_schema(include_content), articles)
+
+    # Every teacher sees the articles of their own students
+    key = (
+        "articles",
+        "students",
+        user.id,
+        created_after,
+        created_before,
+        include_content,
+        limit,
+        offset,
+    )
+    return await coalesced_json_response(key, render, db_session.get_bind())
+
+
+@router.get("/students/events", response_class=EventStreamResponse)
+async def stream_student_article_events(
+    last_event_id: int | None = Header(None),
+    user: User = Security(get_current_user, scopes=[Role.teacher]),
+    db_session: Session = Depends(get_db),
+):
+    subscription = broker.subscribe(user.id)
+    try:
+        replay = []
+        if last_event_id is not None:
+            replay = get_student_article_events(user.id, last_event_id, db_session)
+    except Exception:
+        broker.unsubscribe(subscription)
+        raise
+    # Idle subscribers must not hold on to a database connection
+    db_session.close()
+    return EventStreamResponse(
+        stream_events(subscription, replay),
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("/students/{article_id}", status_code=status.HTTP_200_OK)
@@ -104,6 +301,18 @@ async def delete_own_article(
     delete_own_article_by_id(article_id, user, db_session)
 
 
+@router.post("/bulk-delete", status_code=status.HTTP_200_OK)
+async def delete_articles_in_bulk(
+    data: ArticleBulkDeleteSchema = Body(...),
+    user: User = Security(get_current_user, scopes=[Role.admin]),
+    db_session: Session = Depends(get_db),
+) -> ArticleBulkDeleteResultSchema:
+    deleted = bulk_delete_articles(
+        db_session, article_ids=data.ids, author_id=data.author_id
+    )
+    return ArticleBulkDeleteResultSchema(deleted=deleted)
+
+
 @router.delete("/{article_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_article(
     article_id: int,
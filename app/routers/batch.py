@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Body, Depends, Request, status
+from sqlalchemy.orm import Session
+
+from app.core.batch import run_batch
+from app.core.dependencies import get_db, get_current_user
+from app.core.profiling import ProfiledRoute
+from app.models.users import User
+from app.schemas.batch import BatchRequestSchema, BatchResponseSchema
+
+router = APIRouter(route_class=ProfiledRoute)
+
+
+@router.post("", status_code=status.HTTP_200_OK)
+async def run_batch_requests(
+    request: Request,
+    batch: BatchRequestSchema = Body(...),
+    user: User = Depends(get_current_user),
+    db_session: Session = Depends(get_db),
+) -> BatchResponseSchema:
+    responses = await run_batch(request, batch.requests, user, db_session)
+    return BatchResponseSchema(responses=responses)
@@ -0,0 +1,37 @@
+import os
+
+from fastapi import APIRouter, HTTPException, Security, status
+from fastapi.responses import FileResponse
+from pydantic import parse_obj_as
+from starlette.concurrency import run_in_threadpool
+
+from app.core.dependencies import get_current_user
+from app.core.enums import Role
+from app.core.profiling import ProfiledRoute, request_profiler
+from app.models.users import User
+from app.schemas.profiles import ProfileCaptureSchema
+
+router = APIRouter(route_class=ProfiledRoute)
+
+
+@router.get("", status_code=status.HTTP_200_OK)
+async def fetch_profiles(
+    user: User = Security(get_current_user, scopes=[Role.admin]),
+) -> list[ProfileCaptureSchema]:
+    captures = await run_in_threadpool(request_profiler.store.list)
+    return parse_obj_as(list[ProfileCaptureSchema], captures)
+
+
+@router.get("/{capture_id}", response_class=FileResponse)
+async def download_profile(
+    capture_id: str,
+    user: User = Security(get_current_user, scopes=[Role.admin]),
+):
+    store = request_profiler.store
+    capture = await run_in_threadpool(store.get, capture_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    path = store.profile_path(capture)
+    if capture.format == "html":
+        return FileResponse(path, media_type="text/html")
+    return FileResponse(path, filename=os.path.basename(path))
@@ -0,0 +1,63 @@
+from fastapi import APIRouter, Body, Depends, Header, Request, Response, status
+from sqlalchemy.orm import Session
+
+from app.controllers.uploads import (
+    create_upload,
+    get_own_upload,
+    write_upload_chunk,
+    complete_upload,
+)
+from app.core.dependencies import get_db, get_current_user
+from app.core.profiling import ProfiledRoute
+from app.models.users import User
+from app.schemas.uploads import UploadCreateSchema, UploadSchema
+
+router = APIRouter(route_class=ProfiledRoute)
+
+
+@router.post("", status_code=status.HTTP_201_CREATED)
+async def start_upload(
+    data: UploadCreateSchema = Body(...),
+    user: User = Depends(get_current_user),
+    db_session: Session = Depends(get_db),
+) -> UploadSchema:
+    return UploadSchema.from_orm(await create_upload(data, user, db_session))
+
+
+@router.get("/{upload_id}", status_code=status.HTTP_200_OK)
+async def fetch_upload(
+    upload_id: str,
+    response: Response,
+    user: User = Depends(get_current_user),
+    db_session: Session = Depends(get_db),
+) -> UploadSchema:
+    upload = get_own_upload(upload_id, user, db_session)
+    response.headers["Upload-Offset"] = str(upload.offset)
+    return UploadSchema.from_orm(upload)
+
+
+@router.put("/{upload_id}", status_code=status.HTTP_200_OK)
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    response: Response,
+    upload_offset: int = Header(..., ge=0),
+    user: User = Depends(get_current_user),
+    db_session: Session = Depends(get_db),
+) -> UploadSchema:
+    upload = get_own_upload(upload_id, user, db_session)
+    upload = await write_upload_chunk(
+        upload, upload_offset, request.stream(), db_session
+    )
+    response.headers["Upload-Offset"] = str(upload.offset)
+    return UploadSchema.from_orm(upload)
+
+
+@router.post("/{upload_id}/complete", status_code=status.HTTP_200_OK)
+async def finish_upload(
+    upload_id: str,
+    user: User = Depends(get_current_user),
+    db_session: Session = Depends(get_db),
+) -> UploadSchema:
+    upload = get_own_upload(upload_id, user, db_session)
+    return UploadSchema.from_orm(await complete_upload(upload, db_session))
@@ -5,6 +5,8 @@ from sqlalchemy.orm import Session
 from app.controllers.users import create_user, get_all_users, get_users_by_role
 from app.core.dependencies import get_db, get_current_user
 from app.core.enums import Role
+from app.core.profiling import ProfiledRoute
+from app.core.serialization import json_response
 from app.models.users import User
 from app.schemas.users import (
     UserSchema,
@@ -12,14 +14,14 @@ from app.schemas.users import (
     StudentProfileSchema,
 )
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 
 @router.get("/profile", status_code=status.HTTP_200_OK)
 async def fetch_own_profile(
     user: User = Depends(get_current_user), db_session: Session = Depends(get_db)
 ) -> UserSchema:
-    return UserSchema.from_orm(user)
+    return json_response(UserSchema, user)
 
 
 @router.post("", status_code=status.HTTP_201_CREATED)
@@ -27,7 +29,7 @@ async def register_user(
     user: UserCreateSchema = Body(...), db_session: Session = Depends(get_db)
 ) -> UserSchema:
     user = create_user(user, db_session)
-    return UserSchema.from_orm(user)
+    return json_response(UserSchema, user, status.HTTP_201_CREATED)
 
 
 @router.get("", status_code=status.HTTP_200_OK)
@@ -1,9 +1,11 @@
-from datetime import datetime
+from datetime import datetime, date
 
 from fastapi import File, UploadFile
 from pydantic import BaseModel, Field
-from pydantic import validator
+from pydantic import validator, root_validator
 
+from app.core.enums import ChangeOperation
+from app.core.storage import get_storage
 from app.schemas.users import UserSchema
 
 
@@ -13,10 +15,99 @@ class ArticleBaseSchema(BaseModel):
     cover_image: bytes | None = File(default=None)
 
 
-class ArticleSchema(ArticleBaseSchema):
+def fill_cover_image_url(cls, values):
+    cover_image = values.get("cover_image")
+    if cover_image and not values.get("cover_image_url"):
+        path = cover_image.decode() if isinstance(cover_image, bytes) else cover_image
+        values["cover_image_url"] = get_storage().url(path)
+    return values
+
+
+class ArticleFieldsSchema(ArticleBaseSchema):
+    """An article without its author, which list responses splice in."""
+
     id: int
     created_at: datetime
-    author: UserSchema
+    cover_image_url: str | None = None
+
+    _cover_image_url = root_validator(allow_reuse=True, skip_on_failure=True)(
+        fill_cover_image_url
+    )
+
+    class Config:
+        orm_mode = True
+
+
+class ArticleSchema(ArticleFieldsSchema):
+    # None when the author is missing from the main database
+    author: UserSchema | None
+
+
+class ArticleSummaryFieldsSchema(BaseModel):
+    id: int
+    title: str
+    cover_image: bytes | None = None
+    created_at: datetime
+    cover_image_url: str | None = None
+
+    _cover_image_url = root_validator(allow_reuse=True, skip_on_failure=True)(
+        fill_cover_image_url
+    )
+
+    class Config:
+        orm_mode = True
+
+
+class ArticleSummarySchema(ArticleSummaryFieldsSchema):
+    author: UserSchema | None
+
+
+class ArticleBatchSchema(BaseModel):
+    items: list[ArticleSchema]
+    missing: list[int]
+
+
+class ArticleBulkDeleteSchema(BaseModel):
+    ids: list[int] | None = Field(default=None, min_items=1)
+    author_id: int | None = None
+
+    @root_validator
+    def ids_or_author(cls, values):
+        if values.get("ids") is None and values.get("author_id") is None:
+            raise ValueError("Either ids or author_id must be provided")
+        return values
+
+
+class ArticleBulkDeleteResultSchema(BaseModel):
+    deleted: list[int]
+
+
+class ArticleChangeSchema(BaseModel):
+    cursor: int
+    operation: ChangeOperation
+    article_id: int
+    article: ArticleSchema | None = None
+
+
+class ArticleChangesSchema(BaseModel):
+    changes: list[ArticleChangeSchema]
+    cursor: int
+    has_more: bool
+
+
+class AuthorArticleStatsSchema(BaseModel):
+    author_id: int
+    day: date | None = None
+    articles: int
+
+    class Config:
+        orm_mode = True
+
+
+class TeacherArticleStatsSchema(BaseModel):
+    teacher_id: int
+    day: date | None = None
+    articles: int
 
     class Config:
         orm_mode = True
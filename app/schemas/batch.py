@@ -0,0 +1,44 @@
+from typing import Any, Literal
+
+from pydantic import BaseModel, Field
+from pydantic import validator, root_validator
+
+from app.core import settings
+
+
+class BatchItemSchema(BaseModel):
+    method: Literal["GET", "POST", "PUT", "DELETE"] = "GET"
+    path: str = Field(..., description="Path and query string, e.g. /articles/own")
+    headers: dict[str, str] = Field(default_factory=dict)
+    json_body: Any | None = Field(default=None, alias="json")
+    form: dict[str, str] | None = None
+
+    @validator("path")
+    def path_must_be_local(cls, value):
+        if not value.startswith("/") or value.startswith("//"):
+            raise ValueError("Path must start with a single /")
+        if value == "/batch" or value.startswith(("/batch/", "/batch?")):
+            raise ValueError("Batches cannot be nested")
+        return value
+
+    @root_validator(skip_on_failure=True)
+    def json_or_form(cls, values):
+        if values.get("json_body") is not None and values.get("form") is not None:
+            raise ValueError("Provide either json or form")
+        return values
+
+
+class BatchRequestSchema(BaseModel):
+    requests: list[BatchItemSchema] = Field(
+        ..., min_items=1, max_items=settings.BATCH_MAX_ITEMS
+    )
+
+
+class BatchItemResultSchema(BaseModel):
+    status: int
+    headers: dict[str, str]
+    body: Any | None = None
+
+
+class BatchResponseSchema(BaseModel):
+    responses: list[BatchItemResultSchema]
@@ -0,0 +1,18 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class ProfileCaptureSchema(BaseModel):
+    id: str
+    method: str
+    path: str
+    started_at: datetime
+    status_code: int | None = None
+    duration: float
+    phases: dict[str, float]
+    sql_queries: int
+    format: str
+
+    class Config:
+        orm_mode = True
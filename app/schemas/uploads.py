@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from pydantic import BaseModel, Field
+from pydantic import validator
+
+from app.core import settings
+from app.core.enums import UploadStatus
+
+COVER_IMAGE_TYPES = {"image/jpeg": ".jpg", "image/png": ".png"}
+
+
+class UploadCreateSchema(BaseModel):
+    filename: str = Field(..., min_length=1, max_length=256)
+    content_type: str
+    size: int = Field(..., gt=0, le=settings.UPLOADS_MAX_SIZE)
+    sha256: str | None = Field(default=None, regex=r"^[0-9a-f]{64}$")
+
+    @validator("content_type")
+    def content_type_must_be_image(cls, value):
+        if value not in COVER_IMAGE_TYPES:
+            raise ValueError("Cover image must be a jpeg or png")
+        return value
+
+
+class UploadSchema(BaseModel):
+    id: str
+    filename: str
+    size: int
+    offset: int
+    status: UploadStatus
+    expires_at: datetime
+
+    class Config:
+        orm_mode = True
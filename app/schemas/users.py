@@ -1,5 +1,5 @@
 from datetime import date
-from typing import Union
+from typing import ClassVar, Type, Union
 
 from pydantic import BaseModel, validator, Field
 
@@ -62,8 +62,27 @@ class StudentCreateProfileSchema(StudentBaseSchema):
 
 class UserBaseSchema(BaseModel):
     email: str
-    profile: Union[AdminProfileSchema, TeacherProfileSchema, StudentProfileSchema]
+    # Declared before the profile, which is validated against the schema of the role
     role: Role
+    profile: Union[AdminProfileSchema, TeacherProfileSchema, StudentProfileSchema]
+
+    profile_schemas: ClassVar[dict[Role, Type[BaseModel]]] = {
+        Role.admin: AdminProfileSchema,
+        Role.teacher: TeacherProfileSchema,
+        Role.student: StudentProfileSchema,
+    }
+
+    class Config:
+        # Profiles validated by role are taken as they are instead of trying every
+        # member of the union
+        smart_union = True
+
+    @validator("profile", pre=True)
+    def profile_of_role(cls, value, values):
+        schema = cls.profile_schemas.get(values.get("role"))
+        if schema is None or isinstance(value, schema):
+            return value
+        return schema.validate(value)
 
 
 class UserSchema(UserBaseSchema):
@@ -77,6 +96,12 @@ class UserCreateSchema(UserBaseSchema):
     password: str
     profile: Union[AdminProfileSchema, TeacherProfileSchema, StudentCreateProfileSchema]
 
+    profile_schemas: ClassVar[dict[Role, Type[BaseModel]]] = {
+        Role.admin: AdminProfileSchema,
+        Role.teacher: TeacherProfileSchema,
+        Role.student: StudentCreateProfileSchema,
+    }
+
     @validator("password")
     def validate_password(cls, v):
         if len(v) < 8:
@@ -88,14 +113,3 @@ class UserCreateSchema(UserBaseSchema):
         if not any(char.isalpha() for char in v):
             raise ValueError("Password must contain at least one letter")
         return v
-
-
-def profile_schema_factory(role):
-    if role == Role.admin:
-        return AdminProfileSchema
-    elif role == Role.teacher:
-        return TeacherProfileSchema
-    elif role == Role.student:
-        return StudentCreateProfileSchema
-    else:
-        raise ValueError("Invalid role")
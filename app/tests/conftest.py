@@ -5,8 +5,10 @@ from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
+from app.core.admission import admission_controller
 from app.core.db import Base
 from app.core.dependencies import get_db
+from app.core.jobs import JobWorker
 from app.main import app
 from .utils import load_fixtures
 
@@ -16,6 +18,8 @@ SQLALCHEMY_DATABASE_URL = f"sqlite:///./{DB_FILENAME}"
 
 ADMIN_USER_ID = "1"
 TEACHER_USER_ID = "4"
+OTHER_TEACHER_USER_ID = "5"
+STUDENT_USER_ID = "2"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
@@ -48,5 +52,11 @@ def client(db_session):
             db_session.close()
 
     app.dependency_overrides[get_db] = override_get_db
+    admission_controller.enabled = False
     load_fixtures(FIXTURES_DIR, db_session)
     yield TestClient(app)
+
+
+@pytest.fixture(scope="session")
+def job_worker(db_session):
+    return JobWorker(TestingSessionLocal, concurrency=2)
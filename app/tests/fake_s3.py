@@ -0,0 +1,136 @@
+import hashlib
+import re
+import uuid
+from xml.etree import ElementTree
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+from app.core.s3 import signature, UNSIGNED_PAYLOAD, local_name, find_text
+
+AUTHORIZATION_PATTERN = re.compile(
+    r"Credential=[^/]+/\d{8}/(?P<region>[^/]+)/s3/aws4_request, "
+    r"SignedHeaders=(?P<headers>[^,]+), Signature=(?P<signature>[0-9a-f]{64})"
+)
+
+
+class FakeS3:
+    """
+    In-process stand-in for the parts of S3 the storage backend uses. Requests are
+    checked against their signature, ``failures`` makes the next requests fail
+    with 503 errors.
+    """
+
+    def __init__(self, bucket: str, secret_key: str):
+        self.bucket = bucket
+        self.secret_key = secret_key
+        self.objects: dict[str, bytes] = {}
+        self.uploads: dict[str, dict] = {}
+        self.failures = 0
+        self.requests = 0
+        self.app = Starlette(
+            routes=[
+                Route(
+                    "/{bucket}/{key:path}",
+                    self.handle,
+                    methods=["GET", "PUT", "POST", "DELETE"],
+                )
+            ]
+        )
+
+    def verify(self, request: Request, payload: bytes) -> bool:
+        query = dict(request.query_params)
+        if "X-Amz-Signature" in query:
+            expected = query.pop("X-Amz-Signature")
+            region = query["X-Amz-Credential"].split("/")[2]
+            amz_date, payload_hash = query["X-Amz-Date"], UNSIGNED_PAYLOAD
+            signed = query["X-Amz-SignedHeaders"].split(";")
+        else:
+            match = AUTHORIZATION_PATTERN.search(request.headers["authorization"])
+            if match is None:
+                return False
+            expected, region = match["signature"], match["region"]
+            amz_date = request.headers["x-amz-date"]
+            payload_hash = request.headers["x-amz-content-sha256"]
+            if payload_hash != hashlib.sha256(payload).hexdigest():
+                return False
+            signed = match["headers"].split(";")
+        computed = signature(
+            self.secret_key,
+            region,
+            amz_date,
+            request.method,
+            request.url.path,
+            query,
+            {name: request.headers[name] for name in signed},
+            payload_hash,
+        )
+        return computed == expected
+
+    async def handle(self, request: Request) -> Response:
+        self.requests += 1
+        if self.failures:
+            self.failures -= 1
+            return Response(status_code=503)
+        payload = await request.body()
+        if not self.verify(request, payload):
+            return Response(status_code=403)
+        if request.path_params["bucket"] != self.bucket:
+            return Response(status_code=404)
+        key = request.path_params["key"]
+        query = request.query_params
+        upload = self.uploads.get(query.get("uploadId"))
+        if "uploadId" in query and (upload is None or upload["key"] != key):
+            return Response(status_code=404)
+
+        if request.method == "PUT" and upload is not None:
+            upload["parts"][int(query["partNumber"])] = payload
+            etag = f'"{hashlib.md5(payload).hexdigest()}"'
+            return Response(headers={"etag": etag})
+        if request.method == "PUT":
+            self.objects[key] = payload
+            return Response()
+        if request.method == "POST" and "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            self.uploads[upload_id] = {"key": key, "parts": {}}
+            return xml_response(
+                "InitiateMultipartUploadResult",
+                f"<Key>{key}</Key><UploadId>{upload_id}</UploadId>",
+            )
+        if request.method == "POST" and upload is not None:
+            numbers = [
+                int(find_text(part, "PartNumber"))
+                for part in ElementTree.fromstring(payload)
+                if local_name(part) == "Part"
+            ]
+            if numbers != sorted(numbers) or not set(numbers) <= set(upload["parts"]):
+                return Response(status_code=400)
+            self.objects[key] = b"".join(upload["parts"][number] for number in numbers)
+            del self.uploads[query["uploadId"]]
+            return xml_response("CompleteMultipartUploadResult", f"<Key>{key}</Key>")
+        if request.method == "GET" and upload is not None:
+            parts = "".join(
+                f"<Part><PartNumber>{number}</PartNumber>"
+                f'<ETag>"{hashlib.md5(data).hexdigest()}"</ETag></Part>'
+                for number, data in sorted(upload["parts"].items())
+            )
+            return xml_response(
+                "ListPartsResult", f"<IsTruncated>false</IsTruncated>{parts}"
+            )
+        if request.method == "GET":
+            if key not in self.objects:
+                return Response(status_code=404)
+            return Response(self.objects[key])
+        if request.method == "DELETE" and upload is not None:
+            del self.uploads[query["uploadId"]]
+            return Response(status_code=204)
+        self.objects.pop(key, None)
+        return Response(status_code=204)
+
+
+def xml_response(root: str, body: str) -> Response:
+    namespace = "http://s3.amazonaws.com/doc/2006-03-01/"
+    content = f'<{root} xmlns="{namespace}">{body}</{root}>'
+    return Response(content, media_type="application/xml")
@@ -0,0 +1,203 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI, status
+from fastapi.testclient import TestClient
+
+from app.core.admission import (
+    AdmissionController,
+    AdmissionMiddleware,
+    InMemoryRateLimitBackend,
+    RouteClass,
+)
+from app.core.enums import Role
+from app.core.events import EventStreamResponse, EventStreamRoutes
+
+
+def make_client(controller: AdmissionController) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(AdmissionMiddleware, controller=controller)
+
+    @app.get("/read")
+    async def read():
+        return {"ok": True}
+
+    @app.post("/write")
+    async def write():
+        return {"ok": True}
+
+    return TestClient(app)
+
+
+def test_rate_limit_per_principal():
+    controller = AdmissionController(role_limits={Role.student: (0.01, 2)})
+    controller.remember_role("1", Role.student)
+    controller.remember_role("2", Role.student)
+    client = make_client(controller)
+    headers = {"user-id": "1"}
+
+    assert client.get("/read", headers=headers).status_code == status.HTTP_200_OK
+    assert client.get("/read", headers=headers).status_code == status.HTTP_200_OK
+    response = client.get("/read", headers=headers)
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert int(response.headers["Retry-After"]) >= 1
+
+    other = {"user-id": "2"}
+    assert client.get("/read", headers=other).status_code == status.HTTP_200_OK
+
+
+def test_rate_limit_by_role():
+    controller = AdmissionController(
+        role_limits={None: (0.01, 1), Role.admin: (0.01, 3)}
+    )
+    controller.remember_role("1", Role.admin)
+    client = make_client(controller)
+
+    responses = [client.get("/read", headers={"user-id": "1"}) for _ in range(3)]
+    assert all(response.status_code == status.HTTP_200_OK for response in responses)
+    responses = [client.get("/read", headers={"user-id": "2"}) for _ in range(2)]
+    assert responses[-1].status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+
+def test_unverified_principals_share_the_client_bucket():
+    controller = AdmissionController(
+        role_limits={None: (0.01, 2), Role.student: (0.01, 2)}
+    )
+    client = make_client(controller)
+
+    for user_id in ("1", "2"):
+        response = client.get("/read", headers={"user-id": user_id})
+        assert response.status_code == status.HTTP_200_OK
+    response = client.get("/read", headers={"user-id": "3"})
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+    controller.remember_role("1", Role.student)
+    response = client.get("/read", headers={"user-id": "1"})
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_concurrency_limit_per_route_class():
+    controller = AdmissionController(
+        role_limits={None: (100, 100)},
+        concurrency_limits={RouteClass.read: 1, RouteClass.write: 0},
+    )
+    client = make_client(controller)
+    assert client.get("/read").status_code == status.HTTP_200_OK
+
+    response = client.post("/write")
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_token_bucket_refills():
+    backend = InMemoryRateLimitBackend()
+    assert asyncio.run(backend.acquire("key", 1000, 1)) == 0
+    assert asyncio.run(backend.acquire("key", 0.5, 1)) > 0
+
+
+def test_concurrency_limit_rejects_while_slots_are_held():
+    controller = AdmissionController(
+        role_limits={None: (100, 100)}, concurrency_limits={RouteClass.read: 1}
+    )
+    app = FastAPI()
+    app.add_middleware(AdmissionMiddleware, controller=controller)
+
+    async def run():
+        entered, release = asyncio.Event(), asyncio.Event()
+
+        @app.get("/slow")
+        async def slow():
+            entered.set()
+            await release.wait()
+            return {"ok": True}
+
+        @app.get("/read")
+        async def read():
+            return {"ok": True}
+
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            held = asyncio.ensure_future(client.get("/slow"))
+            await entered.wait()
+            rejected = await client.get("/read")
+            release.set()
+            await held
+            admitted = await client.get("/read")
+        return held.result(), rejected, admitted
+
+    held, rejected, admitted = asyncio.run(run())
+    assert held.status_code == status.HTTP_200_OK
+    assert rejected.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert admitted.status_code == status.HTTP_200_OK
+    assert controller.limiters[RouteClass.read].in_flight == 0
+
+
+def make_stream_app(controller: AdmissionController) -> tuple[FastAPI, dict]:
+    app = FastAPI()
+    app.add_middleware(AdmissionMiddleware, controller=controller)
+    entered, release = asyncio.Event(), asyncio.Event()
+    events = {"entered": entered, "release": release}
+
+    @app.get("/events", response_class=EventStreamResponse)
+    async def stream():
+        entered.set()
+        await release.wait()
+        return EventStreamResponse(iter([": done\n\n"]))
+
+    @app.get("/slow")
+    async def slow():
+        entered.set()
+        await release.wait()
+        return {"ok": True}
+
+    @app.get("/read")
+    async def read():
+        return {"ok": True}
+
+    controller.stream_routes.register(app.routes)
+    return app, events
+
+
+def stream_controller() -> AdmissionController:
+    return AdmissionController(
+        role_limits={None: (100, 100)},
+        concurrency_limits={RouteClass.read: 1, RouteClass.stream: 1},
+        stream_routes=EventStreamRoutes(),
+    )
+
+
+async def hold_and_get(app: FastAPI, events: dict, held_path: str, paths: list):
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        held = asyncio.ensure_future(client.get(held_path))
+        await events["entered"].wait()
+        responses = [await client.get(path, headers=headers) for path, headers in paths]
+        events["release"].set()
+        await held
+    return [response.status_code for response in responses]
+
+
+def test_event_streams_are_capped_by_route():
+    controller = stream_controller()
+
+    async def run():
+        app, events = make_stream_app(controller)
+        # The stream does not announce itself with an Accept header
+        return await hold_and_get(
+            app, events, "/events", [("/read", {}), ("/events", {})]
+        )
+
+    assert asyncio.run(run()) == [
+        status.HTTP_200_OK,
+        status.HTTP_503_SERVICE_UNAVAILABLE,
+    ]
+
+
+def test_accept_header_does_not_move_reads_to_the_stream_cap():
+    controller = stream_controller()
+    spoofed = {"accept": "text/event-stream"}
+
+    async def run():
+        app, events = make_stream_app(controller)
+        return await hold_and_get(app, events, "/slow", [("/read", spoofed)])
+
+    assert asyncio.run(run()) == [status.HTTP_503_SERVICE_UNAVAILABLE]
+    assert controller.limiters[RouteClass.stream].in_flight == 0
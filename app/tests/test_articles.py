@@ -1,12 +1,42 @@
+import json
 import os
 import tempfile
+from datetime import date, timedelta
 
 from fastapi import status
+from sqlalchemy import inspect, text
+from sqlalchemy.orm.attributes import set_committed_value
 
+from app.controllers import articles as articles_controller
+from app.controllers.articles import (
+    get_all_articles,
+    migrate_article_bodies,
+    prepare_legacy_content,
+)
+from app.controllers.changes import compact_article_changes, get_compaction_horizon
+from app.controllers.stats import rebuild_article_stats
+from app.core import fragments, settings
+from app.core.enums import ChangeOperation
+from app.core.fragments import author_fragments
 from app.core.storage import MEDIA_ROOT
-from app.schemas.articles import ArticleSchema
+from app.models.articles import ArticleBody
+from app.models.users import User, Teacher
+from app.routers.articles import MAX_BATCH_SIZE
+from app.schemas.articles import (
+    ArticleSchema,
+    ArticleSummarySchema,
+    ArticleBatchSchema,
+    ArticleChangesSchema,
+    AuthorArticleStatsSchema,
+    TeacherArticleStatsSchema,
+)
 from app.schemas.users import UserSchema
-from .conftest import ADMIN_USER_ID, TEACHER_USER_ID
+from .conftest import (
+    ADMIN_USER_ID,
+    TEACHER_USER_ID,
+    OTHER_TEACHER_USER_ID,
+    STUDENT_USER_ID,
+)
 
 
 def test_fetch_all_articles(client):
@@ -72,6 +102,49 @@ def test_fetch_own_article(client):
     assert article.id == article_id
 
 
+def test_fetch_articles_batch(client):
+    headers = {"user-id": TEACHER_USER_ID}
+    params = {"ids": [3, 1, 2, 999, 3]}
+    response = client.get("/articles/batch", params=params, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    batch = ArticleBatchSchema(**response.json())
+    assert [article.id for article in batch.items] == [3, 1]
+    assert batch.missing == [2, 999]
+
+
+def test_fetch_articles_batch_fails_when_too_large(client):
+    headers = {"user-id": ADMIN_USER_ID}
+    params = {"ids": list(range(1, MAX_BATCH_SIZE + 2))}
+    response = client.get("/articles/batch", params=params, headers=headers)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_fetch_all_articles_within_date_window(client):
+    headers = {"user-id": ADMIN_USER_ID}
+    params = {
+        "created_after": "2023-02-01T00:00:00",
+        "created_before": "2023-03-01T00:00:00",
+    }
+    response = client.get("/articles", params=params, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert [article["id"] for article in response.json()] == [1, 2, 3, 4]
+
+    params = {
+        "created_after": "2023-03-01T00:00:00",
+        "created_before": "2023-04-01T00:00:00",
+    }
+    response = client.get("/articles", params=params, headers=headers)
+    assert response.json() == []
+
+
+def test_fetch_student_articles_within_date_window(client):
+    headers = {"user-id": TEACHER_USER_ID}
+    params = {"created_before": "2023-01-01T00:00:00"}
+    response = client.get("/articles/students", params=params, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == []
+
+
 def test_create_article(client):
     headers = {"user-id": TEACHER_USER_ID}
     with tempfile.NamedTemporaryFile(suffix=".jpg") as temp_file:
@@ -117,6 +190,76 @@ def test_create_article_fails_with_wrong_body(client):
     assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
 
 
+def test_long_article_content_is_stored_compressed(client, db_session):
+    headers = {"user-id": STUDENT_USER_ID}
+    content = "Long article content. " * 500
+    article_data = {"title": "Long Article", "content": content}
+    response = client.post("/articles", data=article_data, headers=headers)
+    assert response.status_code == status.HTTP_201_CREATED
+    article_id = response.json()["id"]
+
+    body = db_session.get(ArticleBody, article_id)
+    assert body.compression is not None
+    assert body.content is None
+    assert len(body.compressed_content) < len(content)
+
+    response = client.get(f"/articles/own/{article_id}", headers=headers)
+    assert ArticleSchema(**response.json()).content == content
+
+    response = client.delete(f"/articles/own/{article_id}", headers=headers)
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    db_session.expire_all()
+    assert db_session.get(ArticleBody, article_id) is None
+
+
+def test_legacy_contents_are_read_until_migrated(client, db_session, monkeypatch):
+    monkeypatch.setattr(articles_controller, "legacy_content", False)
+    headers = {"user-id": STUDENT_USER_ID}
+    article_data = {"title": "Legacy Article", "content": "Legacy content"}
+    response = client.post("/articles", data=article_data, headers=headers)
+    article_id = response.json()["id"]
+    # An article written before bodies had their own table
+    db_session.execute(text("ALTER TABLE articles ADD COLUMN content TEXT"))
+    db_session.execute(
+        text("UPDATE articles SET content = 'Legacy content' WHERE id = :id"),
+        {"id": article_id},
+    )
+    db_session.delete(db_session.get(ArticleBody, article_id))
+    db_session.commit()
+
+    prepare_legacy_content(db_session.connection())
+    assert articles_controller.legacy_content
+    response = client.get(f"/articles/own/{article_id}", headers=headers)
+    assert ArticleSchema(**response.json()).content == "Legacy content"
+    response = client.get("/articles/own", headers=headers)
+    assert "Legacy content" in [article["content"] for article in response.json()]
+    article_data = {"title": "New Article", "content": "New content"}
+    response = client.post("/articles", data=article_data, headers=headers)
+    assert response.status_code == status.HTTP_201_CREATED
+
+    assert migrate_article_bodies(db_session) == 1
+    prepare_legacy_content(db_session.connection())
+    assert not articles_controller.legacy_content
+    response = client.get(f"/articles/own/{article_id}", headers=headers)
+    assert ArticleSchema(**response.json()).content == "Legacy content"
+
+    migrate_article_bodies(db_session, drop_column=True)
+    columns = inspect(db_session.connection()).get_columns("articles")
+    assert "content" not in {column["name"] for column in columns}
+
+
+def test_fetch_articles_without_content(client):
+    headers = {"user-id": TEACHER_USER_ID}
+    response = client.get(
+        "/articles/students", params={"include_content": False}, headers=headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()
+    for article in response.json():
+        assert "content" not in article
+        ArticleSummarySchema(**article)
+
+
 def test_delete_own_article(client):
     headers = {"user-id": TEACHER_USER_ID}
     articles_response = client.get("/articles/own", headers=headers)
@@ -134,3 +277,244 @@ def test_delete_article(client):
     article_id = 1
     response = client.delete(f"/articles/{article_id}", headers=headers)
     assert response.status_code == status.HTTP_204_NO_CONTENT
+
+
+def test_bulk_delete_articles(client):
+    headers = {"user-id": ADMIN_USER_ID}
+    response = client.post(
+        "/articles/bulk-delete", json={"author_id": 5}, headers=headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"deleted": [4]}
+
+    response = client.post(
+        "/articles/bulk-delete", json={"ids": [2, 999]}, headers=headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"deleted": [2]}
+
+
+def test_bulk_delete_articles_fails_for_non_admin(client):
+    headers = {"user-id": TEACHER_USER_ID}
+    response = client.post("/articles/bulk-delete", json={"ids": [3]}, headers=headers)
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_bulk_delete_articles_fails_without_criteria(client):
+    headers = {"user-id": ADMIN_USER_ID}
+    response = client.post("/articles/bulk-delete", json={}, headers=headers)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_delete_article_removes_unreferenced_cover_image(client, job_worker):
+    headers = {"user-id": TEACHER_USER_ID}
+    article_ids = []
+    with tempfile.NamedTemporaryFile(suffix=".jpg") as temp_file:
+        for _ in range(2):
+            temp_file.write(b"test")
+            temp_file.seek(0)
+            response = client.post(
+                "/articles",
+                data={"title": "Shared Cover", "content": "Shared Cover Content"},
+                files={"cover_image": temp_file},
+                headers=headers,
+            )
+            article_ids.append(response.json()["id"])
+        path = os.path.join(MEDIA_ROOT, os.path.basename(temp_file.name))
+
+    client.delete(f"/articles/own/{article_ids[0]}", headers=headers)
+    assert job_worker.run_once() == 1
+    assert os.path.exists(path)
+
+    client.delete(f"/articles/own/{article_ids[1]}", headers=headers)
+    assert os.path.exists(path)
+    assert job_worker.run_once() == 1
+    assert not os.path.exists(path)
+
+
+def test_article_stats_follow_writes(client, db_session):
+    rebuild_article_stats(db_session)
+    admin_headers = {"user-id": ADMIN_USER_ID}
+    teacher_headers = {"user-id": TEACHER_USER_ID}
+
+    def author_count(author_id):
+        response = client.get("/articles/stats/authors", headers=admin_headers)
+        assert response.status_code == status.HTTP_200_OK
+        stats = [AuthorArticleStatsSchema(**row) for row in response.json()]
+        return sum(row.articles for row in stats if row.author_id == author_id)
+
+    initial = author_count(int(TEACHER_USER_ID))
+    article_data = {"title": "Counted Article", "content": "Counted Content"}
+    response = client.post("/articles", data=article_data, headers=teacher_headers)
+    article_id = response.json()["id"]
+    assert author_count(int(TEACHER_USER_ID)) == initial + 1
+
+    params = {"since": date.today().isoformat(), "per_day": True}
+    response = client.get(
+        "/articles/stats/authors", params=params, headers=admin_headers
+    )
+    stats = [AuthorArticleStatsSchema(**row) for row in response.json()]
+    assert {(row.author_id, row.day) for row in stats} >= {(4, date.today())}
+
+    client.delete(f"/articles/own/{article_id}", headers=teacher_headers)
+    assert author_count(int(TEACHER_USER_ID)) == initial
+
+
+def test_teacher_stats_aggregate_students(client, db_session):
+    rebuild_article_stats(db_session)
+    headers = {"user-id": ADMIN_USER_ID}
+    authors = client.get("/articles/stats/authors", headers=headers).json()
+    response = client.get("/articles/stats/teachers", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    teachers = [TeacherArticleStatsSchema(**row) for row in response.json()]
+    student_articles = sum(row["articles"] for row in authors if row["author_id"] == 2)
+    assert [row.articles for row in teachers if row.teacher_id == 4] == (
+        [student_articles] if student_articles else []
+    )
+
+
+def test_article_stats_fail_for_non_admin(client):
+    headers = {"user-id": TEACHER_USER_ID}
+    response = client.get("/articles/stats/teachers", headers=headers)
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_fetch_article_changes(client, monkeypatch):
+    monkeypatch.setattr(settings, "CHANGES_SETTLE_SECONDS", 0)
+    teacher_headers = {"user-id": TEACHER_USER_ID}
+    other_teacher_headers = {"user-id": OTHER_TEACHER_USER_ID}
+    student_headers = {"user-id": STUDENT_USER_ID}
+
+    response = client.get("/articles/changes", headers=teacher_headers)
+    assert response.status_code == status.HTTP_200_OK
+    cursor = ArticleChangesSchema(**response.json()).cursor
+    other_cursor = client.get(
+        "/articles/changes", headers=other_teacher_headers
+    ).json()["cursor"]
+
+    article_data = {"title": "Synced Article", "content": "Synced Content"}
+    response = client.post("/articles", data=article_data, headers=student_headers)
+    article_id = response.json()["id"]
+    client.delete(f"/articles/own/{article_id}", headers=student_headers)
+
+    params = {"since": cursor}
+    response = client.get("/articles/changes", params=params, headers=teacher_headers)
+    feed = ArticleChangesSchema(**response.json())
+    assert [(change.operation, change.article_id) for change in feed.changes] == [
+        (ChangeOperation.create, article_id),
+        (ChangeOperation.delete, article_id),
+    ]
+    assert feed.changes[0].article is None
+    assert feed.cursor == feed.changes[-1].cursor
+    assert not feed.has_more
+
+    params = {"since": feed.cursor}
+    response = client.get("/articles/changes", params=params, headers=teacher_headers)
+    assert response.json() == {"changes": [], "cursor": feed.cursor, "has_more": False}
+
+    params = {"since": other_cursor}
+    response = client.get(
+        "/articles/changes", params=params, headers=other_teacher_headers
+    )
+    assert response.json()["changes"] == []
+
+
+def test_fetch_article_changes_includes_created_article(client, monkeypatch):
+    monkeypatch.setattr(settings, "CHANGES_SETTLE_SECONDS", 0)
+    headers = {"user-id": STUDENT_USER_ID}
+    cursor = client.get("/articles/changes", headers=headers).json()["cursor"]
+
+    article_data = {"title": "Fresh Article", "content": "Fresh Content"}
+    article_id = client.post("/articles", data=article_data, headers=headers).json()[
+        "id"
+    ]
+    params = {"since": cursor, "limit": 1}
+    response = client.get("/articles/changes", params=params, headers=headers)
+    feed = ArticleChangesSchema(**response.json())
+    assert feed.changes[0].article.id == article_id
+    assert feed.has_more
+
+
+def test_compacted_article_changes_require_resync(client, db_session, monkeypatch):
+    monkeypatch.setattr(settings, "CHANGES_SETTLE_SECONDS", 0)
+    headers = {"user-id": TEACHER_USER_ID}
+    compact_article_changes(db_session, timedelta(0))
+    db_session.commit()
+
+    response = client.get("/articles/changes", params={"since": 0}, headers=headers)
+    assert response.status_code == status.HTTP_410_GONE
+
+    horizon = get_compaction_horizon(db_session)
+    response = client.get(
+        "/articles/changes", params={"since": horizon}, headers=headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    operations = {change["operation"] for change in response.json()["changes"]}
+    assert operations <= {ChangeOperation.create}
+
+
+def test_article_lists_splice_cached_authors(client, db_session, monkeypatch):
+    rendered = []
+    render_json = fragments.render_json
+
+    def counted_render_json(schema_type, objects):
+        if schema_type is UserSchema:
+            rendered.append(objects.id)
+        return render_json(schema_type, objects)
+
+    monkeypatch.setattr(fragments, "render_json", counted_render_json)
+    author_fragments.clear()
+    for _ in range(2):
+        response = client.get("/articles", headers={"user-id": ADMIN_USER_ID})
+        assert response.status_code == status.HTTP_200_OK
+        articles = get_all_articles(db_session)
+        assert response.json() == json.loads(render_json(list[ArticleSchema], articles))
+    assert sorted(rendered) == sorted({article.author_id for article in articles})
+
+
+def test_article_lists_render_missing_authors_as_null(client, monkeypatch):
+    attach_authors = articles_controller.attach_authors
+
+    def attach_authors_without_first(articles, db_session):
+        articles = attach_authors(articles, db_session)
+        # The author of the first article is missing from the main database
+        set_committed_value(articles[0], "author", None)
+        return articles
+
+    monkeypatch.setattr(
+        articles_controller, "attach_authors", attach_authors_without_first
+    )
+    response = client.get("/articles", headers={"user-id": ADMIN_USER_ID})
+    assert response.status_code == status.HTTP_200_OK
+    first, *others = response.json()
+    assert first["author"] is None
+    assert all(article["author"] is not None for article in others)
+
+
+def test_author_fragments_follow_profile_changes(client, db_session):
+    headers = {"user-id": TEACHER_USER_ID}
+    response = client.get("/articles/students", headers=headers)
+    authors = [article["author"] for article in response.json()]
+    assert authors[0]["profile"]["teachers"][0]["last_name"] == "Teacher1"
+    versions = {
+        user.id: user.profile_version
+        for user in db_session.query(User).filter(
+            User.id.in_([author["id"] for author in authors])
+        )
+    }
+
+    teacher = db_session.query(Teacher).filter(Teacher.user_id == 4).one()
+    teacher.last_name = "Renamed"
+    db_session.commit()
+    try:
+        response = client.get("/articles/students", headers=headers)
+        assert all(
+            article["author"]["profile"]["teachers"][0]["last_name"] == "Renamed"
+            for article in response.json()
+        )
+        for user_id, version in versions.items():
+            assert db_session.get(User, user_id).profile_version == version + 1
+    finally:
+        teacher = db_session.query(Teacher).filter(Teacher.user_id == 4).one()
+        teacher.last_name = "Teacher1"
+        db_session.commit()
@@ -0,0 +1,156 @@
+import pytest
+from fastapi import Request, status
+
+from app.controllers import articles as articles_controller
+from app.core import dependencies
+from app.core.admission import admission_controller, InMemoryRateLimitBackend
+from app.core.dependencies import get_db
+from app.core.enums import Role
+from app.main import app
+from app.models.articles import Article
+from .conftest import TEACHER_USER_ID
+
+
+@pytest.fixture
+def batch_client(client, db_session, monkeypatch):
+    def override_get_db(request: Request):
+        yield getattr(request.state, "batch_session", None) or db_session
+
+    lookups = []
+    get_user_by_id = dependencies.get_user_by_id
+
+    def counted_get_user_by_id(user_id, db_session):
+        lookups.append(user_id)
+        return get_user_by_id(user_id, db_session)
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, override_get_db)
+    monkeypatch.setattr(dependencies, "get_user_by_id", counted_get_user_by_id)
+    client.lookups = lookups
+    return client
+
+
+def run_batch(client, requests):
+    response = client.post(
+        "/batch", json={"requests": requests}, headers={"user-id": TEACHER_USER_ID}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    return response.json()["responses"]
+
+
+def test_batch_runs_items_as_one_principal(batch_client):
+    responses = run_batch(
+        batch_client,
+        [
+            {"path": "/users/profile"},
+            {"path": "/users/students"},
+            {"path": "/articles/own"},
+            {"path": "/articles/students?limit=2&include_content=false"},
+            {"path": "/articles/own/999999"},
+            {"path": "/articles"},
+            {
+                "method": "POST",
+                "path": "/articles",
+                "form": {"title": "Batched", "content": "Batched content"},
+            },
+            {"path": "/articles/own"},
+        ],
+    )
+    assert [response["status"] for response in responses] == [
+        status.HTTP_200_OK,
+        status.HTTP_200_OK,
+        status.HTTP_200_OK,
+        status.HTTP_200_OK,
+        status.HTTP_404_NOT_FOUND,
+        status.HTTP_403_FORBIDDEN,
+        status.HTTP_201_CREATED,
+        status.HTTP_200_OK,
+    ]
+    assert responses[0]["body"]["id"] == int(TEACHER_USER_ID)
+    assert len(responses[3]["body"]) <= 2
+    assert all("content" not in article for article in responses[3]["body"])
+    created = responses[6]["body"]
+    assert created["id"] in [article["id"] for article in responses[7]["body"]]
+    assert created["id"] not in [article["id"] for article in responses[2]["body"]]
+    assert batch_client.lookups == [TEACHER_USER_ID]
+
+    responses = run_batch(
+        batch_client, [{"method": "DELETE", "path": f"/articles/own/{created['id']}"}]
+    )
+    assert responses[0]["status"] == status.HTTP_204_NO_CONTENT
+
+
+def test_batch_reports_item_errors(batch_client):
+    responses = run_batch(
+        batch_client,
+        [
+            {"path": "/missing"},
+            {"path": "/articles/students/events"},
+            {"method": "POST", "path": "/articles", "form": {"title": "No content"}},
+        ],
+    )
+    assert [response["status"] for response in responses] == [
+        status.HTTP_404_NOT_FOUND,
+        status.HTTP_400_BAD_REQUEST,
+        status.HTTP_422_UNPROCESSABLE_ENTITY,
+    ]
+
+
+def test_batch_items_are_admitted_one_by_one(batch_client, monkeypatch):
+    monkeypatch.setattr(admission_controller, "enabled", True)
+    monkeypatch.setattr(admission_controller, "backend", InMemoryRateLimitBackend())
+    monkeypatch.setattr(
+        admission_controller, "role_limits", {None: (0.01, 3), Role.teacher: (0.01, 3)}
+    )
+    responses = run_batch(batch_client, [{"path": "/users/profile"}] * 3)
+    # The batch takes a token of its own, which leaves two for its items
+    assert sorted(response["status"] for response in responses) == [
+        status.HTTP_200_OK,
+        status.HTTP_200_OK,
+        status.HTTP_429_TOO_MANY_REQUESTS,
+    ]
+    assert all(
+        limiter.in_flight == 0 for limiter in admission_controller.limiters.values()
+    )
+
+
+def test_failed_write_does_not_break_later_items(batch_client, monkeypatch):
+    record_article_changes = articles_controller.record_article_changes
+    failures = []
+
+    def failing_record_article_changes(db_session, *args):
+        if not failures:
+            failures.append(1)
+            # Fails the flush, which leaves the transaction to be rolled back
+            db_session.add(Article(author_id=int(TEACHER_USER_ID)))
+            db_session.flush()
+        return record_article_changes(db_session, *args)
+
+    monkeypatch.setattr(
+        articles_controller, "record_article_changes", failing_record_article_changes
+    )
+    form = {"title": "After failure", "content": "After failure"}
+    responses = run_batch(
+        batch_client,
+        [
+            {"method": "POST", "path": "/articles", "form": form},
+            {"method": "POST", "path": "/articles", "form": form},
+        ],
+    )
+    assert [response["status"] for response in responses] == [
+        status.HTTP_500_INTERNAL_SERVER_ERROR,
+        status.HTTP_201_CREATED,
+    ]
+    responses = run_batch(
+        batch_client,
+        [{"method": "DELETE", "path": f"/articles/own/{responses[1]['body']['id']}"}],
+    )
+    assert responses[0]["status"] == status.HTTP_204_NO_CONTENT
+
+
+def test_batches_cannot_be_nested(batch_client):
+    response = batch_client.post(
+        "/batch",
+        json={"requests": [{"method": "POST", "path": "/batch"}]},
+        headers={"user-id": TEACHER_USER_ID},
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
@@ -0,0 +1,204 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI, Header, Request, status
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app.core.breaker import (
+    BreakerState,
+    CircuitBreaker,
+    CircuitBreakerMiddleware,
+    StaleResponseStore,
+)
+from app.core.events import EventStreamResponse, EventStreamRoutes
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_breaker(clock: FakeClock, **kwargs) -> CircuitBreaker:
+    options = dict(
+        window=10,
+        min_calls=4,
+        failure_rate=0.5,
+        slow_call_seconds=1.0,
+        slow_call_rate=0.5,
+        open_seconds=5.0,
+        enabled=True,
+        clock=clock,
+    )
+    return CircuitBreaker(**{**options, **kwargs})
+
+
+def make_client(breaker: CircuitBreaker) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(
+        CircuitBreakerMiddleware, breaker=breaker, store=StaleResponseStore()
+    )
+    reads = []
+
+    def get_db():
+        with breaker.guard():
+            yield
+
+    @app.get("/items")
+    async def read(user_id: str = Header(None), db_session=Depends(get_db)):
+        reads.append(user_id)
+        return {"user": user_id, "reads": len(reads)}
+
+    @app.post("/items")
+    async def write(db_session=Depends(get_db)):
+        return {"ok": True}
+
+    return TestClient(app)
+
+
+def test_breaker_opens_on_failures_and_closes_after_probe():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    for failed in (False, True, False):
+        breaker.record(failed)
+    assert breaker.state == BreakerState.closed
+    breaker.record(failed=True)
+    assert breaker.state == BreakerState.open
+    assert breaker.acquire() is None
+
+    clock.now += 5
+    assert breaker.state == BreakerState.half_open
+    probe = breaker.acquire()
+    assert probe is True
+    assert breaker.acquire() is None
+    breaker.record(failed=False, latency=0.01)
+    breaker.release(probe)
+    assert breaker.state == BreakerState.closed
+
+
+def test_slow_probe_reopens_breaker():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    for _ in range(4):
+        breaker.record(failed=False, latency=2.0)
+    assert breaker.state == BreakerState.open
+
+    clock.now += 5
+    probe = breaker.acquire()
+    breaker.record(failed=False, latency=2.0)
+    breaker.release(probe)
+    assert breaker.state == BreakerState.open
+    assert breaker.retry_after() == 5
+
+
+def test_old_calls_leave_the_window():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    for _ in range(3):
+        breaker.record(failed=True)
+    clock.now += 10
+    breaker.record(failed=True)
+    assert breaker.state == BreakerState.closed
+
+
+def test_breaker_watches_engine_errors():
+    engine = create_engine("sqlite://")
+    breaker = make_breaker(FakeClock(), min_calls=2)
+    breaker.watch(engine)
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        with pytest.raises(OperationalError):
+            connection.execute(text("SELECT * FROM missing"))
+    assert breaker.state == BreakerState.open
+    engine.dispose()
+
+
+def test_open_breaker_serves_stale_reads_and_rejects_writes():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    client = make_client(breaker)
+    headers = {"user-id": "1"}
+    fresh = client.get("/items", headers=headers)
+    assert fresh.status_code == status.HTTP_200_OK
+    assert "warning" not in fresh.headers
+
+    for _ in range(4):
+        breaker.record(failed=True)
+    response = client.get("/items", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == fresh.json()
+    assert response.headers["warning"] == '110 - "Response is Stale"'
+    assert int(response.headers["age"]) >= 0
+
+    response = client.get("/items", headers={"user-id": "2"})
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    response = client.post("/items")
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert int(response.headers["retry-after"]) == 5
+
+    clock.now += 5
+    response = client.get("/items", headers=headers)
+    assert "warning" not in response.headers
+    assert response.json()["reads"] == 2
+    assert breaker.state == BreakerState.closed
+
+
+def test_streaming_probe_does_not_hold_the_breaker():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    app = FastAPI()
+    stream_routes = EventStreamRoutes()
+
+    def get_db(request: Request):
+        with breaker.guard(probe=not stream_routes.matches(request.scope)):
+            yield
+
+    async def run():
+        release = asyncio.Event()
+
+        async def stream():
+            yield "started"
+            await release.wait()
+            yield "done"
+
+        @app.get("/events", response_class=EventStreamResponse)
+        async def events(db_session=Depends(get_db)):
+            return EventStreamResponse(stream())
+
+        @app.get("/download")
+        async def download(db_session=Depends(get_db)):
+            breaker.record(failed=False, latency=0.01)
+            return StreamingResponse(stream())
+
+        @app.get("/items")
+        async def read(db_session=Depends(get_db)):
+            return {"ok": True}
+
+        stream_routes.register(app.routes)
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            events = await client.get("/events")
+            # Asking for an event stream does not excuse a request from probing
+            download = asyncio.ensure_future(
+                client.get("/download", headers={"accept": "text/event-stream"})
+            )
+            while breaker.state != BreakerState.closed:
+                await asyncio.sleep(0.01)
+            read = await client.get("/items")
+            release.set()
+            return events, read, await download
+
+    for _ in range(4):
+        breaker.record(failed=True)
+    clock.now += 5
+    assert breaker.state == BreakerState.half_open
+    events, read, download = asyncio.run(asyncio.wait_for(run(), 5))
+    # Event streams are turned away instead of taking the probe
+    assert events.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert read.status_code == status.HTTP_200_OK
+    assert download.text == "starteddone"
@@ -0,0 +1,129 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.core.coalescing import SingleFlight
+from app.core.dependencies import get_db
+from app.main import app
+from app.routers import articles as articles_router
+from .conftest import TEACHER_USER_ID
+
+
+async def gather_calls(single_flight, key, func, count):
+    return await asyncio.gather(
+        *(single_flight.do(key, func) for _ in range(count)), return_exceptions=True
+    )
+
+
+def test_identical_calls_share_one_execution():
+    calls = []
+
+    async def query():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b"[]"
+
+    results = asyncio.run(gather_calls(SingleFlight(), "key", query, 10))
+    assert results == [b"[]"] * 10
+    assert len(calls) == 1
+
+
+def test_calls_after_completion_run_again():
+    calls = []
+
+    async def query():
+        calls.append(1)
+        return len(calls)
+
+    async def run():
+        single_flight = SingleFlight()
+        return [await single_flight.do("key", query) for _ in range(2)]
+
+    assert asyncio.run(run()) == [1, 2]
+
+
+def test_errors_propagate_to_every_caller():
+    async def query():
+        await asyncio.sleep(0.01)
+        raise ValueError("broken")
+
+    results = asyncio.run(gather_calls(SingleFlight(), "key", query, 3))
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_wait_is_bounded():
+    async def query():
+        await asyncio.sleep(1)
+
+    async def run():
+        with pytest.raises(HTTPException) as error:
+            await SingleFlight(timeout=0.01).do("key", query)
+        return error.value.status_code
+
+    assert asyncio.run(run()) == 503
+
+
+def test_forgotten_calls_are_not_joined():
+    calls = []
+
+    async def query():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    async def run():
+        single_flight = SingleFlight()
+        first = asyncio.ensure_future(single_flight.do("key", query))
+        await asyncio.sleep(0)
+        single_flight.forget(lambda key: key == "key")
+        second = await single_flight.do("key", query)
+        return await first, second
+
+    assert asyncio.run(run()) == (2, 2)
+    assert len(calls) == 2
+
+
+def test_student_article_lists_are_coalesced(client, db_session, monkeypatch):
+    request_sessions = []
+
+    def override_get_db():
+        with Session(bind=db_session.get_bind()) as session:
+            request_sessions.append(session)
+            yield session
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, override_get_db)
+    render_sessions = []
+    get_students_articles = articles_router.get_students_articles
+
+    def slow_get_students_articles(teacher_id, render_session, *args):
+        render_sessions.append(render_session)
+        # Keeps the call in flight until every request arrived
+        time.sleep(0.1)
+        return get_students_articles(teacher_id, render_session, *args)
+
+    monkeypatch.setattr(
+        articles_router, "get_students_articles", slow_get_students_articles
+    )
+
+    async def run():
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            return await asyncio.gather(
+                *(
+                    client.get(
+                        "/articles/students", headers={"user-id": TEACHER_USER_ID}
+                    )
+                    for _ in range(5)
+                )
+            )
+
+    responses = asyncio.run(run())
+    assert [response.status_code for response in responses] == [200] * 5
+    assert responses[0].json()
+    assert all(response.json() == responses[0].json() for response in responses)
+    assert len(render_sessions) == 1
+    # The shared call does not query with the session of the request that started it
+    assert render_sessions[0] not in request_sessions
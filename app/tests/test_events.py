@@ -0,0 +1,132 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException, status
+
+from app.controllers.articles import get_student_article_events
+from app.controllers.changes import get_compaction_horizon
+from app.core.events import (
+    Broker,
+    Event,
+    broker,
+    event_stream_routes,
+    stream_events,
+)
+from .conftest import TEACHER_USER_ID, STUDENT_USER_ID
+
+
+async def collect(stream, count):
+    return [await stream.__anext__() for _ in range(count)]
+
+
+def test_events_fan_out_to_topic_subscribers():
+    async def scenario():
+        events = Broker()
+        first, second, other = (
+            events.subscribe(4),
+            events.subscribe(4),
+            events.subscribe(5),
+        )
+        events.publish([4], Event(1, "create", {"article_id": 1}))
+        return first.queue.qsize(), second.queue.qsize(), other.queue.qsize()
+
+    assert asyncio.run(scenario()) == (1, 1, 0)
+
+
+def test_slow_subscriber_is_disconnected():
+    async def scenario():
+        events = Broker(queue_size=2)
+        subscription = events.subscribe(4)
+        for event_id in range(1, 4):
+            events.publish([4], Event(event_id, "create", {}))
+        chunks = [chunk async for chunk in stream_events(subscription)]
+        return subscription.closed, chunks, events.has_subscribers()
+
+    assert asyncio.run(scenario()) == (True, [], False)
+
+
+def test_events_published_from_other_threads():
+    async def scenario():
+        events = Broker()
+        subscription = events.subscribe(4)
+        thread = threading.Thread(
+            target=events.publish, args=([4], Event(1, "delete", {}))
+        )
+        thread.start()
+        thread.join()
+        return await asyncio.wait_for(subscription.queue.get(), 1)
+
+    assert asyncio.run(scenario()).type == "delete"
+
+
+def test_stream_replays_skips_duplicates_and_sends_heartbeats():
+    async def scenario():
+        events = Broker()
+        subscription = events.subscribe(4)
+        replay = [Event(1, "create", {}), Event(2, "delete", {})]
+        stream = stream_events(subscription, replay, heartbeat=0.01)
+        events.publish([4], Event(2, "delete", {}))
+        events.publish([4], Event(3, "create", {}))
+        chunks = await collect(stream, 4)
+        await stream.aclose()
+        return chunks, events.has_subscribers()
+
+    chunks, subscribed = asyncio.run(scenario())
+    assert [chunk.split("\n")[0] for chunk in chunks] == [
+        "id: 1",
+        "id: 2",
+        "id: 3",
+        ": heartbeat",
+    ]
+    assert not subscribed
+
+
+def test_student_article_events_reach_their_teacher(client, db_session):
+    async def scenario():
+        subscription = broker.subscribe(int(TEACHER_USER_ID))
+        try:
+            response = await asyncio.to_thread(
+                client.post,
+                "/articles",
+                data={"title": "Pushed Article", "content": "Pushed Content"},
+                headers={"user-id": STUDENT_USER_ID},
+            )
+            event = await asyncio.wait_for(subscription.queue.get(), 1)
+        finally:
+            broker.unsubscribe(subscription)
+        return response.json()["id"], event
+
+    article_id, event = asyncio.run(scenario())
+    assert event.type == "create"
+    assert event.data == {"article_id": article_id, "author_id": int(STUDENT_USER_ID)}
+
+    since = max(event.id - 1, get_compaction_horizon(db_session))
+    replay = get_student_article_events(int(TEACHER_USER_ID), since, db_session)
+    assert replay[0] == event
+
+
+def test_large_replays_are_refused(client, db_session):
+    since = get_compaction_horizon(db_session)
+    response = client.post(
+        "/articles",
+        data={"title": "Missed Article", "content": "Missed Content"},
+        headers={"user-id": STUDENT_USER_ID},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    replay = get_student_article_events(int(TEACHER_USER_ID), since, db_session)
+    assert replay
+
+    with pytest.raises(HTTPException) as error:
+        get_student_article_events(
+            int(TEACHER_USER_ID), since, db_session, limit=len(replay) - 1
+        )
+    assert error.value.status_code == status.HTTP_410_GONE
+
+
+def test_event_stream_routes_are_known_before_routing(client):
+    def scope(path: str) -> dict:
+        return {"type": "http", "method": "GET", "path": path, "root_path": ""}
+
+    assert event_stream_routes.matches(scope("/articles/students/events"))
+    assert not event_stream_routes.matches(scope("/articles/students/1"))
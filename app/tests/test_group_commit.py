@@ -0,0 +1,146 @@
+import asyncio
+from datetime import datetime
+
+import httpx
+import pytest
+from fastapi import status
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.controllers.articles import article_writer
+from app.core import settings
+from app.core.dependencies import get_db
+from app.main import app
+from app.models.articles import Article
+from app.schemas.articles import ArticleSchema
+from .conftest import STUDENT_USER_ID, TEACHER_USER_ID
+
+
+@pytest.fixture
+def statements(client, db_session, monkeypatch):
+    # Concurrent requests must not share the session of the tests
+    def override_get_db():
+        with Session(bind=db_session.get_bind()) as session:
+            yield session
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, override_get_db)
+    monkeypatch.setattr(settings, "ARTICLE_GROUP_COMMIT", True)
+    monkeypatch.setattr(article_writer, "window", 0.05)
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement.split("(")[0].strip())
+
+    def record_commit(conn):
+        executed.append("COMMIT")
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", record)
+    event.listen(engine, "commit", record_commit)
+    yield executed
+    event.remove(engine, "before_cursor_execute", record)
+    event.remove(engine, "commit", record_commit)
+
+
+def post_concurrently(forms: list[dict]) -> list[httpx.Response]:
+    async def run():
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            return await asyncio.gather(
+                *(
+                    client.post("/articles", data=form, headers={"user-id": user_id})
+                    for user_id, form in forms
+                )
+            )
+
+    return asyncio.run(run())
+
+
+def test_concurrent_articles_share_one_commit(statements):
+    forms = [
+        (user_id, {"title": f"Grouped {index}", "content": f"Content {index}"})
+        for index, user_id in enumerate([STUDENT_USER_ID, TEACHER_USER_ID] * 3)
+    ]
+    responses = post_concurrently(forms)
+    assert [response.status_code for response in responses] == [
+        status.HTTP_201_CREATED
+    ] * len(forms)
+    articles = [ArticleSchema(**response.json()) for response in responses]
+    assert [article.title for article in articles] == [
+        form["title"] for _, form in forms
+    ]
+    assert [article.content for article in articles] == [
+        form["content"] for _, form in forms
+    ]
+    assert [article.author.id for article in articles] == [
+        int(user_id) for user_id, _ in forms
+    ]
+    assert len(set(article.id for article in articles)) == len(forms)
+    assert statements.count("COMMIT") == 1
+    assert statements.count("INSERT INTO article_stats") == 1
+
+
+def test_failing_article_only_fails_its_caller(statements):
+    forms = [
+        (STUDENT_USER_ID, {"title": "Fine", "content": "Fine"}),
+        (
+            STUDENT_USER_ID,
+            {"title": "Broken", "content": "Broken", "upload_id": "missing"},
+        ),
+        (TEACHER_USER_ID, {"title": "Also fine", "content": "Also fine"}),
+    ]
+    responses = post_concurrently(forms)
+    assert [response.status_code for response in responses] == [
+        status.HTTP_201_CREATED,
+        status.HTTP_404_NOT_FOUND,
+        status.HTTP_201_CREATED,
+    ]
+    assert responses[1].json()["detail"] == "Upload not found"
+    assert statements.count("COMMIT") == 2
+
+
+def test_batch_failing_at_flush_is_written_one_by_one(statements, monkeypatch):
+    write_batch = article_writer._write
+    failures = []
+
+    def fail_batch_flush(session, flush_context):
+        articles = [item for item in session.new if isinstance(item, Article)]
+        if len(articles) > 1 and not failures:
+            failures.append(len(articles))
+            raise RuntimeError("Flush failed")
+
+    def write(bind, items):
+        try:
+            return write_batch(bind, items)
+        except RuntimeError:
+            # A concurrent writer takes the ids the failed flush handed out
+            with Session(bind=bind) as session:
+                session.add(
+                    Article(
+                        title="Concurrent",
+                        content="Concurrent",
+                        author_id=int(TEACHER_USER_ID),
+                        created_at=datetime.now(),
+                    )
+                )
+                session.commit()
+            raise
+
+    monkeypatch.setattr(article_writer, "_write", write)
+    event.listen(Session, "after_flush", fail_batch_flush)
+    try:
+        forms = [
+            (STUDENT_USER_ID, {"title": f"Retried {index}", "content": "Retried"})
+            for index in range(3)
+        ]
+        responses = post_concurrently(forms)
+    finally:
+        event.remove(Session, "after_flush", fail_batch_flush)
+    assert failures == [3]
+    assert [response.status_code for response in responses] == [
+        status.HTTP_201_CREATED
+    ] * len(forms)
+    articles = [ArticleSchema(**response.json()) for response in responses]
+    assert [article.title for article in articles] == [
+        form["title"] for _, form in forms
+    ]
+    assert len(set(article.id for article in articles)) == len(forms)
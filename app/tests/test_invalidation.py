@@ -0,0 +1,105 @@
+import time
+
+from fastapi import status
+
+from app.core.admission import admission_controller
+from app.core.enums import Role
+from app.core.invalidation import (
+    Invalidation,
+    InvalidationBus,
+    PollingTransport,
+    invalidation_bus,
+    invalidate,
+)
+from app.models.users import Teacher
+from .conftest import STUDENT_USER_ID
+
+
+def recording_bus() -> tuple[InvalidationBus, list]:
+    bus = InvalidationBus()
+    received = []
+    bus.subscribe(
+        "user:",
+        lambda key, version: received.append((key, version)),
+        lambda: received.append("cleared"),
+    )
+    return bus, received
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert condition()
+
+
+def test_invalidations_reach_other_workers(client, db_session):
+    engine = db_session.get_bind()
+    writer, written = recording_bus()
+    reader, received = recording_bus()
+    writer.start(PollingTransport(engine, interval=0.01))
+    reader.start(PollingTransport(engine, interval=0.01))
+    try:
+        # Both listeners have to be polling before anything is published
+        time.sleep(0.05)
+        writer.publish([Invalidation("user:7", 2), Invalidation("articles:7", 1)])
+        assert written == [("user:7", 2)]
+        wait_for(lambda: received == [("user:7", 2)])
+    finally:
+        writer.stop()
+        reader.stop()
+
+
+def test_stale_invalidations_are_ignored():
+    bus, received = recording_bus()
+    bus.apply([Invalidation("user:1", 3)])
+    bus.apply([Invalidation("user:1", 2), Invalidation("user:1", 3)])
+    bus.apply([Invalidation("user:1", 4)])
+    assert received == [("user:1", 3), ("user:1", 4)]
+
+    bus.reset()
+    bus.apply([Invalidation("user:1", 4)])
+    assert received == [("user:1", 3), ("user:1", 4), "cleared", ("user:1", 4)]
+
+
+def test_writes_publish_after_commit(client, db_session, monkeypatch):
+    published = []
+    publish = invalidation_bus.publish
+
+    def recording_publish(invalidations):
+        invalidations = list(invalidations)
+        published.extend(invalidations)
+        publish(invalidations)
+
+    monkeypatch.setattr(invalidation_bus, "publish", recording_publish)
+
+    # Reading begins the transaction the invalidation belongs to
+    teacher = db_session.query(Teacher).filter(Teacher.id == 1).one()
+    invalidate(db_session, "user:1", 1)
+    db_session.rollback()
+    assert published == []
+
+    admission_controller.remember_role(STUDENT_USER_ID, Role.student)
+    teacher.first_name = "Renamed"
+    db_session.flush()
+    assert published == []
+    db_session.commit()
+    # The teacher and the students listing the teacher in their profile
+    assert sorted(invalidation.key for invalidation in published) == [
+        f"user:{STUDENT_USER_ID}",
+        f"user:{teacher.user_id}",
+    ]
+    assert admission_controller.role_of(STUDENT_USER_ID) is None
+    teacher.first_name = "Test"
+    db_session.commit()
+
+    published.clear()
+    response = client.post(
+        "/articles",
+        data={"title": "Invalidating", "content": "Invalidating"},
+        headers={"user-id": STUDENT_USER_ID},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    assert [invalidation.key for invalidation in published] == [
+        f"articles:author:{STUDENT_USER_ID}"
+    ]
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+from app.core.enums import JobStatus
+from app.core.jobs import job, enqueue
+from app.models.jobs import Job
+
+calls = []
+
+
+@job("test_record")
+def record(db_session, value):
+    calls.append(value)
+
+
+@job("test_fail")
+def fail(db_session):
+    raise RuntimeError("boom")
+
+
+def test_run_job(db_session, job_worker):
+    enqueue(db_session, "test_record", value=1)
+    db_session.commit()
+
+    assert job_worker.run_once() == 1
+    assert calls == [1]
+    assert db_session.query(Job).filter(Job.name == "test_record").count() == 0
+
+
+def test_uncommitted_job_is_not_run(db_session, job_worker):
+    enqueue(db_session, "test_record", value=2)
+    db_session.rollback()
+
+    assert job_worker.run_once() == 0
+
+
+def test_failed_job_is_retried_with_backoff(db_session, job_worker):
+    failing_job = enqueue(db_session, "test_fail")
+    failing_job.max_attempts = 2
+    db_session.commit()
+
+    assert job_worker.run_once() == 1
+    db_session.refresh(failing_job)
+    assert failing_job.status == JobStatus.pending
+    assert failing_job.attempts == 1
+    assert failing_job.run_at > datetime.now()
+    assert "boom" in failing_job.last_error
+    assert job_worker.run_once() == 0
+
+    failing_job.run_at = datetime.now()
+    db_session.commit()
+    assert job_worker.run_once() == 1
+    db_session.refresh(failing_job)
+    assert failing_job.status == JobStatus.failed
+    assert failing_job.attempts == 2
+
+
+def test_job_is_reclaimed_after_visibility_timeout(db_session, job_worker):
+    stuck_job = enqueue(db_session, "test_record", value=3)
+    stuck_job.status = JobStatus.running
+    stuck_job.locked_until = datetime.now() + timedelta(minutes=5)
+    db_session.commit()
+    assert job_worker.run_once() == 0
+
+    stuck_job.locked_until = datetime.now() - timedelta(seconds=1)
+    db_session.commit()
+    assert job_worker.run_once() == 1
+    assert calls[-1] == 3
+
+
+def test_missing_job_is_skipped(db_session, job_worker):
+    job_worker.run_job(999999)
+    assert db_session.get(Job, 999999) is None
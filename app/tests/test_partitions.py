@@ -0,0 +1,87 @@
+import argparse
+from datetime import date, datetime
+
+from sqlalchemy import create_engine, event, inspect, select, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app import manage
+from app.controllers.stats import rebuild_article_stats
+from app.core import partitions
+from app.core.db import Base
+from app.core.partitions import (
+    add_months,
+    partition_name,
+    partition_month,
+    partition_ddl,
+)
+from app.models.articles import Article, ArticleBody, ArticleStat
+
+
+def test_add_months_wraps_years():
+    assert add_months(date(2023, 11, 1), 3) == date(2024, 2, 1)
+    assert add_months(date(2023, 1, 1), -1) == date(2022, 12, 1)
+
+
+def test_partition_name_roundtrip():
+    assert partition_name(date(2023, 2, 1)) == "articles_p202302"
+    assert partition_month("articles_p202302") == date(2023, 2, 1)
+    assert partition_month("articles_default") is None
+
+
+def test_partition_ddl_covers_one_month():
+    assert partition_ddl(date(2023, 12, 1)) == (
+        "CREATE TABLE IF NOT EXISTS articles_p202312 PARTITION OF articles "
+        "FOR VALUES FROM ('2023-12-01') TO ('2024-01-01')"
+    )
+
+
+def test_dropped_partitions_leave_the_stats(monkeypatch):
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with Session(engine) as db_session:
+        for author_id, created_at in [
+            (1, datetime(2023, 1, 10, 9)),
+            (1, datetime(2023, 1, 10, 17)),
+            (2, datetime(2023, 1, 20, 12)),
+            (1, datetime(2023, 2, 3, 8)),
+        ]:
+            article = Article(
+                title="Partitioned", author_id=author_id, created_at=created_at
+            )
+            article.content = "Partitioned content"
+            db_session.add(article)
+        db_session.commit()
+        rebuild_article_stats(db_session)
+
+    # SQLite has no partitions, January is moved to a table of its own instead
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE TABLE articles_p202301 AS SELECT * FROM articles "
+                "WHERE created_at < '2023-02-01'"
+            )
+        )
+        connection.execute(text("DELETE FROM articles WHERE created_at < '2023-02-01'"))
+
+    def skip_detach(conn, cursor, statement, parameters, context, executemany):
+        if "DETACH PARTITION" in statement:
+            return "SELECT 1", ()
+        return statement, parameters
+
+    event.listen(engine, "before_cursor_execute", skip_detach, retval=True)
+    monkeypatch.setattr(
+        partitions, "list_article_partitions", lambda connection: ["articles_p202301"]
+    )
+    monkeypatch.setattr(manage, "engine", engine)
+    manage.archive_articles(argparse.Namespace(before=date(2023, 2, 1), drop=True))
+
+    assert not inspect(engine).has_table("articles_p202301")
+    with Session(engine) as db_session:
+        stats = db_session.execute(
+            select(ArticleStat.author_id, ArticleStat.day, ArticleStat.count)
+        ).all()
+        assert stats == [(1, date(2023, 2, 3), 1)]
+        assert len(db_session.scalars(select(ArticleBody.article_id)).all()) == 1
+        assert rebuild_article_stats(db_session) == len(stats)
+    engine.dispose()
@@ -0,0 +1,73 @@
+import pstats
+from datetime import datetime
+
+import pytest
+from fastapi import status
+
+from app.core.profiling import request_profiler, ProfileStore, Capture
+from app.schemas.profiles import ProfileCaptureSchema
+from .conftest import ADMIN_USER_ID, STUDENT_USER_ID
+
+
+@pytest.fixture
+def profile_store(tmp_path, monkeypatch):
+    store = ProfileStore(str(tmp_path), max_captures=3)
+    monkeypatch.setattr(request_profiler, "token", "secret")
+    monkeypatch.setattr(request_profiler, "store", store)
+    return store
+
+
+def test_request_with_profile_token_is_captured(client, profile_store, tmp_path):
+    headers = {"user-id": STUDENT_USER_ID, "x-profile": "secret"}
+    response = client.get("/articles/own", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    capture_id = response.headers["x-profile-id"]
+
+    response = client.get("/profiles", headers={"user-id": ADMIN_USER_ID})
+    assert response.status_code == status.HTTP_200_OK
+    captures = [ProfileCaptureSchema(**capture) for capture in response.json()]
+    assert [capture.id for capture in captures] == [capture_id]
+    capture = captures[0]
+    assert capture.path == "/articles/own"
+    assert capture.status_code == status.HTTP_200_OK
+    assert capture.sql_queries > 0
+    for phase in ("dependencies", "get_current_user", "endpoint", "serialization"):
+        assert phase in capture.phases
+    assert capture.phases["get_current_user"] <= capture.phases["dependencies"]
+
+    response = client.get(f"/profiles/{capture_id}", headers={"user-id": ADMIN_USER_ID})
+    assert response.status_code == status.HTTP_200_OK
+    if capture.format == "pstats":
+        path = tmp_path / "downloaded.prof"
+        path.write_bytes(response.content)
+        assert pstats.Stats(str(path)).total_calls > 0
+
+
+def test_request_without_profile_token_is_not_captured(client, profile_store):
+    for token in (None, "wrong"):
+        headers = {"user-id": STUDENT_USER_ID}
+        if token:
+            headers["x-profile"] = token
+        response = client.get("/articles/own", headers=headers)
+        assert "x-profile-id" not in response.headers
+    assert profile_store.list() == []
+
+
+def test_profile_store_keeps_most_recent_captures(profile_store):
+    for second in range(5):
+        capture = Capture(
+            id=f"20240101T0000{second:02d}-0000000{second}",
+            method="GET",
+            path="/articles",
+            started_at=datetime.now(),
+        )
+        profile_store.save(capture, lambda path: open(path, "w").close())
+    ids = [capture.id for capture in profile_store.list()]
+    assert ids == [f"20240101T0000{second:02d}-0000000{second}" for second in (4, 3, 2)]
+
+
+def test_profiles_require_admin(client, profile_store):
+    response = client.get("/profiles", headers={"user-id": STUDENT_USER_ID})
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    response = client.get("/profiles/not-a-capture", headers={"user-id": ADMIN_USER_ID})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
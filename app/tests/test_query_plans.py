@@ -0,0 +1,133 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from app.controllers.articles import (
+    get_article_by_id,
+    get_articles_by_author_id,
+    get_students_articles,
+    get_student_article_by_id,
+    get_own_article_by_id,
+    get_visible_articles_by_ids,
+    get_all_articles,
+    get_article_changes,
+)
+from app.controllers.changes import get_compaction_horizon
+from app.controllers.stats import get_author_stats, get_teacher_stats
+from app.controllers.users import get_user_by_id, get_users_by_role
+from app.core.enums import Role
+from app.core.jobs import claim_jobs
+from .conftest import engine
+
+TEACHER_ID = 4
+STUDENT_ID = 2
+
+
+@contextmanager
+def captured_statements():
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+
+def explain(db_session, statement, parameters) -> list[str]:
+    connection = db_session.connection()
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+    return [row[-1] for row in rows]
+
+
+def full_scans(plan: list[str]) -> set[str]:
+    # "SCAN <table>" reads every row, "SEARCH" and "SCAN ... USING INDEX" do not
+    return {
+        step.split()[1]
+        for step in plan
+        if step.startswith("SCAN ") and "USING" not in step
+    }
+
+
+def user(db_session, user_id):
+    return get_user_by_id(user_id, db_session)
+
+
+def load_profile(db_session, user_id):
+    teacher = get_user_by_id(user_id, db_session)
+    db_session.expire_all()
+    return teacher.profile.students
+
+
+QUERIES = {
+    # name: (callable, tables allowed to be fully scanned, index expected in plans)
+    "get_article_by_id": (lambda s: get_article_by_id(1, s), set(), None),
+    "get_articles_by_author_id": (
+        lambda s: get_articles_by_author_id(TEACHER_ID, s),
+        set(),
+        "ix_articles_author_id_created_at",
+    ),
+    "get_students_articles": (
+        lambda s: get_students_articles(TEACHER_ID, s),
+        set(),
+        "ix_teachers_user_id",
+    ),
+    "get_student_article_by_id": (
+        lambda s: get_student_article_by_id(TEACHER_ID, 1, s),
+        set(),
+        None,
+    ),
+    "get_own_article_by_id": (
+        lambda s: get_own_article_by_id(3, user(s, TEACHER_ID), s),
+        set(),
+        None,
+    ),
+    "get_visible_articles_by_ids": (
+        lambda s: get_visible_articles_by_ids([1, 2, 3], user(s, TEACHER_ID), s),
+        set(),
+        "ix_teachers_user_id",
+    ),
+    "get_article_changes": (
+        lambda s: get_article_changes(
+            get_compaction_horizon(s), 100, user(s, STUDENT_ID), s
+        ),
+        set(),
+        None,
+    ),
+    "get_all_articles": (lambda s: get_all_articles(s), {"articles"}, None),
+    "get_user_by_id": (lambda s: get_user_by_id(STUDENT_ID, s), set(), None),
+    "get_users_by_role": (
+        lambda s: get_users_by_role(Role.student, s),
+        set(),
+        "ix_users_role",
+    ),
+    "profile_relationships": (
+        lambda s: load_profile(s, TEACHER_ID),
+        set(),
+        "ix_teacher_student_teacher_id_student_id",
+    ),
+    "get_author_stats": (lambda s: get_author_stats(s), {"article_stats"}, None),
+    "get_teacher_stats": (lambda s: get_teacher_stats(s), {"article_stats"}, None),
+    "claim_jobs": (lambda s: claim_jobs(s, 1, 60), set(), "ix_jobs_status_run_at"),
+}
+
+
+@pytest.mark.parametrize("name", QUERIES)
+def test_query_plan(client, db_session, name):
+    query, allowed_scans, expected_index = QUERIES[name]
+    db_session.expire_all()
+    with captured_statements() as statements:
+        query(db_session)
+    assert statements
+
+    plans = [explain(db_session, *captured) for captured in statements]
+    for (statement, _), plan in zip(statements, plans):
+        unexpected = full_scans(plan) - allowed_scans
+        assert not unexpected, f"Full scan of {unexpected} in:\n{statement}\n{plan}"
+    if expected_index:
+        assert any(expected_index in step for plan in plans for step in plan), plans
@@ -0,0 +1,172 @@
+from datetime import datetime
+
+import pytest
+from fastapi import status
+from sqlalchemy import event, select
+
+from app.controllers.articles import NewArticle, insert_articles
+from app.core import sharding
+from app.core.sharding import (
+    ShardRouter,
+    jump_hash,
+    merge_ordered,
+    reshard_articles,
+    close_shard_sessions,
+)
+from app.models.articles import Article, ArticleBody
+from app.models.users import User
+from app.schemas.articles import ArticleSchema
+from .conftest import ADMIN_USER_ID, TEACHER_USER_ID, STUDENT_USER_ID
+
+
+def shard_urls(path, count):
+    return [f"sqlite:///{path}/shard{index}.db" for index in range(count)]
+
+
+def stored_article_ids(router, shard):
+    with router.session_factories[shard]() as shard_session:
+        return set(shard_session.scalars(select(Article.id)))
+
+
+@pytest.fixture
+def sharded(tmp_path, monkeypatch, db_session):
+    router = ShardRouter(shard_urls(tmp_path, 3))
+    router.create_tables()
+    monkeypatch.setattr(sharding, "shard_router", router)
+    yield router
+    close_shard_sessions(db_session)
+    router.dispose()
+
+
+def test_jump_hash_moves_keys_only_to_new_shard():
+    before = [jump_hash(key, 3) for key in range(1000)]
+    after = [jump_hash(key, 4) for key in range(1000)]
+    assert set(before) == {0, 1, 2}
+    for old, new in zip(before, after):
+        assert new in (old, 3)
+    assert 150 < after.count(3) < 350
+
+
+def test_merge_ordered_pages_across_results():
+    results = [[1, 4, 7], [2, 5], [3, 6, 8]]
+    assert merge_ordered(results, lambda item: item) == list(range(1, 9))
+    assert merge_ordered(results, lambda item: item, offset=2, limit=3) == [3, 4, 5]
+
+
+def test_sharded_articles_follow_their_author(client, sharded):
+    created = {}
+    for user_id in (STUDENT_USER_ID, TEACHER_USER_ID):
+        response = client.post(
+            "/articles",
+            data={"title": f"Sharded {user_id}", "content": "Sharded content"},
+            headers={"user-id": user_id},
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        created[int(user_id)] = response.json()["id"]
+    assert len(set(created.values())) == 2
+
+    for author_id, article_id in created.items():
+        assert article_id in stored_article_ids(sharded, sharded.shard_of(author_id))
+
+    headers = {"user-id": STUDENT_USER_ID}
+    response = client.get("/articles/own", headers=headers)
+    assert [article["id"] for article in response.json()] == [
+        created[int(STUDENT_USER_ID)]
+    ]
+    response = client.get(
+        f"/articles/own/{created[int(STUDENT_USER_ID)]}", headers=headers
+    )
+    assert ArticleSchema(**response.json()).author.id == int(STUDENT_USER_ID)
+
+    response = client.get("/articles/students", headers={"user-id": TEACHER_USER_ID})
+    assert [article["id"] for article in response.json()] == [
+        created[int(STUDENT_USER_ID)]
+    ]
+
+    headers = {"user-id": ADMIN_USER_ID}
+    response = client.get("/articles", headers=headers)
+    ordered = [created[int(STUDENT_USER_ID)], created[int(TEACHER_USER_ID)]]
+    assert [article["id"] for article in response.json()] == ordered
+    response = client.get(
+        "/articles", params={"limit": 1, "offset": 1}, headers=headers
+    )
+    assert [article["id"] for article in response.json()] == ordered[1:]
+
+    response = client.delete(f"/articles/{ordered[0]}", headers=headers)
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    shard = sharded.shard_of(int(STUDENT_USER_ID))
+    assert ordered[0] not in stored_article_ids(sharded, shard)
+
+
+def test_sharded_batches_take_their_ids_in_one_statement(sharded, db_session):
+    statements = []
+
+    def record_ticket_statements(conn, cursor, statement, *args):
+        if "article_id_tickets" in statement:
+            statements.append(statement)
+
+    authors = [
+        db_session.get(User, int(user_id))
+        for user_id in (STUDENT_USER_ID, TEACHER_USER_ID, ADMIN_USER_ID)
+    ]
+    new_articles = [
+        NewArticle(
+            Article(
+                title=f"Batched {author.id}",
+                content="Batched content",
+                author_id=author.id,
+                created_at=datetime.now(),
+            ),
+            author,
+        )
+        for author in authors
+    ]
+    bind = db_session.get_bind()
+    event.listen(bind, "before_cursor_execute", record_ticket_statements)
+    try:
+        articles = insert_articles(new_articles, db_session)
+    finally:
+        event.remove(bind, "before_cursor_execute", record_ticket_statements)
+
+    assert len(statements) == 1
+    assert len({article.id for article in articles}) == len(authors)
+    for article in articles:
+        shard = sharded.shard_of(article.author_id)
+        assert article.id in stored_article_ids(sharded, shard)
+
+
+def test_reshard_moves_articles_to_new_layout(tmp_path, db_session):
+    old_router = ShardRouter(shard_urls(tmp_path, 2))
+    new_router = ShardRouter(shard_urls(tmp_path, 3))
+    new_router.create_tables()
+    author_ids = range(1, 21)
+    for author_id in author_ids:
+        with old_router.session_factories[old_router.shard_of(author_id)]() as s:
+            article = Article(
+                id=author_id,
+                title=f"Article {author_id}",
+                author_id=author_id,
+                created_at=datetime.now(),
+            )
+            article.content = f"Content {author_id}"
+            s.add(article)
+            s.commit()
+
+    moved = reshard_articles(old_router.engines, new_router, db_session, batch_size=3)
+
+    assert moved == sum(
+        new_router.shard_of(author_id) != old_router.shard_of(author_id)
+        for author_id in author_ids
+    )
+    for shard in range(new_router.shard_count):
+        expected = {
+            author_id
+            for author_id in author_ids
+            if new_router.shard_of(author_id) == shard
+        }
+        assert stored_article_ids(new_router, shard) == expected
+        with new_router.session_factories[shard]() as shard_session:
+            bodies = shard_session.scalars(select(ArticleBody.article_id))
+            assert set(bodies) == expected
+    old_router.dispose()
+    new_router.dispose()
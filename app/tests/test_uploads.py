@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException, status
+from sqlalchemy import create_engine, text
+
+from app.controllers.uploads import expire_uploads, write_upload_chunk
+from app.core.db import Base, add_missing_columns
+from app.core.enums import UploadStatus
+from app.core.storage import LocalStorage
+from app.models.uploads import Upload
+from app.schemas.articles import ArticleSchema
+from app.schemas.uploads import UploadSchema
+from .conftest import STUDENT_USER_ID, TEACHER_USER_ID
+
+DATA = os.urandom(3000)
+
+
+def start_upload(client, user_id, data=DATA, sha256=None):
+    response = client.post(
+        "/uploads",
+        json={
+            "filename": "cover.png",
+            "content_type": "image/png",
+            "size": len(data),
+            "sha256": sha256 or hashlib.sha256(data).hexdigest(),
+        },
+        headers={"user-id": user_id},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    return UploadSchema(**response.json())
+
+
+def put_chunk(client, upload_id, offset, chunk, user_id=STUDENT_USER_ID):
+    return client.put(
+        f"/uploads/{upload_id}",
+        content=chunk,
+        headers={
+            "user-id": user_id,
+            "upload-offset": str(offset),
+            "content-type": "application/octet-stream",
+        },
+    )
+
+
+def test_resumable_upload_is_attached_to_article(client):
+    headers = {"user-id": STUDENT_USER_ID}
+    upload = start_upload(client, STUDENT_USER_ID)
+    assert upload.offset == 0
+
+    response = put_chunk(client, upload.id, 0, DATA[:1000])
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["upload-offset"] == "1000"
+
+    response = put_chunk(client, upload.id, 0, DATA[:1000])
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+    response = client.get(f"/uploads/{upload.id}", headers=headers)
+    offset = UploadSchema(**response.json()).offset
+    response = put_chunk(client, upload.id, offset, DATA[offset:])
+    assert UploadSchema(**response.json()).offset == len(DATA)
+
+    response = client.post(f"/uploads/{upload.id}/complete", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert UploadSchema(**response.json()).status == UploadStatus.completed
+
+    response = client.post(
+        "/articles",
+        data={"title": "Uploaded", "content": "Uploaded", "upload_id": upload.id},
+        headers=headers,
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    article = ArticleSchema(**response.json())
+    path = article.cover_image.decode()
+    with open(path, "rb") as f:
+        assert f.read() == DATA
+    os.remove(path)
+
+    response = client.get(f"/uploads/{upload.id}", headers=headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_upload_with_wrong_checksum_restarts(client):
+    headers = {"user-id": STUDENT_USER_ID}
+    upload = start_upload(client, STUDENT_USER_ID, sha256="0" * 64)
+    response = client.post(f"/uploads/{upload.id}/complete", headers=headers)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    put_chunk(client, upload.id, 0, DATA)
+    response = client.post(f"/uploads/{upload.id}/complete", headers=headers)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    response = client.get(f"/uploads/{upload.id}", headers=headers)
+    assert UploadSchema(**response.json()).offset == 0
+
+
+def test_upload_rejects_data_beyond_declared_size(client):
+    upload = start_upload(client, STUDENT_USER_ID)
+    response = put_chunk(client, upload.id, 0, DATA + b"extra")
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+
+def test_interrupted_chunk_keeps_streamed_data(client, db_session):
+    upload = start_upload(client, STUDENT_USER_ID)
+
+    async def interrupted():
+        yield DATA[:500]
+        yield DATA[500:800]
+        raise ConnectionResetError
+
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(
+            write_upload_chunk(
+                db_session.get(Upload, upload.id), 0, interrupted(), db_session
+            )
+        )
+    response = client.get(f"/uploads/{upload.id}", headers={"user-id": STUDENT_USER_ID})
+    offset = UploadSchema(**response.json()).offset
+    assert offset == 800
+    response = put_chunk(client, upload.id, offset, DATA[offset:])
+    assert UploadSchema(**response.json()).offset == len(DATA)
+    with open(LocalStorage().partial_path(upload.id), "rb") as f:
+        assert f.read() == DATA
+
+
+def test_chunks_at_one_offset_are_written_once(client, db_session):
+    upload = start_upload(client, STUDENT_USER_ID)
+
+    async def run():
+        paused, resume = asyncio.Event(), asyncio.Event()
+
+        async def first_chunk():
+            yield DATA[:500]
+            paused.set()
+            await resume.wait()
+            yield DATA[500:1000]
+
+        async def second_chunk():
+            yield b"x" * 1000
+
+        first = asyncio.ensure_future(
+            write_upload_chunk(
+                db_session.get(Upload, upload.id), 0, first_chunk(), db_session
+            )
+        )
+        await paused.wait()
+        with pytest.raises(HTTPException) as error:
+            await write_upload_chunk(
+                db_session.get(Upload, upload.id), 0, second_chunk(), db_session
+            )
+        resume.set()
+        await first
+        return error.value.status_code
+
+    assert asyncio.run(run()) == status.HTTP_409_CONFLICT
+    response = client.get(f"/uploads/{upload.id}", headers={"user-id": STUDENT_USER_ID})
+    assert UploadSchema(**response.json()).offset == 1000
+    with open(LocalStorage().partial_path(upload.id), "rb") as f:
+        assert f.read() == DATA[:1000]
+
+
+def test_missing_columns_are_added_to_existing_tables():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        # A database created before chunks were claimed
+        connection.execute(text("ALTER TABLE uploads DROP COLUMN chunk_claimed_at"))
+        assert add_missing_columns(connection) == ["uploads.chunk_claimed_at"]
+        assert add_missing_columns(connection) == []
+    engine.dispose()
+
+
+def test_uploads_are_private(client):
+    upload = start_upload(client, STUDENT_USER_ID)
+    response = put_chunk(client, upload.id, 0, DATA, user_id=TEACHER_USER_ID)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_expire_abandoned_uploads(client, db_session):
+    upload = start_upload(client, STUDENT_USER_ID)
+    put_chunk(client, upload.id, 0, DATA[:10])
+    storage = LocalStorage()
+    assert os.path.exists(storage.partial_path(upload.id))
+
+    removed = expire_uploads(db_session, datetime.now() + timedelta(days=30))
+    db_session.commit()
+    assert removed >= 1
+    assert db_session.get(Upload, upload.id) is None
+    assert not os.path.exists(storage.partial_path(upload.id))
@@ -1,5 +1,13 @@
+import json
+
 from fastapi import status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
 
+from app.core.db import Base, add_missing_columns
+from app.core.serialization import render_json
+from app.models.users import User
 from app.schemas.users import UserSchema, StudentBaseSchema
 from .conftest import ADMIN_USER_ID, TEACHER_USER_ID
 
@@ -142,3 +150,42 @@ def test_fetch_associated_students(client):
     students = [StudentBaseSchema(**student) for student in response.json()]
     assert len(students) > 0
     assert students[0].last_name == "Student1"
+
+
+def test_profile_is_validated_against_the_role_only(client):
+    user_data = {
+        "email": "wrongprofile@test.com",
+        "password": "password1",
+        "role": "admin",
+        "profile": {"first_name": "New", "last_name": "Teacher", "degree": "PhD"},
+    }
+    response = client.post("/users", json=user_data)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert [error["loc"] for error in response.json()["detail"]] == [
+        ["body", "profile", "full_name"]
+    ]
+
+
+def test_user_serializer_matches_response_model(client, db_session):
+    user = db_session.get(User, int(TEACHER_USER_ID))
+    expected = jsonable_encoder(UserSchema.from_orm(user))
+    assert json.loads(render_json(UserSchema, user)) == expected
+    assert json.loads(render_json(list[UserSchema], [user])) == [expected]
+
+
+def test_profile_versions_are_added_to_existing_users():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        # A database created before users had a profile version
+        connection.execute(text("ALTER TABLE users DROP COLUMN profile_version"))
+        connection.execute(
+            text(
+                "INSERT INTO users (id, email, hashed_password, role) "
+                "VALUES (1, 'old@test.com', 'hashed', 'student')"
+            )
+        )
+        assert add_missing_columns(connection) == ["users.profile_version"]
+    with Session(bind=engine) as db_session:
+        assert db_session.get(User, 1).profile_version == 1
+    engine.dispose()